@@ -2,11 +2,13 @@
 
 from __future__ import print_function
 import os
+from contextlib import contextmanager
 from time import time
+import tracemalloc
 from typing import Type, List, Optional, Iterable
 
 from django.db import connections, router, transaction
-from django.db.models import Max, F, Model
+from django.db.models import Max, F, Model, Q
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
 import numpy as np
@@ -15,6 +17,9 @@ from tqdm import tqdm
 
 from .models import (
     TreePlace,
+    TreeCoveringPlace,
+    TreePartialPlace,
+    TreeNarrowPlace,
     MPTTPlace,
     TreebeardMPPlace,
     TreebeardNSPlace,
@@ -28,6 +33,7 @@ from .utils import prefix_unit, SkipTest
 DISK_USAGE = 'Disk usage (bytes)'
 READ_LATENCY = 'Read latency (s)'
 WRITE_LATENCY = 'Write latency (s)'
+MEMORY_USAGE = 'Memory usage (bytes)'
 
 BYTES_FORMATTER = FuncFormatter(lambda v, pos: prefix_unit(v, 'B', -3))
 SECONDS_FORMATTER = FuncFormatter(lambda v, pos: prefix_unit(v, 's'))
@@ -36,6 +42,10 @@ SECONDS_FORMATTER = FuncFormatter(lambda v, pos: prefix_unit(v, 's'))
 # 3905 nodes. Its length also fixes the tree depth used for every `--max-objects`.
 DEFAULT_SIBLINGS_PER_LEVEL = (5, 5, 5, 5, 5)
 
+# django-tree, measured with each index layout (see `TreeCoveringPlace`,
+# `TreePartialPlace` and `TreeNarrowPlace`).
+TREE_MODELS = (TreePlace, TreeCoveringPlace, TreePartialPlace, TreeNarrowPlace)
+
 # The five original implementations, which all expose the classic instance API
 # (get_children()/get_descendants() querysets, get_previous_sibling()/get_next_sibling()).
 # django-treenode (lists, no sibling navigation) and django-tree-queries (no sibling
@@ -43,7 +53,7 @@ DEFAULT_SIBLINGS_PER_LEVEL = (5, 5, 5, 5, 5)
 # individually.
 CLASSIC_API_MODELS = (
     MPTTPlace,
-    TreePlace,
+    *TREE_MODELS,
     TreebeardALPlace,
     TreebeardMPPlace,
     TreebeardNSPlace,
@@ -155,6 +165,9 @@ class Benchmark:
     models = {
         MPTTPlace: 'MPTT',
         TreePlace: 'tree',
+        TreeCoveringPlace: 'tree (covering)',
+        TreePartialPlace: 'tree (partial)',
+        TreeNarrowPlace: 'tree (narrow)',
         TreebeardALPlace: 'treebeard AL',
         TreebeardMPPlace: 'treebeard MP',
         TreebeardNSPlace: 'treebeard NS',
@@ -164,6 +177,7 @@ class Benchmark:
     tests = {}
     ticks_formatters = {
         DISK_USAGE: BYTES_FORMATTER,
+        MEMORY_USAGE: BYTES_FORMATTER,
         READ_LATENCY: SECONDS_FORMATTER,
         WRITE_LATENCY: SECONDS_FORMATTER,
     }
@@ -223,7 +237,7 @@ class Benchmark:
     def populate_database(self, model, level=1, parents=(None,)):
         n_siblings = self.siblings_per_level[level - 1]
         for parent in parents:
-            if model in (TreePlace, TreebeardALPlace, TreeQueriesPlace):
+            if model in (*TREE_MODELS, TreebeardALPlace, TreeQueriesPlace):
                 bulk = [model(parent=parent) for _ in range(n_siblings)]
                 model.objects.bulk_create(bulk)
                 objects = model.objects.filter(parent=parent)
@@ -333,7 +347,7 @@ class Benchmark:
                 qs = qs.exclude(pk__in=descendants)
             if model is MPTTPlace:
                 qs = qs.filter(level=1)
-            elif model is TreePlace:
+            elif model in TREE_MODELS:
                 # `path__level` is a PostgreSQL-only filter; off PostgreSQL a
                 # level-2 node is equivalently a child of a root (its parent has
                 # no parent). Untimed selection, so this does not affect results.
@@ -459,7 +473,7 @@ class Benchmark:
             connection = connections[db_alias]
 
             for model in sorted(self.models, key=lambda m: m.__name__):
-                if self.run_django_tree_only and model is not TreePlace:
+                if self.run_django_tree_only and model not in TREE_MODELS:
                     continue
                 print('-' * 50)
                 print('%s on %s' % (self.models[model], connection.vendor))
@@ -502,7 +516,7 @@ class Benchmark:
         csv_path = os.path.join(self.results_path, 'data.csv.gz')
         if self.run_django_tree_only:
             df = pd.read_csv(csv_path)
-            df = df[df['Implementation'] != self.models[TreePlace]]
+            df = df[~df['Implementation'].isin([self.models[m] for m in TREE_MODELS])]
             df = pd.concat([df, pd.DataFrame(self.data)], ignore_index=True)
         else:
             df = pd.DataFrame(self.data)
@@ -752,7 +766,7 @@ class TestGetChildrenLeaf(GetLeafMixin, BenchmarkTest):
 
 
 @Benchmark.register_test(
-    'Get children count [root]', (MPTTPlace, TreePlace, TreeQueriesPlace)
+    'Get children count [root]', (MPTTPlace, *TREE_MODELS, TreeQueriesPlace)
 )
 class TestGetChildrenCountRoot(GetRootMixin, BenchmarkTest):
     def run(self):
@@ -769,7 +783,7 @@ class TestGetChildrenCountRoot(GetRootMixin, BenchmarkTest):
 
 
 @Benchmark.register_test(
-    'Get children count [branch]', (MPTTPlace, TreePlace, TreeQueriesPlace)
+    'Get children count [branch]', (MPTTPlace, *TREE_MODELS, TreeQueriesPlace)
 )
 class TestGetChildrenCountBranch(GetBranchMixin, BenchmarkTest):
     def run(self):
@@ -786,7 +800,7 @@ class TestGetChildrenCountBranch(GetBranchMixin, BenchmarkTest):
 
 
 @Benchmark.register_test(
-    'Get children count [leaf]', (MPTTPlace, TreePlace, TreeQueriesPlace)
+    'Get children count [leaf]', (MPTTPlace, *TREE_MODELS, TreeQueriesPlace)
 )
 class TestGetChildrenCountLeaf(GetLeafMixin, BenchmarkTest):
     def run(self):
@@ -897,7 +911,7 @@ class TestGetDescendantsLeaf(GetLeafMixin, BenchmarkTest):
         list(self.leaf.get_descendants())
 
 
-@Benchmark.register_test('Get descendants from queryset', (MPTTPlace, TreePlace))
+@Benchmark.register_test('Get descendants from queryset', (MPTTPlace, *TREE_MODELS))
 class TestGetDescendantsFromQuerySet(BenchmarkTest):
     def setup(self):
         self.qs = self.model._default_manager.annotate(n=F('pk') % 5).filter(n=0)
@@ -927,12 +941,54 @@ class TestGetDescendantsFromQuerySet(BenchmarkTest):
         _bfs_descendants(self.qs)
 
 
+#
+# Descendant names
+#
+
+
+def _descendant_names(model, node):
+    """The names of every descendant of ``node``: a listing of one display column.
+
+    On django-tree this reads only the path and ``name``, which the covering
+    ``PathField.get_indexes(..., include=['name'])`` index of `TreeCoveringPlace`
+    holds, so PostgreSQL answers it with an index-only scan there.
+    """
+    if model is TreeNodePlace:
+        descendants = node.get_descendants_queryset()
+    else:
+        descendants = node.get_descendants()
+    if isinstance(descendants, list):
+        # treebeard AL returns a list rather than a queryset.
+        return [descendant.name for descendant in descendants]
+    return list(descendants.values_list('name', flat=True))
+
+
+@Benchmark.register_test('Get descendants names [root]')
+class TestGetDescendantsNamesRoot(GetRootMixin, BenchmarkTest):
+    def run(self):
+        _descendant_names(self.model, self.root)
+
+
+@Benchmark.register_test('Get descendants names [branch]')
+class TestGetDescendantsNamesBranch(GetBranchMixin, BenchmarkTest):
+    def run(self):
+        _descendant_names(self.model, self.branch)
+
+
+@Benchmark.register_test('Get descendants names [leaf]')
+class TestGetDescendantsNamesLeaf(GetLeafMixin, BenchmarkTest):
+    def run(self):
+        _descendant_names(self.model, self.leaf)
+
+
 #
 # Descendants count
 #
 
 
-@Benchmark.register_test('Get descendants count [root]', (TreePlace, TreeQueriesPlace))
+@Benchmark.register_test(
+    'Get descendants count [root]', (*TREE_MODELS, TreeQueriesPlace)
+)
 class TestGetDescendantsCountRoot(GetRootMixin, BenchmarkTest):
     def run(self):
         self.root.get_descendants().count()
@@ -954,7 +1010,7 @@ class TestGetDescendantsCountRoot(GetRootMixin, BenchmarkTest):
 
 
 @Benchmark.register_test(
-    'Get descendants count [branch]', (TreePlace, TreeQueriesPlace)
+    'Get descendants count [branch]', (*TREE_MODELS, TreeQueriesPlace)
 )
 class TestGetDescendantsCountBranch(GetBranchMixin, BenchmarkTest):
     def run(self):
@@ -976,7 +1032,9 @@ class TestGetDescendantsCountBranch(GetBranchMixin, BenchmarkTest):
         self.branch.get_descendants_count()
 
 
-@Benchmark.register_test('Get descendants count [leaf]', (TreePlace, TreeQueriesPlace))
+@Benchmark.register_test(
+    'Get descendants count [leaf]', (*TREE_MODELS, TreeQueriesPlace)
+)
 class TestGetDescendantsCountLeaf(GetLeafMixin, BenchmarkTest):
     def run(self):
         self.leaf.get_descendants().count()
@@ -1006,7 +1064,7 @@ class TestGetDescendantsCountLeaf(GetLeafMixin, BenchmarkTest):
 # simple-ORM equivalent below; the others use their native filtered count.
 _FILTERED_DESCENDANTS_NATIVE = (
     MPTTPlace,
-    TreePlace,
+    *TREE_MODELS,
     TreebeardMPPlace,
     TreebeardNSPlace,
     TreeQueriesPlace,
@@ -1078,12 +1136,161 @@ class TestGetFilteredDescendantsCountLeaf(GetLeafMixin, BenchmarkTest):
         self.leaf.get_descendants_queryset().filter(pk__contains='1').count()
 
 
+#
+# Children filtered descendants counts
+#
+
+
+def _children_filtered_descendants_counts(node):
+    # The per-node loop `annotate_descendant_count` replaces: one filtered count
+    # per child.
+    return [
+        child.get_descendants().filter(pk__contains='1').count()
+        for child in node.get_children()
+    ]
+
+
+def _annotated_children_filtered_descendants_counts(node):
+    children = node.get_children().annotate_descendant_count(filter=Q(pk__contains='1'))
+    return [child.descendant_count for child in children]
+
+
+@Benchmark.register_test(
+    'Get children filtered descendants counts [root]', _FILTERED_DESCENDANTS_NATIVE
+)
+class TestGetChildrenFilteredDescendantsCountsRoot(GetRootMixin, BenchmarkTest):
+    def run(self):
+        _children_filtered_descendants_counts(self.root)
+
+
+@Benchmark.register_test(
+    'Annotate children filtered descendants counts [root]', TREE_MODELS
+)
+class TestAnnotateChildrenFilteredDescendantsCountsRoot(GetRootMixin, BenchmarkTest):
+    def run(self):
+        _annotated_children_filtered_descendants_counts(self.root)
+
+
+@Benchmark.register_test(
+    'Get children filtered descendants counts [branch]', _FILTERED_DESCENDANTS_NATIVE
+)
+class TestGetChildrenFilteredDescendantsCountsBranch(GetBranchMixin, BenchmarkTest):
+    def run(self):
+        _children_filtered_descendants_counts(self.branch)
+
+
+@Benchmark.register_test(
+    'Annotate children filtered descendants counts [branch]', TREE_MODELS
+)
+class TestAnnotateChildrenFilteredDescendantsCountsBranch(
+    GetBranchMixin, BenchmarkTest
+):
+    def run(self):
+        _annotated_children_filtered_descendants_counts(self.branch)
+
+
+#
+# Loading paths
+#
+
+
+@contextmanager
+def _lazy_paths(model, lazy):
+    field = model._meta.get_field('path')
+    previous, field.lazy = field.lazy, lazy
+    try:
+        yield
+    finally:
+        field.lazy = previous
+
+
+def _load_levels(model, lazy):
+    """Load every node and read its level, as a full export would."""
+    with _lazy_paths(model, lazy):
+        return [obj.path.get_level() for obj in model._default_manager.only('path')]
+
+
+def _paths_peak_memory(model, lazy):
+    """Peak Python memory allocated while loading every path."""
+    with _lazy_paths(model, lazy):
+        tracemalloc.start()
+        try:
+            list(model._default_manager.values_list('path', flat=True))
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+@Benchmark.register_test('Load all levels', TREE_MODELS)
+class TestLoadAllLevels(BenchmarkTest):
+    def run(self):
+        _load_levels(self.model, lazy=False)
+
+
+@Benchmark.register_test('Load all levels [lazy]', TREE_MODELS)
+class TestLoadAllLevelsLazy(BenchmarkTest):
+    def run(self):
+        _load_levels(self.model, lazy=True)
+
+
+@Benchmark.register_test('Load all paths', TREE_MODELS, y_label=MEMORY_USAGE)
+class TestLoadAllPathsMemory(BenchmarkTest):
+    def run(self):
+        return _paths_peak_memory(self.model, lazy=False)
+
+
+@Benchmark.register_test('Load all paths [lazy]', TREE_MODELS, y_label=MEMORY_USAGE)
+class TestLoadAllPathsMemoryLazy(BenchmarkTest):
+    def run(self):
+        return _paths_peak_memory(self.model, lazy=True)
+
+
+#
+# Uppercase descendants count
+#
+
+
+def _uppercase_descendants_count(model, node):
+    """Count the descendants of ``node`` whose name starts with an uppercase letter.
+
+    A filtered descendants count whose predicate `TreePartialPlace` backs with a
+    partial path index (``PathIndex(..., condition=Q(name__lt='a'))``), so it is
+    a range scan over the matching rows only there.
+    """
+    if model is TreebeardALPlace:
+        # Unofficial equivalent: treebeard AL has no descendants queryset.
+        return sum(1 for d in _bfs_descendants([node]) if d.name < 'a')
+    if model is TreeNodePlace:
+        descendants = node.get_descendants_queryset()
+    else:
+        descendants = node.get_descendants()
+    return descendants.filter(name__lt='a').count()
+
+
+@Benchmark.register_test('Get uppercase descendants count [root]')
+class TestGetUppercaseDescendantsCountRoot(GetRootMixin, BenchmarkTest):
+    def run(self):
+        _uppercase_descendants_count(self.model, self.root)
+
+
+@Benchmark.register_test('Get uppercase descendants count [branch]')
+class TestGetUppercaseDescendantsCountBranch(GetBranchMixin, BenchmarkTest):
+    def run(self):
+        _uppercase_descendants_count(self.model, self.branch)
+
+
+@Benchmark.register_test('Get uppercase descendants count [leaf]')
+class TestGetUppercaseDescendantsCountLeaf(GetLeafMixin, BenchmarkTest):
+    def run(self):
+        _uppercase_descendants_count(self.model, self.leaf)
+
+
 #
 # Siblings
 #
 
 
-@Benchmark.register_test('Get siblings [root]', (MPTTPlace, TreePlace))
+@Benchmark.register_test('Get siblings [root]', (MPTTPlace, *TREE_MODELS))
 class TestGetSiblingsRoot(GetRootMixin, BenchmarkTest):
     def run(self):
         list(self.root.get_siblings(include_self=True))
@@ -1104,7 +1311,7 @@ class TestGetSiblingsRoot(GetRootMixin, BenchmarkTest):
         list(self.root.get_siblings())
 
 
-@Benchmark.register_test('Get siblings [branch]', (MPTTPlace, TreePlace))
+@Benchmark.register_test('Get siblings [branch]', (MPTTPlace, *TREE_MODELS))
 class TestGetSiblingsBranch(GetBranchMixin, BenchmarkTest):
     def run(self):
         list(self.branch.get_siblings(include_self=True))
@@ -1125,7 +1332,7 @@ class TestGetSiblingsBranch(GetBranchMixin, BenchmarkTest):
         list(self.branch.get_siblings())
 
 
-@Benchmark.register_test('Get siblings [leaf]', (MPTTPlace, TreePlace))
+@Benchmark.register_test('Get siblings [leaf]', (MPTTPlace, *TREE_MODELS))
 class TestGetSiblingsLeaf(GetLeafMixin, BenchmarkTest):
     def run(self):
         list(self.leaf.get_siblings(include_self=True))
@@ -1159,7 +1366,7 @@ class TestGetPrevSiblingRoot(GetRootMixin, BenchmarkTest):
 
 @Benchmark.register_test(
     'Get previous sibling [root]',
-    (TreePlace, TreebeardALPlace, TreebeardMPPlace, TreebeardNSPlace),
+    (*TREE_MODELS, TreebeardALPlace, TreebeardMPPlace, TreebeardNSPlace),
 )
 class TestGetPrevSiblingRoot(GetRootMixin, BenchmarkTest):
     def run(self):
@@ -1174,7 +1381,7 @@ class TestGetPrevSiblingBranch(GetBranchMixin, BenchmarkTest):
 
 @Benchmark.register_test(
     'Get previous sibling [branch]',
-    (TreePlace, TreebeardALPlace, TreebeardMPPlace, TreebeardNSPlace),
+    (*TREE_MODELS, TreebeardALPlace, TreebeardMPPlace, TreebeardNSPlace),
 )
 class TestGetPrevSiblingBranch(GetBranchMixin, BenchmarkTest):
     def run(self):
@@ -1189,7 +1396,7 @@ class TestGetPrevSiblingLeaf(GetLeafMixin, BenchmarkTest):
 
 @Benchmark.register_test(
     'Get previous sibling [leaf]',
-    (TreePlace, TreebeardALPlace, TreebeardMPPlace, TreebeardNSPlace),
+    (*TREE_MODELS, TreebeardALPlace, TreebeardMPPlace, TreebeardNSPlace),
 )
 class TestGetPrevSiblingLeaf(GetLeafMixin, BenchmarkTest):
     def run(self):
@@ -1274,7 +1481,7 @@ class TestGetRoots(BenchmarkTest):
         list(self.model._default_manager.root_nodes())
 
 
-@Benchmark.register_test('Get roots', TreePlace)
+@Benchmark.register_test('Get roots', TREE_MODELS)
 class TestGetRoots(BenchmarkTest):
     def run(self):
         list(self.model.objects.filter_roots())
@@ -1311,7 +1518,7 @@ class TestRebuildPaths(BenchmarkWriteTest):
         self.model._default_manager.rebuild()
 
 
-@Benchmark.register_test('Rebuild paths', TreePlace, y_label=WRITE_LATENCY)
+@Benchmark.register_test('Rebuild paths', TREE_MODELS, y_label=WRITE_LATENCY)
 class TestRebuildPaths(BenchmarkWriteTest):
     def run(self):
         self.model.rebuild_paths()
@@ -1348,7 +1555,7 @@ class TestRebuildPaths(BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Create [root]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeNodePlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeNodePlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestCreateRoot(BenchmarkWriteTest):
@@ -1366,7 +1573,7 @@ class TestCreateRoot(BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Create [branch]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestCreateBranch(GetRootMixin, BenchmarkWriteTest):
@@ -1390,7 +1597,7 @@ class TestCreateBranch(GetRootMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Create [leaf]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestCreateLeaf(GetLeafMixin, BenchmarkWriteTest):
@@ -1463,7 +1670,7 @@ class TestMoveSameLeafPath(GetLeafMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Move [root to branch]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestMoveRootToBranch(GetBranchMixin, GetRootMixin, BenchmarkWriteTest):
@@ -1488,7 +1695,7 @@ class TestMoveRootToBranch(GetBranchMixin, GetRootMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Move [root to leaf]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestMoveRootToLeaf(GetLeafMixin, GetRootMixin, BenchmarkWriteTest):
@@ -1513,7 +1720,7 @@ class TestMoveRootToLeaf(GetLeafMixin, GetRootMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Move [branch to root]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestMoveBranchToRoot(GetBranchMixin, BenchmarkWriteTest):
@@ -1538,7 +1745,7 @@ class TestMoveBranchToRoot(GetBranchMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Move [branch to leaf]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestMoveBranchToLeaf(GetLeafMixin, GetBranchMixin, BenchmarkWriteTest):
@@ -1563,7 +1770,7 @@ class TestMoveBranchToLeaf(GetLeafMixin, GetBranchMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Move [leaf to root]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestMoveLeafToRoot(GetLeafMixin, BenchmarkWriteTest):
@@ -1588,7 +1795,7 @@ class TestMoveLeafToRoot(GetLeafMixin, BenchmarkWriteTest):
 
 @Benchmark.register_test(
     'Move [leaf to branch]',
-    (MPTTPlace, TreePlace, TreebeardALPlace, TreeQueriesPlace),
+    (MPTTPlace, *TREE_MODELS, TreebeardALPlace, TreeQueriesPlace),
     y_label=WRITE_LATENCY,
 )
 class TestMoveLeafToBranch(GetLeafMixin, GetRootMixin, BenchmarkWriteTest):
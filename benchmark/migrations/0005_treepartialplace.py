@@ -0,0 +1,60 @@
+import benchmark.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+from tree.fields import PathField, PathIndex
+from tree.operations import CreateTreeTrigger
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('benchmark', '0004_treecoveringplace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreePartialPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'name',
+                    models.CharField(
+                        default=benchmark.models.get_random_name,
+                        max_length=50,
+                        unique=True,
+                    ),
+                ),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='children',
+                        to='benchmark.treepartialplace',
+                    ),
+                ),
+                ('path', PathField(order_by=['name'])),
+            ],
+            options={
+                'indexes': [
+                    PathIndex('path', name='partplace_path_level_index'),
+                    PathIndex(
+                        'path',
+                        name='partplace_path_upper_index',
+                        level=False,
+                        condition=models.Q(name__lt='a'),
+                    ),
+                ],
+            },
+        ),
+        CreateTreeTrigger('TreePartialPlace'),
+    ]
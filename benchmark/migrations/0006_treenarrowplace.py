@@ -0,0 +1,54 @@
+import benchmark.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+from tree.fields import PathField, PathIndex
+from tree.operations import CreateTreeTrigger
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('benchmark', '0005_treepartialplace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeNarrowPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'name',
+                    models.CharField(
+                        default=benchmark.models.get_random_name,
+                        max_length=50,
+                        unique=True,
+                    ),
+                ),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='children',
+                        to='benchmark.treenarrowplace',
+                    ),
+                ),
+                ('path', PathField(order_by=['name'])),
+            ],
+            options={
+                'indexes': [
+                    PathIndex('path', name='narrowplace_path_level_index', narrow=True),
+                ],
+            },
+        ),
+        CreateTreeTrigger('TreeNarrowPlace'),
+    ]
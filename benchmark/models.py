@@ -1,13 +1,13 @@
 from random import choice
 from string import ascii_letters
 
-from django.db.models import CharField, ForeignKey, CASCADE
+from django.db.models import CharField, ForeignKey, Q, CASCADE
 from treebeard.mp_tree import MP_Node
 from treebeard.ns_tree import NS_Node
 from treebeard.al_tree import AL_Node
 from treenode.models import TreeNodeModel
 from tree_queries.models import TreeNode
-from tree.fields import PathField
+from tree.fields import PathField, PathIndex
 from tree.models import TreeModel
 from mptt.models import MPTTModel, TreeForeignKey
 
@@ -39,6 +39,62 @@ class TreePlace(TreeModel):
         ]
 
 
+class TreeCoveringPlace(TreeModel):
+    """`TreePlace` with a covering index (`get_indexes(..., include=['name'])`),
+    so listing the names of a subtree is an index-only scan; measures what the
+    wider index costs and saves."""
+
+    name = CharField(max_length=50, unique=True, default=get_random_name)
+    parent = ForeignKey(
+        'self', null=True, blank=True, related_name='children', on_delete=CASCADE
+    )
+    path = PathField(order_by=['name'])
+
+    class Meta:
+        indexes = [
+            *PathField.get_indexes('covplace', 'path', include=['name']),
+        ]
+
+
+class TreePartialPlace(TreeModel):
+    """`TreePlace` with a partial path index of the uppercase names, which backs
+    the "uppercase descendants count" benchmark: a compact index of just the
+    rows matching that filter, in path order."""
+
+    name = CharField(max_length=50, unique=True, default=get_random_name)
+    parent = ForeignKey(
+        'self', null=True, blank=True, related_name='children', on_delete=CASCADE
+    )
+    path = PathField(order_by=['name'])
+
+    class Meta:
+        indexes = [
+            *PathField.get_indexes('partplace', 'path'),
+            PathIndex(
+                'path',
+                name='partplace_path_upper_index',
+                level=False,
+                condition=Q(name__lt='a'),
+            ),
+        ]
+
+
+class TreeNarrowPlace(TreeModel):
+    """`TreePlace` with a narrow level index (`get_indexes(..., narrow=True)`), so
+    the path is stored in a single btree; measures that disk/latency trade-off."""
+
+    name = CharField(max_length=50, unique=True, default=get_random_name)
+    parent = ForeignKey(
+        'self', null=True, blank=True, related_name='children', on_delete=CASCADE
+    )
+    path = PathField(order_by=['name'])
+
+    class Meta:
+        indexes = [
+            *PathField.get_indexes('narrowplace', 'path', narrow=True),
+        ]
+
+
 class TreebeardALPlace(AL_Node):
     name = CharField(max_length=50, unique=True, default=get_random_name)
     parent = ForeignKey(
@@ -4,11 +4,16 @@ from __future__ import unicode_literals
 
 import doctest
 import json
+import os
+import pickle
 import uuid
 from contextlib import nullcontext
 from importlib import import_module
+from tempfile import TemporaryDirectory
+from threading import Event
 from unittest import mock, skipIf, skipUnless
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.apps import apps
 from django.core.exceptions import (
     FieldDoesNotExist,
@@ -18,14 +23,22 @@ from django.core.exceptions import (
 from django.db import transaction, connection
 from django.db.migrations.recorder import MigrationRecorder
 from django.db.migrations.state import ProjectState
-from django.db.models import F, ProtectedError, QuerySet
+from django.db.models import F, ProtectedError, Q, QuerySet
+from django.db.models.signals import post_save, pre_save
 from django.db.utils import IntegrityError, ProgrammingError
-from django.test import SimpleTestCase, TransactionTestCase
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
-from tree.fields import PathField
+from tree.fields import PathDescriptor, PathField, PathIndex
+from tree.memo import TreeMemoMiddleware, memoize_tree
 from tree.forms import TreeChoiceField
+from tree import signals
+from tree.cache import TreeCache, get_subtree_etag, get_tree_version
+from tree.notify import SubtreeCache, TreeListener
 from tree.operations import CreateTreeTrigger, DeleteTreeTrigger, RebuildPaths
 from tree.query import _get_path_field
+from tree.rollups import TreeRollup
+from tree.snapshot import TreeSnapshot, export_tree_snapshot, refresh_tree_snapshot
 from tree.sql import base as sql_base
 from tree.types import Path
 
@@ -38,6 +51,11 @@ from .models import (
     SetNullPlace,
     ProtectPlace,
     WeirdTableNamePlace,
+    VersionedPlace,
+    NotifyPlace,
+    StampedPlace,
+    AncestorsPlace,
+    RollupPlace,
 )
 
 
@@ -131,6 +149,7 @@ def assert_structure(test, instances, values, label=lambda p: p.name):
 
 class CommonTest(TransactionTestCase):
     maxDiff = 1000
+    model = Place
 
     def assertNumQueries(self, num, func=None, *args, **kwargs):
         # The exact "one query" guarantee comes from the PostgreSQL trigger doing
@@ -145,11 +164,12 @@ class CommonTest(TransactionTestCase):
 
     def create_place(self, name, parent=None):
         with self.assertNumQueries(1):
-            p = Place.objects.create(name=name, parent=parent)
-        with self.assertNumQueries(1):
+            p = self.model.objects.create(name=name, parent=parent)
+        # The path came back with the insert, so checking it is free.
+        with self.assertNumQueries(0):
             p.clean()
-        # We fetch the object again to populate the path.
-        return Place.objects.get(pk=p.pk)
+        # We fetch the object again to start from a fresh instance.
+        return self.model.objects.get(pk=p.pk)
 
     def create_test_places(self):
         self.correct_raw_places_data = [
@@ -199,7 +219,7 @@ class CommonTest(TransactionTestCase):
     def assertPlaces(self, values, queryset=None, n_queries=1):
         with self.assertNumQueries(n_queries):
             if queryset is None:
-                queryset = Place.objects.all()
+                queryset = self.model.objects.all()
             places = list(queryset)
         assert_structure(self, places, values)
 
@@ -210,21 +230,26 @@ class PathTest(CommonTest):
     def test_path_on_creation(self):
         with self.assertNumQueries(1):
             place1 = Place.objects.create(name='place1')
-        # 1 query because the path got deferred,  forcing Django to run
-        # a new query to get the updated value when we need it. Same below.
-        with self.assertNumQueries(1):
+        # No query: the insert returns the computed path along with the pk.
+        with self.assertNumQueries(0):
             self.assertTrue(place1.path.is_root())
         with self.assertNumQueries(1):
             place2 = Place.objects.create(name='place2', parent=place1)
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(0):
             self.assertEqual(place2.path.get_level(), 2)
             self.assertTrue(place2.path.is_descendant_of(place1.path))
         with self.assertNumQueries(1):
             place2.parent = None
             place2.clean()
             place2.save()
+        # 1 query because an update can't return the path: it got deferred,
+        # forcing Django to run a new query to get the updated value.
         with self.assertNumQueries(1):
             self.assertTrue(place2.path.is_root())
+        self.assertEqual(
+            [place1.path.value, place2.path.value],
+            [Place.objects.get(pk=place.pk).path.value for place in (place1, place2)],
+        )
 
     def test_insert(self):
         it = self.create_test_places()
@@ -465,7 +490,7 @@ class PathTest(CommonTest):
         )
 
         little_france.parent = Place.objects.get(name='France')
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(0):
             little_france.clean()
         with self.assertNumQueries(1):
             little_france.save()
@@ -520,7 +545,7 @@ class PathTest(CommonTest):
         )
 
         bretagne.parent = Place.objects.get(name='France')
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(0):
             bretagne.clean()
         with self.assertNumQueries(1):
             bretagne.save()
@@ -575,7 +600,7 @@ class PathTest(CommonTest):
         )
 
         grattenoix.parent = Place.objects.get(name='Seine-Maritime')
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(0):
             grattenoix.clean()
         with self.assertNumQueries(1):
             grattenoix.save()
@@ -631,7 +656,7 @@ class PathTest(CommonTest):
         )
 
         evreux.parent = Place.objects.get(name='Eure')
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(0):
             evreux.clean()
         with self.assertNumQueries(1):
             evreux.save()
@@ -2459,6 +2484,502 @@ class QuerySetTest(CommonTest):
             places.get_descendants(include_self=True),
         )
 
+    def test_get_descendants_merges_nested_members(self):
+        self.create_all_test_places()
+        # Normandie is nested under France: its range is already covered.
+        places = Place.objects.filter(name__in=('France', 'Normandie', 'Eure'))
+        with self.assertNumQueries(1):
+            descendants = places.get_descendants()
+        self.assertEqual(str(descendants.query).count(' OR '), 0)
+        self.assertEqual(
+            sorted(descendants.values_list('name', flat=True)),
+            ['Manche', 'Poitiers', 'Poitou-Charentes', 'Seine-Maritime', 'Vienne'],
+        )
+        self.assertFalse(Place.objects.none().get_descendants().exists())
+
+    def test_get_descendants_of_many_members(self):
+        self.create_all_test_places()
+        places = Place.objects.filter(name__in=('Normandie', 'Österreich', 'Eure'))
+        expected = sorted(places.get_descendants().values_list('name', flat=True))
+        with mock.patch('tree.query.MAX_BOUND_PATHS', 2):
+            descendants = places.get_descendants()
+            self.assertIn('EXISTS', str(descendants.query))
+            self.assertEqual(
+                sorted(descendants.values_list('name', flat=True)), expected
+            )
+            self.assertEqual(
+                sorted(
+                    places.get_descendants(include_self=True).values_list(
+                        'name', flat=True
+                    )
+                ),
+                sorted([*expected, 'Normandie', 'Österreich', 'Eure']),
+            )
+
+    def test_get_ancestors(self):
+        self.create_all_test_places()
+        places = Place.objects.filter(name__in=('Seine-Maritime', 'Eure', 'Vienne'))
+        with self.assertNumQueries(1):
+            ancestors = places.get_ancestors()
+        self.assertPlaces(
+            [
+                (path(0), 'France'),
+                (path(0, 0), 'Normandie'),
+                (path(0, 1), 'Poitou-Charentes'),
+            ],
+            ancestors,
+        )
+        self.assertPlaces(
+            [
+                (path(0), 'France'),
+                (path(0, 0), 'Normandie'),
+                (path(0, 0, -1), 'Eure'),
+                (path(0, 0, 0), 'Seine-Maritime'),
+                (path(0, 1), 'Poitou-Charentes'),
+                (path(0, 1, 0), 'Vienne'),
+            ],
+            places.get_ancestors(include_self=True),
+        )
+        # Roots have no ancestors.
+        self.assertFalse(Place.objects.filter_roots().get_ancestors().exists())
+
+    def test_get_ancestors_of_many_members(self):
+        self.create_all_test_places()
+        places = Place.objects.filter(name__in=('Seine-Maritime', 'Poitiers'))
+        expected = [
+            list(places.get_ancestors(include_self=include_self).values_list('name'))
+            for include_self in (False, True)
+        ]
+        # Poitiers alone has three ancestors.
+        with mock.patch('tree.query.MAX_BOUND_PATHS', 2):
+            ancestors = places.get_ancestors()
+            self.assertIn('EXISTS', str(ancestors.query))
+            self.assertEqual(list(ancestors.values_list('name')), expected[0])
+            self.assertEqual(
+                list(places.get_ancestors(include_self=True).values_list('name')),
+                expected[1],
+            )
+
+    def test_topmost_and_bottommost(self):
+        self.create_all_test_places()
+        places = Place.objects.filter(
+            name__in=('France', 'Normandie', 'Eure', 'Vienne', 'Österreich')
+        )
+        self.assertEqual(
+            sorted(places.topmost().values_list('name', flat=True)),
+            ['France', 'Österreich'],
+        )
+        self.assertEqual(
+            sorted(places.bottommost().values_list('name', flat=True)),
+            ['Eure', 'Vienne', 'Österreich'],
+        )
+        self.assertFalse(Place.objects.none().topmost().exists())
+
+    def test_topmost_and_bottommost_of_many_members(self):
+        self.create_all_test_places()
+        places = Place.objects.filter(
+            name__in=('France', 'Normandie', 'Eure', 'Vienne', 'Österreich')
+        )
+        with mock.patch('tree.query.MAX_BOUND_PATHS', 2):
+            topmost = places.topmost()
+            self.assertIn('EXISTS', str(topmost.query))
+            self.assertEqual(
+                sorted(topmost.values_list('name', flat=True)),
+                ['France', 'Österreich'],
+            )
+            self.assertEqual(
+                sorted(places.bottommost().values_list('name', flat=True)),
+                ['Eure', 'Vienne', 'Österreich'],
+            )
+
+    def test_prefetch_tree_children(self):
+        self.create_all_test_places()
+        with self.assertNumQueries(2):
+            places = list(Place.objects.prefetch_tree().order_by('path'))
+        with self.assertNumQueries(0):
+            children = {
+                place.name: [child.name for child in place.get_children()]
+                for place in places
+            }
+            # `is_leaf` checks the prefetched children too.
+            self.assertEqual(
+                {place.name for place in places if place.is_leaf()},
+                {'Eure', 'Manche', 'Seine-Maritime', 'Poitiers', 'Österreich'},
+            )
+        self.assertEqual(children['France'], ['Normandie', 'Poitou-Charentes'])
+        self.assertEqual(children['Eure'], [])
+        # Chaining still queries, with the full lookup.
+        france = places[0]
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [place.name for place in france.get_children().filter(pk__gt=0)],
+                ['Normandie', 'Poitou-Charentes'],
+            )
+
+    def test_prefetch_tree_descendants(self):
+        self.create_all_test_places()
+        with self.assertNumQueries(2):
+            places = list(
+                Place.objects.filter(name__in=('France', 'Normandie'))
+                .prefetch_tree(descendants=True)
+                .order_by('path')
+            )
+        france, normandie = places
+        with self.assertNumQueries(0):
+            self.assertEqual(len(france.get_descendants()), 7)
+            self.assertEqual(
+                [place.name for place in normandie.get_descendants(include_self=True)],
+                ['Normandie', 'Eure', 'Manche', 'Seine-Maritime'],
+            )
+            self.assertEqual(
+                [place.name for place in normandie.get_children()],
+                ['Eure', 'Manche', 'Seine-Maritime'],
+            )
+
+    def test_prefetch_tree_max_depth(self):
+        self.create_all_test_places()
+        with self.assertNumQueries(2):
+            places = list(
+                Place.objects.filter(name__in=('France', 'Normandie'))
+                .prefetch_tree(descendants=True, max_depth=1)
+                .order_by('path')
+            )
+        france, normandie = places
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [place.name for place in france.get_prefetched_descendants()],
+                ['Normandie', 'Poitou-Charentes'],
+            )
+            self.assertEqual(
+                [
+                    place.name
+                    for place in normandie.get_prefetched_descendants(include_self=True)
+                ],
+                ['Normandie', 'Eure', 'Manche', 'Seine-Maritime'],
+            )
+        # The queryset of `get_descendants()` still means the whole subtree.
+        with self.assertNumQueries(1):
+            self.assertEqual(len(france.get_descendants()), 7)
+        self.assertEqual(france.get_descendants().count(), 7)
+        with self.assertRaises(ValueError):
+            Place.objects.get(name='France').get_prefetched_descendants()
+
+    def test_with_ancestors(self):
+        self.create_all_test_places()
+        with self.assertNumQueries(2):
+            places = list(
+                Place.objects.filter(name__in=('Eure', 'Poitiers', 'France'))
+                .with_ancestors()
+                .order_by('path')
+            )
+        france, eure, poitiers = places
+        with self.assertNumQueries(0):
+            breadcrumbs = {
+                place.name: [ancestor.name for ancestor in place.get_ancestors()]
+                for place in places
+            }
+            self.assertEqual(
+                [place.name for place in eure.get_ancestors(include_self=True)],
+                ['France', 'Normandie', 'Eure'],
+            )
+        self.assertEqual(
+            breadcrumbs,
+            {
+                'France': [],
+                'Eure': ['France', 'Normandie'],
+                'Poitiers': ['France', 'Poitou-Charentes', 'Vienne'],
+            },
+        )
+        # The ancestors are shared between members.
+        self.assertIs(list(eure.get_ancestors())[0], list(poitiers.get_ancestors())[0])
+
+    def test_as_tree(self):
+        self.create_all_test_places()
+        france = Place.objects.get(name='France')
+
+        def names(nodes, key=lambda item: item.name):
+            return [(key(node.item), names(node.children, key)) for node in nodes]
+
+        with self.assertNumQueries(1):
+            tree = france.get_descendants(include_self=True).as_tree()
+        self.assertEqual(
+            names(tree),
+            [
+                (
+                    'France',
+                    [
+                        (
+                            'Normandie',
+                            [('Eure', []), ('Manche', []), ('Seine-Maritime', [])],
+                        ),
+                        ('Poitou-Charentes', [('Vienne', [('Poitiers', [])])]),
+                    ],
+                )
+            ],
+        )
+        # `values()` mode, and members whose parent is filtered out.
+        tree = Place.objects.exclude(name='Normandie').as_tree('name')
+        self.assertEqual(tree[0].item, {'name': 'France'})
+        self.assertEqual(
+            [node.item['name'] for node in tree[0].children],
+            ['Eure', 'Manche', 'Seine-Maritime', 'Poitou-Charentes'],
+        )
+        self.assertEqual(
+            names(tree, key=lambda item: item['name'])[1], ('Österreich', [])
+        )
+
+    def test_annotate_descendant_count(self):
+        self.create_all_test_places()
+        with self.assertNumQueries(1):
+            places = list(Place.objects.annotate_descendant_count())
+        self.assertEqual(
+            {place.name: place.descendant_count for place in places},
+            {
+                'France': 7,
+                'Normandie': 3,
+                'Seine-Maritime': 0,
+                'Eure': 0,
+                'Manche': 0,
+                'Poitou-Charentes': 2,
+                'Vienne': 1,
+                'Poitiers': 0,
+                'Österreich': 0,
+            },
+        )
+        places = Place.objects.filter(name__in=('France', 'Vienne'))
+        self.assertEqual(
+            {
+                place.name: place.n
+                for place in places.annotate_descendant_count(
+                    'n', filter=Q(name__startswith='P')
+                )
+            },
+            {'France': 2, 'Vienne': 1},
+        )
+        # A real annotation: filterable, orderable and part of `values()`.
+        self.assertEqual(
+            list(
+                Place.objects.annotate_descendant_count()
+                .filter(descendant_count__gt=1)
+                .order_by('-descendant_count')
+                .values_list('name', 'descendant_count')
+            ),
+            [('France', 7), ('Normandie', 3), ('Poitou-Charentes', 2)],
+        )
+
+    def test_annotate_tree_info(self):
+        self.create_all_test_places()
+        with self.assertNumQueries(1):
+            places = list(Place.objects.annotate_tree_info())
+        with self.assertNumQueries(0):
+            info = {
+                place.name: (
+                    place.path_children_count,
+                    place.is_leaf(),
+                    place.path_is_leaf,
+                    place.get_level(),
+                )
+                for place in places
+            }
+        self.assertEqual(info['France'], (2, False, False, 1))
+        self.assertEqual(info['Normandie'], (3, False, False, 2))
+        self.assertEqual(info['Poitiers'], (0, True, True, 4))
+        self.assertEqual(info['Österreich'], (0, True, True, 1))
+        if connection.vendor == 'postgresql':
+            self.assertEqual(places[0].path_level, places[0].get_level())
+        # Plain columns, so they can be filtered on.
+        self.assertEqual(
+            sorted(
+                Place.objects.annotate_tree_info()
+                .filter(path_is_leaf=False)
+                .values_list('name', flat=True)
+            ),
+            ['France', 'Normandie', 'Poitou-Charentes', 'Vienne'],
+        )
+
+    def test_iter_subtree(self):
+        self.create_all_test_places()
+        france = Place.objects.get(name='France')
+        subtree = france.get_descendants(include_self=True)
+        expected = list(subtree.order_by('path').values_list('name', flat=True))
+        with self.assertNumQueries(3):
+            names = [place.name for place in subtree.iter_subtree(chunk_size=3)]
+        self.assertEqual(names, expected)
+        normandie = Place.objects.get(name='Normandie')
+        self.assertEqual(
+            [place.name for place in subtree.iter_subtree(after=normandie.path)],
+            expected[expected.index('Normandie') + 1 :],
+        )
+
+    def test_path_cursor_paginator(self):
+        from django.core.paginator import InvalidPage
+
+        from tree.pagination import PathCursorPaginator
+
+        self.create_all_test_places()
+        expected = list(Place.objects.order_by('path').values_list('name', flat=True))
+        paginator = PathCursorPaginator(Place.objects.all(), per_page=4)
+        names, cursor = [], None
+        for _ in range(3):
+            page = paginator.page(cursor)
+            names += [place.name for place in page]
+            cursor = page.next_cursor
+        self.assertFalse(page.has_next())
+        self.assertEqual(names, expected)
+        with self.assertRaises(InvalidPage):
+            paginator.page('!')
+
+    def test_keyset_iteration_skips_null_paths(self):
+        from tree.pagination import PathCursorPaginator
+
+        self.create_all_test_places()
+        with Place.disabled_tree_trigger():
+            Place.objects.filter(name__in=['France', 'Manche']).update(path=None)
+        expected = list(
+            Place.objects.filter(path__isnull=False)
+            .order_by('path')
+            .values_list('name', flat=True)
+        )
+        self.assertEqual(len(expected), 7)
+        self.assertEqual(
+            [place.name for place in Place.objects.iter_subtree(chunk_size=2)],
+            expected,
+        )
+        paginator = PathCursorPaginator(Place.objects.all(), per_page=2)
+        names, cursor = [], None
+        for _ in range(4):
+            page = paginator.page(cursor)
+            names += [place.name for place in page]
+            cursor = page.next_cursor
+        self.assertFalse(page.has_next())
+        self.assertEqual(names, expected)
+
+    def test_split_ranges(self):
+        from tree.parallel import process_ranges
+
+        self.create_all_test_places()
+        france = Place.objects.get(name='France')
+        subtree = france.get_descendants(include_self=True)
+        ranges = subtree.split_ranges(3)
+        self.assertEqual(len(ranges), 3)
+        self.assertIsNone(ranges[0][0])
+        self.assertIsNone(ranges[-1][1])
+        names = [
+            sorted(subtree.filter_range(lo, hi).values_list('name', flat=True))
+            for lo, hi in ranges
+        ]
+        # Disjoint, and together the whole subtree.
+        self.assertEqual(
+            sorted(name for part in names for name in part),
+            sorted(subtree.values_list('name', flat=True)),
+        )
+        self.assertTrue(all(names))
+        self.assertEqual(
+            sum(process_ranges(subtree, lambda qs: qs.count(), 3)), subtree.count()
+        )
+        self.assertEqual(Place.objects.none().split_ranges(4), [(None, None)])
+
+    def test_split_ranges_cover_null_paths(self):
+        self.create_all_test_places()
+        if connection.vendor == 'postgresql':
+            # Gives the planner the row estimate `TABLESAMPLE` is sized from.
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE tests_place')
+        with Place.disabled_tree_trigger():
+            Place.objects.filter(name='Manche').update(path=None)
+        with CaptureQueriesContext(connection) as queries:
+            ranges = Place.objects.split_ranges(3)
+        if connection.vendor == 'postgresql':
+            self.assertIn('TABLESAMPLE', queries[-1]['sql'])
+        else:
+            # A count, then one single-row probe per inner quantile.
+            self.assertEqual(len(queries), 3)
+        self.assertEqual(len(ranges), 3)
+        names = [
+            sorted(Place.objects.filter_range(lo, hi).values_list('name', flat=True))
+            for lo, hi in ranges
+        ]
+        self.assertIn('Manche', names[0])
+        self.assertEqual(
+            sorted(name for part in names for name in part),
+            sorted(Place.objects.values_list('name', flat=True)),
+        )
+
+    def test_process_ranges_inline_keeps_the_connection(self):
+        from concurrent.futures import Executor, Future
+
+        from tree.parallel import process_ranges
+
+        test = self
+
+        class InlineExecutor(Executor):
+            def submit(self, fn, /, func, *args):
+                # Everything but `func` (here a lambda) goes through pickle, as
+                # with a process pool, without evaluating any queryset.
+                with test.assertNumQueries(0):
+                    args = pickle.loads(pickle.dumps(args))
+                future = Future()
+                future.set_result(fn(func, *args))
+                return future
+
+        self.create_all_test_places()
+        with transaction.atomic():
+            self.create_place('Bretagne', Place.objects.get(name='France'))
+            counts = process_ranges(
+                Place.objects.all(),
+                lambda qs: qs.count(),
+                2,
+                executor=InlineExecutor(),
+            )
+            self.assertEqual(sum(counts), 10)
+            # Still in the same transaction.
+            self.assertTrue(Place.objects.filter(name='Bretagne').exists())
+        self.assertEqual(Place.objects.count(), 10)
+
+    def test_constant_lookups_bind_precomputed_bounds(self):
+        self.create_all_test_places()
+        france = Place.objects.get(name='France')
+        normandie = Place.objects.get(name='Normandie')
+        for lookup, node in (
+            ('descendant_of', france),
+            ('strict_descendant_of', france),
+            ('child_of', france),
+            ('sibling_of', normandie),
+        ):
+            with self.subTest(lookup=lookup):
+                qs = Place.objects.filter(**{f'path__{lookup}': node.path})
+                # Bounds are computed in Python, not by the installed helpers.
+                sql = str(qs.query)
+                self.assertNotIn('tree_upper(', sql)
+                self.assertNotIn('tree_parent_prefix(', sql)
+                if connection.vendor != 'postgresql':
+                    continue
+                # The column-operand form still uses the helpers, and agrees.
+                by_column = Place.objects.filter(
+                    **{
+                        f'path__{lookup}': Place.objects.filter(pk=node.pk).values(
+                            'path'
+                        )[:1]
+                    }
+                )
+                self.assertIn('tree_upper(', str(by_column.query))
+                self.assertEqual(
+                    sorted(qs.values_list('pk', flat=True)),
+                    sorted(by_column.values_list('pk', flat=True)),
+                )
+
+    def test_constant_ancestor_of_matches_prefixes(self):
+        self.create_all_test_places()
+        manche = Place.objects.get(name='Manche')
+        qs = Place.objects.filter(path__ancestor_of=manche.path)
+        # Equality probes on the prefixes, not a slice of the operand per row.
+        self.assertNotIn('substr', str(qs.query).lower())
+        self.assertEqual(
+            sorted(qs.values_list('name', flat=True)),
+            ['France', 'Manche', 'Normandie'],
+        )
+        self.assertFalse(Place.objects.filter(path__ancestor_of=b'').exists())
+
 
 class Issue17Test(CommonTest):
     # https://github.com/BertrandBordage/django-tree/issues/17
@@ -2796,6 +3317,19 @@ class PathObjectTest(CommonTest):
         with self.assertRaises(TypeError):
             france.is_descendant_of(42)
 
+    def test_compact_representation(self):
+        self.create_all_test_places()
+        france = Place.objects.get(name='France').path
+        # Slotted: no per-row `__dict__`.
+        self.assertFalse(hasattr(france, '__dict__'))
+        with self.assertRaises(AttributeError):
+            france.cached = True
+        # The level and root checks split the path once, into a slot.
+        self.assertIs(france._segments, france._segments)
+        for place in Place.objects.all():
+            self.assertEqual(place.path.get_level(), len(list(place.path)))
+            self.assertEqual(place.path.is_root(), place.parent_id is None)
+
 
 class PathFieldTest(CommonTest):
     def test_forbidden_kwargs(self):
@@ -2835,10 +3369,55 @@ class PathFieldTest(CommonTest):
             field.to_python(json.loads(serialized)).value, france.path.value
         )
 
+    def test_lazy_paths(self):
+        self.create_all_test_places()
+        field = Place._meta.get_field('path')
+        france = Place.objects.get(name='France')
+        # Only a lazy field installs the wrapping descriptor.
+        self.assertNotIsInstance(Place.__dict__['path'], PathDescriptor)
+        with (
+            mock.patch.object(field, 'lazy', True),
+            mock.patch.object(Place, 'path', PathDescriptor(field)),
+        ):
+            self.assertEqual(field.deconstruct()[3]['lazy'], True)
+            # `values_list()` returns the raw bytes, without a `Path` per row.
+            paths = Place.objects.values_list('path', flat=True)
+            self.assertTrue(all(type(path) is bytes for path in paths))
+            # Instances keep the raw bytes until the path is read.
+            lazy = Place.objects.get(pk=france.pk)
+            self.assertIs(type(lazy.__dict__['path']), bytes)
+            self.assertIsInstance(lazy.path, Path)
+            self.assertEqual(lazy.path.value, france.path.value)
+            self.assertIs(lazy.path, lazy.path)
+            # Navigation still works on raw member paths.
+            self.assertEqual(
+                list(
+                    Place.objects.filter(pk=france.pk)
+                    .get_descendants()
+                    .values_list('name', flat=True)
+                ),
+                list(france.get_descendants().values_list('name', flat=True)),
+            )
+        self.assertNotIn('lazy', field.deconstruct()[3])
+
     def test_value_to_string_unsaved(self):
         field = Place._meta.get_field('path')
         self.assertIsNone(field.value_to_string(Place(name='unsaved')))
 
+    def test_db_returning_needs_every_database_on_postgresql(self):
+        field = Place._meta.get_field('path')
+        on_postgresql = mock.patch(
+            'tree.fields.is_trigger_backend',
+            side_effect=lambda alias='default': alias == 'default',
+        )
+        with on_postgresql, mock.patch('tree.fields.connections', ['default']):
+            self.assertTrue(field.db_returning)
+        with (
+            on_postgresql,
+            mock.patch('tree.fields.connections', ['default', 'oracle']),
+        ):
+            self.assertFalse(field.db_returning)
+
     def test_unsupported_backend_raises(self):
         field = Place._meta.get_field('path')
         with mock.patch.object(connection, 'vendor', 'cockroachdb'):
@@ -2855,6 +3434,74 @@ class PathFieldTest(CommonTest):
         self.assertIsNotNone(Place.objects.get(pk=enabled.pk).path.value)
 
 
+class PathIndexTest(TransactionTestCase):
+    def test_deconstruct_omits_defaults(self):
+        index = PathField.get_indexes('place', 'path')[0]
+        self.assertEqual(index.deconstruct()[2], {'name': 'place_path_level_index'})
+
+    def test_covering_indexes(self):
+        level_index, covering = PathField.get_indexes('place', 'path', include=['name'])
+        self.assertEqual(level_index.include, ())
+        self.assertEqual(
+            covering.deconstruct(),
+            (
+                'tree.fields.PathIndex',
+                ('path',),
+                {
+                    'name': 'place_path_covering_index',
+                    'include': ['name'],
+                    'level': False,
+                },
+            ),
+        )
+        with connection.schema_editor() as editor:
+            sql = str(covering.create_sql(Place, editor))
+            # The DDL is valid on the current backend, both ways.
+            editor.add_index(Place, covering)
+            editor.remove_index(Place, covering)
+        name = connection.ops.quote_name('name')
+        if connection.vendor == 'postgresql':
+            self.assertIn('INCLUDE (%s)' % name, sql)
+            self.assertNotIn('tree_level', sql)
+        else:
+            # No `INCLUDE` off PostgreSQL: the columns extend the key instead.
+            self.assertIn('%s, %s' % (connection.ops.quote_name('path'), name), sql)
+
+    def test_partial_index_with_prefix(self):
+        index = PathIndex(
+            'path',
+            name='place_name_path_test_index',
+            level=False,
+            prefix=['name'],
+            condition=Q(name__startswith='N'),
+        )
+        self.assertEqual(index.deconstruct()[2]['prefix'], ['name'])
+        self.assertEqual(index.deconstruct()[2]['condition'], Q(name__startswith='N'))
+        with connection.schema_editor() as editor:
+            sql = str(index.create_sql(Place, editor))
+            editor.add_index(Place, index)
+            editor.remove_index(Place, index)
+        quote = connection.ops.quote_name
+        self.assertLess(sql.index(quote('name')), sql.index(quote('path')))
+        if connection.features.supports_partial_indexes:
+            self.assertIn('WHERE', sql)
+        else:
+            self.assertNotIn('WHERE', sql)
+
+    def test_narrow_index(self):
+        with self.assertRaises(ValueError):
+            PathIndex('path', name='place_path_narrow_test', narrow=True, level=False)
+        (index,) = PathField.get_indexes('place', 'path', narrow=True)
+        self.assertTrue(index.deconstruct()[2]['narrow'])
+        with connection.schema_editor() as editor:
+            sql = str(index.create_sql(Place, editor))
+        if connection.vendor == 'postgresql':
+            # The path itself is only stored by the `UNIQUE (path)` constraint.
+            self.assertTrue(sql.endswith('((tree_level("path")))'))
+        else:
+            self.assertTrue(sql.endswith('(%s)' % connection.ops.quote_name('path')))
+
+
 class TreeModelMixinExtraTest(CommonTest):
     def test_clean_with_unresolved_parent_pk(self):
         self.create_all_test_places()
@@ -3026,6 +3673,16 @@ class TreeHelpersTest(SimpleTestCase):
         self.assertEqual(tree_parent_prefix(b'\x02\x00'), b'')  # root
         self.assertEqual(tree_parent_prefix(b'\x02\x00\x03\x00'), b'\x02\x00')
 
+    def test_tree_prefixes(self):
+        from tree.sql.helpers import tree_prefixes
+
+        self.assertEqual(tree_prefixes(None), [])
+        self.assertEqual(tree_prefixes(b''), [])
+        self.assertEqual(
+            tree_prefixes(b'\x02\x00\x03\x04\x00'),
+            [b'\x02\x00', b'\x02\x00\x03\x04\x00'],
+        )
+
     def test_seg_width(self):
         from tree.sql.helpers import seg_width
 
@@ -3091,6 +3748,22 @@ class GenericMaintenanceTest(CommonTest):
         self.assertEqual(child.path.get_level(), 2)
         self.assertTrue(child.path.is_descendant_of(Place.objects.get(name='Aaa').path))
 
+    def test_historical_models_are_maintained_during_migrations(self):
+        # As in a `RunPython` data migration.
+        historical = ProjectState.from_apps(apps).apps.get_model('tests', 'Place')
+        signals.connect_historical_receivers()
+        try:
+            france = historical.objects.create(name='France')
+            historical.objects.create(name='Normandie', parent=france)
+        finally:
+            signals.disconnect_historical_receivers()
+        self.assertFalse(post_save.has_listeners(historical))
+        normandie = Place.objects.get(name='Normandie')
+        self.assertEqual(normandie.path.get_level(), 2)
+        self.assertTrue(
+            normandie.path.is_descendant_of(Place.objects.get(name='France').path)
+        )
+
     def test_bulk_update_reparents(self):
         self.create_all_test_places()
         normandie = Place.objects.get(name='Normandie')
@@ -3127,6 +3800,17 @@ class GenericMaintenanceTest(CommonTest):
         self.assertIsInstance(france.path.value, bytes)
         self.assertEqual(france.path.get_level(), 1)
 
+    def test_save_keeps_the_maintained_path(self):
+        # The path written by the maintenance stays on the instance instead of
+        # being re-read on the next access.
+        self.create_all_test_places()
+        eure = Place.objects.get(name='Eure')
+        eure.parent = Place.objects.get(name='Österreich')
+        eure.save()
+        self.assertIn('path', eure.__dict__)
+        self.assertEqual(eure.path.value, Place.objects.get(pk=eure.pk).path.value)
+        self.assertEqual(eure.path.get_level(), 2)
+
     def test_level_lookup_is_postgresql_only(self):
         # `__level` as a query filter needs a NUL-safe delimiter count, which has
         # no portable SQL form; `get_level()` / `is_root()` cover it in Python.
@@ -3135,8 +3819,9 @@ class GenericMaintenanceTest(CommonTest):
             list(Place.objects.filter(path__level=1))
 
     def test_lookups_require_a_constant_path(self):
-        # A column/expression right-hand operand is only supported on PostgreSQL.
-        for lookup in ('descendant_of', 'child_of', 'sibling_of'):
+        # A column/expression right-hand operand is only supported on PostgreSQL
+        # (but for `descendant_of`, see `annotate_descendant_count()`).
+        for lookup in ('child_of', 'sibling_of'):
             with self.assertRaises(NotImplementedError):
                 list(Place.objects.filter(**{f'path__{lookup}': F('path')}))
 
@@ -3170,6 +3855,631 @@ class GenericMaintenanceTest(CommonTest):
             Place.objects.filter(name='Manche').delete()
 
 
+class SignalsTest(SimpleTestCase):
+    def test_receivers_are_scoped_to_tree_models(self):
+        self.assertTrue(pre_save.has_listeners(Place))
+        self.assertTrue(post_save.has_listeners(Place))
+        # Saving a model without a `PathField` dispatches to no tree receiver.
+        with mock.patch.object(signals, '_path_fields') as path_fields:
+            pre_save.send(sender=MigrationRecorder.Migration, instance=None)
+            post_save.send(sender=MigrationRecorder.Migration, instance=None)
+        path_fields.assert_not_called()
+
+    def test_historical_models_are_not_connected(self):
+        # A migration renders its own copy of every model for each state.
+        historical = ProjectState.from_apps(apps).apps.get_model('tests', 'Place')
+        self.assertIsNot(historical, Place)
+        self.assertFalse(post_save.has_listeners(historical))
+        self.assertNotIn(historical, signals._path_fields_cache)
+
+
+class TreeCacheTest(CommonTest):
+    model = VersionedPlace
+
+    def names(self, rows):
+        return [row['name'] for row in rows]
+
+    def test_navigation_from_memory(self):
+        self.create_all_test_places()
+        cache = TreeCache(VersionedPlace, fields=['name'])
+        self.assertTrue(cache.refresh())
+        france = VersionedPlace.objects.get(name='France')
+        vienne = VersionedPlace.objects.get(name='Vienne')
+        count = VersionedPlace.objects.count()
+        descendants = self.names(france.get_descendants().values('name'))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(cache), count)
+            self.assertIn(france, cache)
+            self.assertEqual(cache.get(france)['name'], 'France')
+            self.assertEqual(self.names(cache.get_roots()), ['France', 'Österreich'])
+            self.assertEqual(
+                self.names(cache.get_children(france)),
+                ['Normandie', 'Poitou-Charentes'],
+            )
+            self.assertEqual(self.names(cache.get_descendants(france.pk)), descendants)
+            self.assertEqual(
+                self.names(cache.get_descendants(vienne, include_self=True)),
+                ['Vienne', 'Poitiers'],
+            )
+            self.assertEqual(
+                self.names(cache.get_ancestors(vienne)),
+                ['France', 'Poitou-Charentes'],
+            )
+            self.assertEqual(
+                self.names(cache.get_ancestors(vienne, include_self=True)),
+                ['France', 'Poitou-Charentes', 'Vienne'],
+            )
+            self.assertEqual(self.names(cache.get_siblings(france)), ['Österreich'])
+            self.assertEqual(
+                self.names(cache.get_siblings(france, include_self=True)),
+                ['France', 'Österreich'],
+            )
+            self.assertEqual(cache.get_level(vienne), 3)
+            self.assertEqual(self.names(cache.get_children(vienne)), ['Poitiers'])
+
+    def test_unknown_node(self):
+        cache = TreeCache(VersionedPlace)
+        with self.assertRaises(VersionedPlace.DoesNotExist):
+            cache.get_children(42)
+
+    def test_refresh_reloads_only_on_change(self):
+        self.create_all_test_places()
+        cache = TreeCache(VersionedPlace, fields=['name'])
+        cache.refresh()
+        version = cache.version
+        with self.assertNumQueries(1):
+            self.assertFalse(cache.refresh())
+
+        france = VersionedPlace.objects.get(name='France')
+        VersionedPlace.objects.create(name='Bretagne', parent=france)
+        self.assertTrue(cache.refresh())
+        self.assertGreater(cache.version, version)
+        self.assertIn('Bretagne', self.names(cache.get_children(france)))
+
+        # Any write counts, not only the tree columns.
+        france.name = 'République française'
+        france.save()
+        self.assertTrue(cache.refresh())
+        self.assertEqual(cache.get(france)['name'], 'République française')
+        VersionedPlace.objects.filter(name='Bretagne').update(name='Breizh')
+        self.assertTrue(cache.refresh())
+        VersionedPlace.objects.get(name='Poitou-Charentes').delete()
+        self.assertTrue(cache.refresh())
+        self.assertEqual(
+            self.names(cache.get_descendants(france)),
+            ['Breizh', 'Normandie', 'Eure', 'Manche', 'Seine-Maritime'],
+        )
+        self.assertFalse(cache.refresh())
+
+    def test_model_delete_bumps_the_version_once(self):
+        self.create_all_test_places()
+        version = get_tree_version(VersionedPlace)
+        # The collector deletes the whole subtree, one `post_delete` per row.
+        VersionedPlace.objects.get(name='Poitou-Charentes').delete()
+        self.assertEqual(get_tree_version(VersionedPlace), version + 1)
+        VersionedPlace.objects.filter(name='Normandie').delete()
+        self.assertEqual(get_tree_version(VersionedPlace), version + 2)
+        with transaction.atomic():
+            VersionedPlace.objects.get(name='Österreich').delete()
+            VersionedPlace.objects.all().delete()
+        # The PostgreSQL statement trigger bumps once per `DELETE`.
+        bumps = 2 if connection.vendor == 'postgresql' else 1
+        self.assertEqual(get_tree_version(VersionedPlace), version + 2 + bumps)
+
+    def test_requires_a_versioned_path_field(self):
+        self.assertFalse(Person._meta.get_field('path').versioned)
+        with self.assertRaises(ImproperlyConfigured):
+            TreeCache(Person)
+        self.assertEqual(get_tree_version(Person), 0)
+
+
+class TreeSnapshotTest(CommonTest):
+    model = VersionedPlace
+
+    def setUp(self):
+        super().setUp()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'places.tree')
+
+    def pks(self, *names):
+        if not hasattr(self, '_pks'):
+            self._pks = dict(VersionedPlace.objects.values_list('name', 'pk'))
+        return [self._pks[name] for name in names]
+
+    def test_navigation_from_the_mapped_file(self):
+        self.create_all_test_places()
+        version = export_tree_snapshot(VersionedPlace, self.filename)
+        self.assertEqual(version, get_tree_version(VersionedPlace))
+        france, vienne, poitiers = self.pks('France', 'Vienne', 'Poitiers')
+        descendants = list(
+            VersionedPlace.objects.get(pk=france)
+            .get_descendants()
+            .values_list('pk', flat=True)
+        )
+        count = VersionedPlace.objects.count()
+        with self.assertNumQueries(0), TreeSnapshot(self.filename) as snapshot:
+            self.assertEqual(snapshot.version, version)
+            self.assertEqual(len(snapshot), count)
+            self.assertIn(france, snapshot)
+            self.assertNotIn(-1, snapshot)
+            self.assertEqual(snapshot.get_roots(), self.pks('France', 'Österreich'))
+            self.assertEqual(
+                snapshot.get_children(france),
+                self.pks('Normandie', 'Poitou-Charentes'),
+            )
+            self.assertEqual(snapshot.get_descendants(france), descendants)
+            self.assertEqual(
+                snapshot.get_descendants(vienne, include_self=True),
+                [vienne, poitiers],
+            )
+            self.assertEqual(
+                snapshot.get_ancestors(vienne),
+                self.pks('France', 'Poitou-Charentes'),
+            )
+            self.assertEqual(
+                snapshot.get_ancestors(vienne, include_self=True)[-1], vienne
+            )
+            self.assertEqual(snapshot.get_siblings(france), self.pks('Österreich'))
+            self.assertEqual(snapshot.get_level(vienne), 3)
+            self.assertEqual(snapshot.get_children(poitiers), [])
+            with self.assertRaises(KeyError):
+                snapshot.get_children(-1)
+
+    def test_empty_tree(self):
+        export_tree_snapshot(VersionedPlace, self.filename)
+        with TreeSnapshot(self.filename) as snapshot:
+            self.assertEqual(len(snapshot), 0)
+            self.assertEqual(snapshot.get_roots(), [])
+
+    def test_refresh_on_version_change(self):
+        self.create_all_test_places()
+        self.assertTrue(refresh_tree_snapshot(VersionedPlace, self.filename))
+        with self.assertNumQueries(1):
+            self.assertFalse(refresh_tree_snapshot(VersionedPlace, self.filename))
+        snapshot = TreeSnapshot(self.filename)
+        self.addCleanup(snapshot.close)
+        self.assertFalse(snapshot.reopen())
+
+        france = VersionedPlace.objects.get(name='France')
+        bretagne = VersionedPlace.objects.create(name='Bretagne', parent=france)
+        self.assertTrue(refresh_tree_snapshot(VersionedPlace, self.filename))
+        self.assertNotIn(bretagne.pk, snapshot)
+        self.assertTrue(snapshot.reopen())
+        self.assertEqual(snapshot.version, get_tree_version(VersionedPlace))
+        self.assertIn(bretagne.pk, snapshot.get_children(france.pk))
+
+    def test_refresh_needs_a_versioned_field(self):
+        with self.assertRaises(ImproperlyConfigured):
+            refresh_tree_snapshot(Person, self.filename)
+
+
+class SubtreeChangedAtTest(CommonTest):
+    model = StampedPlace
+
+    def stamps(self):
+        return dict(StampedPlace.objects.values_list('name', 'subtree_changed_at'))
+
+    def assertStamped(self, before, names):
+        after = self.stamps()
+        self.assertEqual(
+            {name for name in after if after[name] != before.get(name)}, set(names)
+        )
+        return after
+
+    def test_writes_stamp_the_ancestors_or_self(self):
+        self.create_all_test_places()
+        stamps = self.stamps()
+        self.assertNotIn(None, stamps.values())
+
+        vienne = StampedPlace.objects.get(name='Vienne')
+        StampedPlace.objects.create(name='Châtellerault', parent=vienne)
+        stamps = self.assertStamped(
+            stamps, ['France', 'Poitou-Charentes', 'Vienne', 'Châtellerault']
+        )
+
+        poitiers = StampedPlace.objects.get(name='Poitiers')
+        poitiers.name = 'Poitiers (86)'
+        poitiers.save()
+        stamps = self.assertStamped(
+            stamps, ['France', 'Poitou-Charentes', 'Vienne', 'Poitiers (86)']
+        )
+
+        # A move stamps the old and the new ancestors.
+        vienne.parent = StampedPlace.objects.get(name='Österreich')
+        vienne.save()
+        stamps = self.assertStamped(
+            stamps, ['France', 'Poitou-Charentes', 'Österreich', 'Vienne']
+        )
+
+        StampedPlace.objects.filter(name='Eure').update(name='Eure (27)')
+        stamps = self.assertStamped(stamps, ['France', 'Normandie', 'Eure (27)'])
+
+        normandie = StampedPlace.objects.get(name='Normandie')
+        StampedPlace.objects.bulk_create([StampedPlace(name='Orne', parent=normandie)])
+        stamps = self.assertStamped(stamps, ['France', 'Normandie', 'Orne'])
+
+        # Off PostgreSQL, `bulk_create` rebuilt the paths.
+        StampedPlace.objects.get(name='Normandie').delete()
+        self.assertStamped(stamps, ['France'])
+
+    def test_subtree_etag(self):
+        self.create_all_test_places()
+        france = StampedPlace.objects.get(name='France')
+        osterreich = StampedPlace.objects.get(name='Österreich')
+        etags = [
+            get_subtree_etag(StampedPlace, place.pk) for place in (france, osterreich)
+        ]
+        self.assertTrue(etags[0].startswith(f'tests.stampedplace:{france.pk}:'))
+
+        StampedPlace.objects.create(name='Bretagne', parent=france)
+        self.assertNotEqual(get_subtree_etag(StampedPlace, france.pk), etags[0])
+        self.assertEqual(get_subtree_etag(StampedPlace, osterreich.pk), etags[1])
+
+        # Saving a stale instance writes its older stamp back, and stamps it
+        # again.
+        etag = get_subtree_etag(StampedPlace, france.pk)
+        france.save()
+        self.assertNotIn(get_subtree_etag(StampedPlace, france.pk), [etags[0], etag])
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_subtree_etag(StampedPlace, -1))
+        with self.assertRaises(ImproperlyConfigured):
+            get_subtree_etag(Person, france.pk)
+
+
+class AncestorIdsTest(CommonTest):
+    model = AncestorsPlace
+
+    def assertAncestorIds(self):
+        rows = list(
+            AncestorsPlace.objects.values_list('pk', 'parent_id', 'ancestor_ids')
+        )
+        parents = {pk: parent_id for pk, parent_id, _ in rows}
+        for pk, parent_id, ancestor_ids in rows:
+            expected = []
+            while parent_id is not None:
+                expected.insert(0, parent_id)
+                parent_id = parents[parent_id]
+            self.assertEqual(ancestor_ids, expected)
+
+    def test_ancestor_ids_follow_the_tree(self):
+        self.create_all_test_places()
+        self.assertAncestorIds()
+        france = AncestorsPlace.objects.get(name='France')
+        self.assertEqual(france.ancestor_ids, [])
+        self.assertEqual(
+            len(AncestorsPlace.objects.get(name='Poitiers').ancestor_ids), 3
+        )
+
+        # A move rewrites the arrays of the whole subtree.
+        vienne = AncestorsPlace.objects.get(name='Vienne')
+        vienne.parent = AncestorsPlace.objects.get(name='Österreich')
+        vienne.save()
+        self.assertAncestorIds()
+        AncestorsPlace.objects.filter(name='Vienne').update(parent=france)
+        self.assertAncestorIds()
+        AncestorsPlace.objects.bulk_create(
+            [
+                AncestorsPlace(
+                    name='Orne', parent=AncestorsPlace.objects.get(name='Normandie')
+                )
+            ]
+        )
+        self.assertAncestorIds()
+
+        # A direct write to the array is undone.
+        vienne = AncestorsPlace.objects.get(name='Vienne')
+        vienne.ancestor_ids = [france.pk, france.pk]
+        vienne.save()
+        self.assertAncestorIds()
+
+        # A rebuild fills the arrays in (e.g. once the column is added).
+        AncestorsPlace._base_manager.update(ancestor_ids=None)
+        AncestorsPlace.rebuild_paths()
+        self.assertAncestorIds()
+
+    def test_parent_without_array(self):
+        self.create_all_test_places()
+        # A parent whose array was cleared (the trigger restores it at once on
+        # PostgreSQL).
+        AncestorsPlace._base_manager.filter(name='Vienne').update(ancestor_ids=None)
+        vienne = AncestorsPlace.objects.get(name='Vienne')
+        chatellerault = AncestorsPlace.objects.create(
+            name='Châtellerault', parent=vienne
+        )
+        chatellerault.refresh_from_db()
+        pks = dict(AncestorsPlace.objects.values_list('name', 'pk'))
+        self.assertEqual(
+            chatellerault.ancestor_ids,
+            [pks['France'], pks['Poitou-Charentes'], pks['Vienne']],
+        )
+
+    def test_contains(self):
+        self.create_all_test_places()
+        france = AncestorsPlace.objects.get(name='France')
+        poitou = AncestorsPlace.objects.get(name='Poitou-Charentes')
+        self.assertQuerySetEqual(
+            AncestorsPlace.objects.filter(ancestor_ids__contains=[france.pk]),
+            france.get_descendants(),
+            ordered=False,
+        )
+        self.assertQuerySetEqual(
+            AncestorsPlace.objects.filter(
+                ancestor_ids__contains=[france.pk, poitou.pk]
+            ),
+            ['Vienne', 'Poitiers'],
+            transform=str,
+            ordered=False,
+        )
+        self.assertEqual(
+            AncestorsPlace.objects.filter(ancestor_ids__contains=[]).count(),
+            AncestorsPlace.objects.count(),
+        )
+
+
+class TreeRollupTest(CommonTest):
+    model = RollupPlace
+
+    def assertRollups(self):
+        rows = {
+            row['pk']: row
+            for row in RollupPlace.objects.values(
+                'pk',
+                'parent_id',
+                'population',
+                'subtree_size',
+                'subtree_population',
+                'large_place_count',
+            )
+        }
+        expected = {
+            pk: {'subtree_size': 0, 'subtree_population': 0, 'large_place_count': 0}
+            for pk in rows
+        }
+        for row in rows.values():
+            population = row['population'] or 0
+            pk = row['pk']
+            while pk is not None:
+                expected[pk]['subtree_size'] += 1
+                expected[pk]['subtree_population'] += population
+                expected[pk]['large_place_count'] += population >= 100000
+                pk = rows[pk]['parent_id']
+        for pk, row in rows.items():
+            self.assertEqual(
+                {name: row[name] for name in expected[pk]}, expected[pk], row
+            )
+
+    def test_rollups_follow_the_writes(self):
+        self.create_all_test_places()
+        self.assertRollups()
+        france = RollupPlace.objects.get(name='France')
+        self.assertEqual(france.subtree_size, 8)
+
+        RollupPlace.objects.filter(name='Poitiers').update(population=88000)
+        self.assertRollups()
+        poitiers = RollupPlace.objects.get(name='Poitiers')
+        poitiers.population = 150000
+        poitiers.save()
+        self.assertRollups()
+        self.assertEqual(RollupPlace.objects.get(name='France').large_place_count, 1)
+
+        # A move carries the whole subtree total over.
+        vienne = RollupPlace.objects.get(name='Vienne')
+        vienne.parent = RollupPlace.objects.get(name='Österreich')
+        vienne.save()
+        self.assertRollups()
+        self.assertEqual(
+            RollupPlace.objects.get(name='Österreich').subtree_population, 150000
+        )
+        RollupPlace.objects.filter(name='Vienne').update(parent=france)
+        self.assertRollups()
+
+        # Saving a stale instance doesn't write its outdated totals back.
+        france.name = 'République française'
+        france.save()
+        self.assertRollups()
+
+        places = list(RollupPlace.objects.filter(name__in=['Eure', 'Manche']))
+        for place in places:
+            place.population = 600000
+        RollupPlace.objects.bulk_update(places, ['population'])
+        self.assertRollups()
+        RollupPlace.objects.bulk_create(
+            [RollupPlace(name='Orne', parent=places[0].parent, population=280000)]
+        )
+        self.assertRollups()
+        RollupPlace.objects.get(name='Normandie').delete()
+        self.assertRollups()
+
+        # A rebuild recomputes them all.
+        RollupPlace._base_manager.update(subtree_size=None, subtree_population=0)
+        RollupPlace.rebuild_paths()
+        self.assertRollups()
+
+    def test_tree_rollup(self):
+        with self.assertRaises(ValueError):
+            TreeRollup('subtree_size', 'avg')
+        with self.assertRaises(ValueError):
+            TreeRollup('subtree_size', 'sum')
+        with self.assertRaises(ValueError):
+            TreeRollup('subtree_size', 'count', 'population')
+        rollup = TreeRollup('large', 'count', filter=Q(population__gte=1))
+        path, args, kwargs = rollup.deconstruct()
+        self.assertEqual(path, 'tree.rollups.TreeRollup')
+        self.assertEqual(TreeRollup(*args, **kwargs), rollup)
+        self.assertEqual(hash(TreeRollup(*args, **kwargs)), hash(rollup))
+        self.assertNotEqual(TreeRollup('large', 'count'), rollup)
+        self.assertEqual(len({rollup, TreeRollup('large', 'count'), rollup}), 2)
+
+
+class TreeMemoTest(CommonTest):
+    def test_navigation_is_memoized(self):
+        self.create_all_test_places()
+        vienne = Place.objects.get(name='Vienne')
+        same_vienne = Place.objects.get(name='Vienne')
+        with memoize_tree():
+            with self.assertNumQueries(1):
+                ancestors = list(vienne.get_ancestors())
+                self.assertEqual(list(same_vienne.get_ancestors()), ancestors)
+            self.assertIs(vienne.get_ancestors(), same_vienne.get_ancestors())
+            self.assertIsNot(
+                vienne.get_ancestors(), vienne.get_ancestors(include_self=True)
+            )
+            with self.assertNumQueries(1):
+                self.assertFalse(vienne.is_leaf())
+                self.assertFalse(same_vienne.is_leaf())
+            # A caller's queryset is not a memo key.
+            queryset = Place.objects.all()
+            self.assertIsNot(
+                vienne.get_siblings(queryset=queryset),
+                vienne.get_siblings(queryset=queryset),
+            )
+        self.assertIsNot(vienne.get_ancestors(), vienne.get_ancestors())
+
+    def test_writes_invalidate_the_memo(self):
+        self.create_all_test_places()
+        france = Place.objects.get(name='France')
+        with memoize_tree():
+            self.assertEqual(len(france.get_children()), 2)
+            Place.objects.create(name='Bretagne', parent=france)
+            self.assertEqual(len(france.get_children()), 3)
+            Place.objects.filter(name='Bretagne').update(parent=None)
+            self.assertEqual(len(france.get_children()), 2)
+            Place.objects.filter(name='Normandie').delete()
+            self.assertEqual(len(france.get_children()), 1)
+            # Through the deletion collector, without the queryset.
+            Place.objects.get(name='Poitou-Charentes').delete()
+            self.assertEqual(len(france.get_children()), 0)
+
+    def test_middleware(self):
+        self.create_all_test_places()
+        vienne = Place.objects.get(name='Vienne')
+        request = RequestFactory().get('/')
+
+        def view(request):
+            return vienne.get_children() is vienne.get_children()
+
+        async def async_view(request):
+            return await sync_to_async(view)(request)
+
+        self.assertIs(TreeMemoMiddleware(view)(request), True)
+        self.assertIs(async_to_sync(TreeMemoMiddleware(async_view))(request), True)
+        self.assertIs(view(request), False)
+
+
+class SubtreeCacheTest(SimpleTestCase):
+    def test_invalidate_evicts_intersecting_subtrees(self):
+        cache = SubtreeCache()
+        for key in (b'\x02\x00', b'\x02\x00\x02\x00', b'\x02\x00\x03\x00', b'\x03\x00'):
+            cache.set(key, key.hex())
+        cache.set(b'\x02\x00\x02\x00\x05\x00', 'leaf')
+        self.assertEqual(len(cache), 5)
+        self.assertEqual(cache.get(b'\x03\x00'), '0300')
+
+        # Its ancestors and descendants, not its siblings nor other trees.
+        self.assertEqual(cache.invalidate(b'\x02\x00\x02\x00'), 3)
+        self.assertNotIn(b'\x02\x00', cache)
+        self.assertNotIn(b'\x02\x00\x02\x00\x05\x00', cache)
+        self.assertIn(b'\x02\x00\x03\x00', cache)
+        self.assertIn(b'\x03\x00', cache)
+        self.assertEqual(cache.invalidate(b'\x04\x00'), 0)
+
+        # The empty prefix is the whole tree.
+        cache.set(Path(PathField(), b'\x04\x00'), 'path key')
+        self.assertEqual(cache.get(b'\x04\x00'), 'path key')
+        self.assertEqual(cache.invalidate(b''), 3)
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate_evicts_the_whole_tree_entry(self):
+        cache = SubtreeCache()
+        for key in (b'', b'\x02\x00', b'\x03\x00', b'\x03\x00\x02\x00'):
+            cache.set(key, key.hex())
+        # The empty prefix is an ancestor of every path.
+        self.assertEqual(cache.invalidate(b'\x03\x00\x01\x00'), 2)
+        self.assertEqual(sorted(cache._data), [b'\x02\x00', b'\x03\x00\x02\x00'])
+        self.assertEqual(cache._keys, sorted(cache._data))
+        cache.set(b'', 'whole tree')
+        self.assertEqual(cache.invalidate(b'\x03\x00\x02\x00\x05\x00'), 2)
+        self.assertEqual(cache._keys, [b'\x02\x00'])
+        self.assertEqual(list(cache._data), cache._keys)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY is PostgreSQL-only.')
+class TreeListenerTest(CommonTest):
+    model = NotifyPlace
+
+    def listen(self, fail_first=False):
+        notified = []
+        received = Event()
+
+        def callback(prefix):
+            notified.append(prefix)
+            received.set()
+            if fail_first and len(notified) == 1:
+                raise ValueError(prefix)
+
+        listener = TreeListener('tests_notifyplace', callback, timeout=0.1)
+        listener.start()
+        self.addCleanup(listener.join)
+        self.addCleanup(listener.stop)
+        self.assertTrue(listener.listening.wait(5))
+        return notified, received
+
+    def test_trigger_notifies_written_paths(self):
+        self.create_all_test_places()
+        france = NotifyPlace.objects.get(name='France')
+        vienne = NotifyPlace.objects.get(name='Vienne')
+        notified, received = self.listen()
+
+        bretagne = NotifyPlace.objects.create(name='Bretagne', parent=france)
+        self.assertTrue(received.wait(5))
+        self.assertEqual(notified, [bretagne.path.value])
+
+        # A move notifies the old and the new path, not the moved descendants.
+        received.clear()
+        old_path = vienne.path.value
+        vienne.parent = bretagne
+        vienne.save()
+        vienne.refresh_from_db()
+        self.assertTrue(received.wait(5))
+        while len(notified) < 3:
+            received.clear()
+            self.assertTrue(received.wait(5))
+        self.assertEqual(notified[1:], [old_path, vienne.path.value])
+
+    def test_callback_errors_are_logged(self):
+        notified, received = self.listen(fail_first=True)
+        with self.assertLogs('tree.notify', 'ERROR'):
+            france = self.create_place('France')
+            normandie = self.create_place('Normandie', france)
+            while len(notified) < 2:
+                received.clear()
+                self.assertTrue(received.wait(5))
+        self.assertEqual(notified, [france.path.value, normandie.path.value])
+
+    def test_reconnects_when_the_connection_is_lost(self):
+        notified, received = self.listen()
+        with self.assertLogs('tree.notify', 'ERROR'):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                    "WHERE query LIKE 'LISTEN %%tests_notifyplace%%'"
+                )
+            # The notifications sent meanwhile are lost: the whole tree is stale.
+            self.assertTrue(received.wait(5))
+        self.assertEqual(notified, [b''])
+        received.clear()
+        france = self.create_place('France')
+        self.assertTrue(received.wait(5))
+        self.assertEqual(notified, [b'', france.path.value])
+
+    def test_listener_is_postgresql_only(self):
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            with self.assertRaises(NotImplementedError):
+                TreeListener('tests_notifyplace', print)
+
+
 class WatchedNamesTest(SimpleTestCase):
     def test_skips_pk_in_order_by(self):
         from tree.query import _watched_names
@@ -0,0 +1,204 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import tree.fields
+import tree.models
+import tree.rollups
+from tree.operations import CreateTreeTrigger
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('tests', '0002_test_operations'),
+        ('tree', '0004_tree_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AncestorsPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=50)),
+                ('ancestor_ids', tree.fields.AncestorsField(editable=False)),
+                (
+                    'path',
+                    tree.fields.PathField(
+                        ancestors_field_name='ancestor_ids', order_by=['name']
+                    ),
+                ),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='tests.ancestorsplace',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+            bases=(tree.models.TreeModelMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='NotifyPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=50)),
+                ('path', tree.fields.PathField(order_by=['name'])),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='tests.notifyplace',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+            bases=(tree.models.TreeModelMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='RollupPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=50)),
+                ('population', models.IntegerField(blank=True, null=True)),
+                ('subtree_size', models.IntegerField(editable=False, null=True)),
+                (
+                    'subtree_population',
+                    models.BigIntegerField(editable=False, null=True),
+                ),
+                ('large_place_count', models.IntegerField(editable=False, null=True)),
+                (
+                    'path',
+                    tree.fields.PathField(
+                        order_by=['name'],
+                        rollups=[
+                            tree.rollups.TreeRollup('subtree_size', 'count'),
+                            tree.rollups.TreeRollup(
+                                'subtree_population', 'sum', 'population'
+                            ),
+                            tree.rollups.TreeRollup(
+                                'large_place_count',
+                                'count',
+                                filter=models.Q(('population__gte', 100000)),
+                            ),
+                        ],
+                    ),
+                ),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='tests.rollupplace',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+            bases=(tree.models.TreeModelMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='StampedPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=50)),
+                ('subtree_changed_at', models.DateTimeField(editable=False, null=True)),
+                (
+                    'path',
+                    tree.fields.PathField(
+                        changed_at_field_name='subtree_changed_at', order_by=['name']
+                    ),
+                ),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='tests.stampedplace',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+            bases=(tree.models.TreeModelMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='VersionedPlace',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=50)),
+                ('path', tree.fields.PathField(order_by=['name'], versioned=True)),
+                (
+                    'parent',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='tests.versionedplace',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+            bases=(tree.models.TreeModelMixin, models.Model),
+        ),
+        CreateTreeTrigger('tests.AncestorsPlace'),
+        CreateTreeTrigger('tests.NotifyPlace', notify='tests_notifyplace'),
+        CreateTreeTrigger('tests.RollupPlace'),
+        CreateTreeTrigger('tests.StampedPlace'),
+        CreateTreeTrigger('tests.VersionedPlace'),
+    ]
@@ -1,17 +1,22 @@
 import uuid
 
 from django.db.models import (
+    BigIntegerField,
     CharField,
     ForeignKey,
     CASCADE,
+    DateTimeField,
+    IntegerField,
     PROTECT,
+    Q,
     SET_NULL,
     SmallIntegerField,
     UUIDField,
 )
 
-from tree.fields import PathField
+from tree.fields import AncestorsField, PathField
 from tree.models import TreeModel
+from tree.rollups import TreeRollup
 
 
 class Place(TreeModel):
@@ -115,6 +120,90 @@ class ProtectPlace(TreeModel):
         ordering = ['path']
 
 
+class VersionedPlace(TreeModel):
+    """A tree whose writes bump its `TreeVersion`."""
+
+    name = CharField(max_length=50)
+    parent = ForeignKey('self', null=True, blank=True, on_delete=CASCADE)
+    path = PathField(order_by=['name'], versioned=True)
+
+    class Meta:
+        ordering = ['path']
+
+    def __str__(self):
+        return self.name
+
+
+class NotifyPlace(TreeModel):
+    """A tree whose trigger notifies the written paths on the
+    `tests_notifyplace` channel."""
+
+    name = CharField(max_length=50)
+    parent = ForeignKey('self', null=True, blank=True, on_delete=CASCADE)
+    path = PathField(order_by=['name'])
+
+    class Meta:
+        ordering = ['path']
+
+    def __str__(self):
+        return self.name
+
+
+class StampedPlace(TreeModel):
+    """A tree stamping the ancestors-or-self of every written row."""
+
+    name = CharField(max_length=50)
+    parent = ForeignKey('self', null=True, blank=True, on_delete=CASCADE)
+    subtree_changed_at = DateTimeField(null=True, editable=False)
+    path = PathField(order_by=['name'], changed_at_field_name='subtree_changed_at')
+
+    class Meta:
+        ordering = ['path']
+
+    def __str__(self):
+        return self.name
+
+
+class AncestorsPlace(TreeModel):
+    """A tree denormalizing its ancestor ids into an array."""
+
+    name = CharField(max_length=50)
+    parent = ForeignKey('self', null=True, blank=True, on_delete=CASCADE)
+    ancestor_ids = AncestorsField()
+    path = PathField(order_by=['name'], ancestors_field_name='ancestor_ids')
+
+    class Meta:
+        ordering = ['path']
+
+    def __str__(self):
+        return self.name
+
+
+class RollupPlace(TreeModel):
+    """A tree maintaining aggregates over each subtree."""
+
+    name = CharField(max_length=50)
+    parent = ForeignKey('self', null=True, blank=True, on_delete=CASCADE)
+    population = IntegerField(null=True, blank=True)
+    subtree_size = IntegerField(null=True, editable=False)
+    subtree_population = BigIntegerField(null=True, editable=False)
+    large_place_count = IntegerField(null=True, editable=False)
+    path = PathField(
+        order_by=['name'],
+        rollups=[
+            TreeRollup('subtree_size', 'count'),
+            TreeRollup('subtree_population', 'sum', 'population'),
+            TreeRollup('large_place_count', 'count', filter=Q(population__gte=100000)),
+        ],
+    )
+
+    class Meta:
+        ordering = ['path']
+
+    def __str__(self):
+        return self.name
+
+
 class WeirdTableNamePlace(TreeModel):
     """A tree stored in a table whose name requires SQL quoting.
 
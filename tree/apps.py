@@ -1,8 +1,9 @@
 from django.apps import AppConfig
 
-from .fields import PathField
+from .fields import AncestorsField, PathField
 from .lookups import (
     AncestorOf,
+    AncestorsContains,
     SiblingOf,
     ChildOf,
     DescendantOf,
@@ -28,5 +29,7 @@ class TreeAppConfig(AppConfig):
 
         PathField.register_lookup(Level)
 
+        AncestorsField.register_lookup(AncestorsContains)
+
         # Loads signals
         from . import signals  # noqa: F401
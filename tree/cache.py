@@ -0,0 +1,229 @@
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterator, Sequence
+from typing import Any, cast
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router
+from django.db.models import Model
+
+from .query import _get_path_field
+from .sql.helpers import tree_parent_prefix, tree_prefixes, tree_upper
+from .types import Path
+
+
+def get_tree_version(model: type[Model], using: str | None = None) -> int:
+    """The `TreeVersion` counter of ``model``'s table: one primary-key lookup,
+    0 before the first versioned write."""
+    from .models import TreeVersion
+
+    version = (
+        TreeVersion.objects.using(using or router.db_for_read(model))
+        .filter(name=model._meta.db_table)
+        .values_list('version', flat=True)
+        .first()
+    )
+    return version or 0
+
+
+def get_subtree_etag(
+    model: type[Model],
+    pk: Any,
+    path_field: str | None = None,
+    using: str | None = None,
+) -> str | None:
+    """An ETag (or cache key) for the subtree of the node ``pk``, which changes
+    with every write in that subtree: one primary-key lookup of the
+    `changed_at_field` of ``model``'s `PathField`. ``None`` if there is no such
+    node."""
+    changed_at_field = _get_path_field(model, path_field).changed_at_field
+    if changed_at_field is None:
+        raise ImproperlyConfigured(
+            'A subtree ETag needs a `PathField(changed_at_field_name=...)`.'
+        )
+    rows = (
+        model._base_manager.using(using or router.db_for_read(model))
+        .filter(pk=pk)
+        .values_list(changed_at_field.attname, flat=True)
+    )
+    for changed_at in rows[:1]:
+        stamp = 'unchanged' if changed_at is None else changed_at.isoformat()
+        return f'{model._meta.label_lower}:{pk}:{stamp}'
+    return None
+
+
+class _Snapshot:
+    # Immutable once built: `TreeCache.refresh()` swaps in a new one, so a
+    # concurrent reader keeps a consistent view.
+    __slots__ = ('paths', 'positions', 'rows', 'version')
+
+    def __init__(
+        self, version: int, paths: list[bytes], rows: list[dict[str, Any]], pk: str
+    ) -> None:
+        self.version = version
+        self.paths = paths
+        self.rows = rows
+        self.positions = {row[pk]: i for i, row in enumerate(rows)}
+
+
+class TreeCache:
+    """An in-process, read-only mirror of a small, hot tree.
+
+    Loads ``(pk, path, *fields)`` of every node once, sorted by path, and then
+    answers the navigation methods from memory, by bisecting the sorted paths:
+    no query at all. The nodes are returned as ``values()`` dicts, shared
+    between calls, so they must not be mutated.
+
+    The model's `PathField` must be ``versioned``: every write bumps the table's
+    `TreeVersion`, and `refresh()` (one primary-key lookup, e.g. once per
+    request) reloads the mirror only when that counter moved.
+    """
+
+    def __init__(
+        self,
+        model: type[Model],
+        fields: Sequence[str] = (),
+        path_field: str | None = None,
+        using: str | None = None,
+    ) -> None:
+        self.model = model
+        self.field = _get_path_field(model, path_field)
+        if not self.field.versioned:
+            raise ImproperlyConfigured(
+                '`TreeCache` needs a `PathField(versioned=True)` to tell when '
+                'the tree changed.'
+            )
+        self.fields = tuple(fields)
+        self.using = using
+        self._snapshot: _Snapshot | None = None
+
+    @property
+    def db(self) -> str:
+        return self.using or router.db_for_read(self.model)
+
+    @property
+    def version(self) -> int | None:
+        """The `TreeVersion` the mirror was loaded at (``None`` before)."""
+        snapshot = self._snapshot
+        return None if snapshot is None else snapshot.version
+
+    def refresh(self) -> bool:
+        """Reloads the mirror if the tree changed since it was loaded, and
+        returns whether it did."""
+        version = get_tree_version(self.model, self.db)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return False
+        self._load(version)
+        return True
+
+    def _load(self, version: int) -> None:
+        # The version is read before the rows: a write in between leaves the
+        # mirror at the older version, so the next `refresh()` reloads it.
+        attname = self.field.attname
+        rows = list(
+            self.model._base_manager.using(self.db)
+            .filter(**{f'{attname}__isnull': False})
+            .order_by(attname)
+            .values('pk', attname, *self.fields)
+        )
+        paths = []
+        for row in rows:
+            row[attname] = Path._as_bytes(row[attname])
+            paths.append(row[attname])
+        self._snapshot = _Snapshot(version, paths, rows, 'pk')
+
+    def _get_snapshot(self) -> _Snapshot:
+        if self._snapshot is None:
+            self.refresh()
+        return self._snapshot  # type: ignore[return-value]
+
+    def _position(self, snapshot: _Snapshot, node: Any) -> int:
+        pk = node.pk if isinstance(node, Model) else node
+        try:
+            return snapshot.positions[pk]
+        except KeyError:
+            raise self.model.DoesNotExist(  # type: ignore[attr-defined]
+                '%s %r is not in the tree cache.' % (self.model._meta.object_name, pk)
+            ) from None
+
+    def _children(self, snapshot: _Snapshot, prefix: bytes) -> list[dict[str, Any]]:
+        # Each child is followed by its own subtree, so jump straight past it
+        # (to its `tree_upper`) to reach the next child: one bisection per
+        # child, whatever the size of their subtrees.
+        paths = snapshot.paths
+        lo = bisect_right(paths, prefix)
+        upper = tree_upper(prefix)
+        hi = len(paths) if upper is None else bisect_left(paths, upper, lo)
+        children = []
+        while lo < hi:
+            children.append(snapshot.rows[lo])
+            # A stored path is never empty, so it has an upper bound.
+            lo = bisect_left(paths, cast(bytes, tree_upper(paths[lo])), lo + 1, hi)
+        return children
+
+    def __len__(self) -> int:
+        return len(self._get_snapshot().rows)
+
+    def __contains__(self, node: Any) -> bool:
+        pk = node.pk if isinstance(node, Model) else node
+        return pk in self._get_snapshot().positions
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self._get_snapshot().rows)
+
+    def get(self, node: Any) -> dict[str, Any]:
+        snapshot = self._get_snapshot()
+        return snapshot.rows[self._position(snapshot, node)]
+
+    def get_level(self, node: Any) -> int:
+        snapshot = self._get_snapshot()
+        return snapshot.paths[self._position(snapshot, node)].count(0)
+
+    def get_roots(self) -> list[dict[str, Any]]:
+        return self._children(self._get_snapshot(), b'')
+
+    def get_children(self, node: Any) -> list[dict[str, Any]]:
+        snapshot = self._get_snapshot()
+        return self._children(snapshot, snapshot.paths[self._position(snapshot, node)])
+
+    def get_descendants(
+        self, node: Any, include_self: bool = False
+    ) -> list[dict[str, Any]]:
+        snapshot = self._get_snapshot()
+        position = self._position(snapshot, node)
+        upper = tree_upper(snapshot.paths[position])
+        end = (
+            len(snapshot.paths)
+            if upper is None
+            else bisect_left(snapshot.paths, upper, position)
+        )
+        return snapshot.rows[position if include_self else position + 1 : end]
+
+    def get_ancestors(
+        self, node: Any, include_self: bool = False
+    ) -> list[dict[str, Any]]:
+        """Root first, like `Path.get_ancestors()`."""
+        snapshot = self._get_snapshot()
+        position = self._position(snapshot, node)
+        prefixes = tree_prefixes(snapshot.paths[position])
+        if not include_self:
+            prefixes.pop()
+        ancestors = []
+        for prefix in prefixes:
+            i = bisect_left(snapshot.paths, prefix, 0, position + 1)
+            if i <= position and snapshot.paths[i] == prefix:
+                ancestors.append(snapshot.rows[i])
+        return ancestors
+
+    def get_siblings(
+        self, node: Any, include_self: bool = False
+    ) -> list[dict[str, Any]]:
+        snapshot = self._get_snapshot()
+        position = self._position(snapshot, node)
+        node_row = snapshot.rows[position]
+        siblings = self._children(
+            snapshot, tree_parent_prefix(snapshot.paths[position])
+        )
+        if include_self:
+            return siblings
+        return [row for row in siblings if row is not node_row]
@@ -5,9 +5,12 @@ from typing import Any, cast
 
 from django.core.exceptions import ImproperlyConfigured
 from django.db import DEFAULT_DB_ALIAS, connections, transaction
-from django.db.models import BinaryField, Field, F, Index, Model
+from django.db.models import BinaryField, Field, F, Index, Model, Q
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import gettext_lazy as _
 
+from .memo import invalidate_tree_memo
+from .rollups import TreeRollup
 from .sql import is_trigger_backend
 from .types import Path
 
@@ -40,54 +43,166 @@ class PathIndex(Index):
     into index scans over just the matching rows. The other backends have no such
     function -- a functional index could not even be rendered -- and their
     lookups only need the path range, which a plain column index serves.
+
+    ``include`` makes it a covering index, so listings that only read the path
+    and those columns (menus, sitemaps, `TreeChoiceField`) become index-only
+    scans: PostgreSQL stores them as ``INCLUDE`` payload, the other backends
+    (which have no ``INCLUDE``) append them to the key instead, which a range
+    scan on the leading path serves just as well. ``level=False`` drops the
+    leading ``level`` on PostgreSQL, for a path-ordered index that descendant
+    range scans can walk.
+
+    ``prefix`` columns lead the key (e.g. ``(status, path)``) and ``condition``
+    makes it a partial index, so a subtree restricted to a predicate -- "published
+    pages under this section" -- is a range scan over a compact index holding just
+    the matching rows instead of the whole subtree filtered on the table. MySQL
+    and Oracle have no partial indexes, so there the condition is dropped and the
+    index covers every row (still correct, only larger).
+
+    ``narrow=True`` keeps only ``level`` in the PostgreSQL key. There the whole
+    path is already stored in the btree backing the trigger's ``UNIQUE (path)``
+    constraint, which serves the range scans; a narrow integer index next to it
+    serves ``__level`` and, bitmap-AND-ed with that range, `child_of` /
+    `sibling_of`, without storing every path a second time. The other backends
+    have no such constraint, so this index is their only path index and keeps the
+    path either way.
     """
 
-    def __init__(self, path_field_name: str, *, name: str) -> None:
+    def __init__(
+        self,
+        path_field_name: str,
+        *,
+        name: str,
+        include: Sequence[str] = (),
+        level: bool = True,
+        prefix: Sequence[str] = (),
+        condition: Q | None = None,
+        narrow: bool = False,
+    ) -> None:
+        if narrow and not level:
+            raise ValueError('A narrow `PathIndex` indexes the level.')
         self.path_field_name = path_field_name
+        self.level = level
+        self.prefix = list(prefix)
+        self.narrow = narrow
+        expressions = [F(field_name) for field_name in self.prefix]
+        if level:
+            expressions.append(F(f'{path_field_name}__level'))
+        if not narrow:
+            expressions.append(F(path_field_name))
         super().__init__(
-            F(f'{path_field_name}__level'),
-            F(path_field_name),
+            *expressions,
             name=name,
+            include=list(include) or None,
+            condition=condition,
         )
 
     def deconstruct(self) -> tuple[str, Sequence[Any], dict[str, Any]]:
         # Stable across backends (the per-vendor choice happens at DDL time, in
         # `create_sql`), so the same migration is correct everywhere.
+        kwargs: dict[str, Any] = {'name': self.name}
+        if self.include:
+            kwargs['include'] = list(self.include)
+        if not self.level:
+            kwargs['level'] = False
+        if self.prefix:
+            kwargs['prefix'] = self.prefix
+        if self.condition is not None:
+            kwargs['condition'] = self.condition
+        if self.narrow:
+            kwargs['narrow'] = True
         return (
             f'{self.__class__.__module__}.{self.__class__.__qualname__}',
             (self.path_field_name,),
-            {'name': self.name},
+            kwargs,
         )
 
     def create_sql(
         self, model: type[Model], schema_editor: Any, using: str = '', **kwargs: Any
     ) -> Any:
-        if schema_editor.connection.vendor == 'postgresql':
+        connection = schema_editor.connection
+        if connection.vendor == 'postgresql':
             return super().create_sql(model, schema_editor, using=using, **kwargs)
-        plain = Index(fields=[self.path_field_name], name=self.name)
+        plain = Index(
+            fields=[*self.prefix, self.path_field_name, *self.include],
+            name=self.name,
+            condition=(
+                self.condition if connection.features.supports_partial_indexes else None
+            ),
+        )
         return plain.create_sql(model, schema_editor, using=using, **kwargs)
 
 
+class PathDescriptor(DeferredAttribute):
+    """Wraps the raw path stored on an instance in a `Path` on first access.
+
+    A data descriptor (it defines ``__set__``), so it sees every read even once
+    the value is in the instance ``__dict__``: a lazy `PathField` leaves raw
+    bytes there, and only the rows whose path is actually read pay for a `Path`.
+    """
+
+    def __get__(self, instance: Model | None, cls: Any = None) -> Any:
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if not isinstance(value, Path):
+            value = self.field.to_python(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance: Model, value: Any) -> None:
+        instance.__dict__[self.field.attname] = value
+
+
 class PathField(BinaryField):
     description = _('Tree path')
 
     @classmethod
-    def get_indexes(cls, table_name: str, path_field_name: str) -> list[Index]:
+    def get_indexes(
+        cls,
+        table_name: str,
+        path_field_name: str,
+        include: Sequence[str] = (),
+        narrow: bool = False,
+    ) -> list[Index]:
         # Ancestor/descendant lookups are whole-path range comparisons, served by
         # the btree index backing the path itself. `child_of`/`sibling_of` add a
         # depth restriction on top of that range; on PostgreSQL `PathIndex` makes
         # depth + range seekable with a functional `(level, path)` index, while the
         # other backends fall back to a plain `(path)` range index (see
-        # `PathIndex`).
-        return [
+        # `PathIndex`). `narrow=True` trades that seek for disk space: a level-only
+        # index on PostgreSQL, so the path is stored in one btree instead of two.
+        indexes: list[Index] = [
             PathIndex(
                 path_field_name,
                 name=f'{table_name}_{path_field_name}_level_index',
+                narrow=narrow,
             ),
         ]
+        if include:
+            # Listings of `include` columns over a subtree then never touch the
+            # table: a path-ordered covering index serves both the descendant
+            # range and (filtering the depth on the indexed path) the children.
+            indexes.append(
+                PathIndex(
+                    path_field_name,
+                    name=f'{table_name}_{path_field_name}_covering_index',
+                    include=include,
+                    level=False,
+                )
+            )
+        return indexes
 
     def __init__(
-        self, *args: Any, parent_field_name: str = 'parent', **kwargs: Any
+        self,
+        *args: Any,
+        parent_field_name: str = 'parent',
+        lazy: bool = False,
+        versioned: bool = False,
+        changed_at_field_name: str | None = None,
+        ancestors_field_name: str | None = None,
+        rollups: Sequence[TreeRollup] = (),
+        **kwargs: Any,
     ) -> None:
         for kwarg in ('default', 'null', 'unique'):
             if kwarg in kwargs:
@@ -99,6 +214,24 @@ class PathField(BinaryField):
 
         self.order_by: list[str] = list(kwargs.pop('order_by', []))
         self.parent_field_name = parent_field_name
+        # Keeps fetched paths as raw bytes: model instances wrap them in a `Path`
+        # only when the path is read, and `values()`/`values_list()` return the
+        # bytes themselves (no `Path` per row, e.g. for large exports).
+        self.lazy = lazy
+        # Bumps the table's `TreeVersion` counter on every write (from the
+        # trigger on PostgreSQL, from the ORM elsewhere), so that an in-process
+        # `TreeCache` can tell cheaply whether it is stale.
+        self.versioned = versioned
+        # A `DateTimeField` stamped with the time of the latest write anywhere
+        # in each node's subtree (from the trigger on PostgreSQL, from the ORM
+        # elsewhere), so that a cached subtree is validated by reading one row.
+        self.changed_at_field_name = changed_at_field_name
+        # An `AncestorsField` holding the primary keys of each node's
+        # ancestors (from the trigger on PostgreSQL, from the ORM elsewhere),
+        # so that "the subtree of X" is a containment test on one column.
+        self.ancestors_field_name = ancestors_field_name
+        # Subtree aggregates stored on every node (see `TreeRollup`).
+        self.rollups = list(rollups)
 
         super(PathField, self).__init__(*args, **kwargs)
 
@@ -106,12 +239,39 @@ class PathField(BinaryField):
     def parent_field(self) -> Field:
         return cast(Field, self.model._meta.get_field(self.parent_field_name))
 
+    @property
+    def changed_at_field(self) -> Field | None:
+        if self.changed_at_field_name is None:
+            return None
+        return cast(Field, self.model._meta.get_field(self.changed_at_field_name))
+
+    @property
+    def ancestors_field(self) -> Field | None:
+        if self.ancestors_field_name is None:
+            return None
+        return cast(Field, self.model._meta.get_field(self.ancestors_field_name))
+
+    @property
+    def db_returning(self) -> bool:  # type: ignore[override]
+        # PostgreSQL computes the path in a `BEFORE INSERT` trigger, so
+        # `INSERT ... RETURNING` hands it back along with the pk and a new node
+        # needs no extra query before navigating. Elsewhere the maintenance sets
+        # it on the instance after the insert (and Oracle can't bind a returned
+        # `RAW`). Django caches the answer in `Options.db_returning_fields` for
+        # every database, so with several, all must be PostgreSQL; otherwise the
+        # path is re-read on access after an insert on PostgreSQL.
+        return all(is_trigger_backend(alias) for alias in connections)
+
     def contribute_to_class(
         self, cls: type[Model], name: str, *args: Any, **kwargs: Any
     ) -> None:
         if name in self.order_by:
             raise ImproperlyConfigured('`PathField.order_by` cannot reference itself.')
         super(PathField, self).contribute_to_class(cls, name, *args, **kwargs)
+        if self.lazy:
+            # Only a lazy field leaves raw bytes on its instances; the others
+            # keep Django's plain (non-data) descriptor and its cheaper reads.
+            setattr(cls, self.attname, PathDescriptor(self))
 
     def deconstruct(self) -> tuple[str, str, Sequence[Any], dict[str, Any]]:
         name, path, args, kwargs = super(PathField, self).deconstruct()
@@ -121,6 +281,16 @@ class PathField(BinaryField):
             kwargs['order_by'] = self.order_by
         if self.parent_field_name != 'parent':
             kwargs['parent_field_name'] = self.parent_field_name
+        if self.lazy:
+            kwargs['lazy'] = True
+        if self.versioned:
+            kwargs['versioned'] = True
+        if self.changed_at_field_name is not None:
+            kwargs['changed_at_field_name'] = self.changed_at_field_name
+        if self.ancestors_field_name is not None:
+            kwargs['ancestors_field_name'] = self.ancestors_field_name
+        if self.rollups:
+            kwargs['rollups'] = self.rollups
         return name, path, args, kwargs
 
     def from_db_value(
@@ -128,7 +298,7 @@ class PathField(BinaryField):
         value: 'bytes | memoryview | Path | None',
         expression: Any,
         connection: Any,
-    ) -> Path:
+    ) -> 'Path | bytes | None':
         if isinstance(value, Path):
             return value
         # A stored path is either NULL (no path yet) or a non-empty key. psycopg3
@@ -138,6 +308,8 @@ class PathField(BinaryField):
         # Oracle can't store an empty `RAW` and reads a NULL one back as `b''`
         # (Django's `convert_empty_bytes`), so treat empty as "no path".
         value = bytes(value) if value else None
+        if self.lazy:
+            return value
         return Path(self, value)
 
     def to_python(self, value: 'bytes | memoryview | str | Path | None') -> Path:
@@ -193,6 +365,7 @@ class PathField(BinaryField):
 
     def rebuild(self, db_alias: str = DEFAULT_DB_ALIAS) -> None:
         self._check_database_backend(db_alias)
+        invalidate_tree_memo(self.model)
         if is_trigger_backend(db_alias):
             from .sql import postgresql
 
@@ -232,3 +405,69 @@ class PathField(BinaryField):
             yield
         finally:
             self.enable_trigger(db_alias=db_alias)
+
+
+class AncestorsField(Field):
+    """The primary keys of a node's ancestors, root first, maintained along the
+    `PathField` naming it in ``ancestors_field_name``.
+
+    A ``bigint[]`` on PostgreSQL, which the trigger backs with a GIN index, so
+    that ``filter(ancestors__contains=[pk])`` is a single index lookup. The
+    other backends have no array type and store a JSON array as text, which
+    ``contains`` matches with ``LIKE`` patterns (without index). Integer primary
+    keys only.
+    """
+
+    description = _('Tree ancestor primary keys')
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        for kwarg in ('default', 'null'):
+            if kwarg in kwargs:
+                raise ImproperlyConfigured('Cannot set `AncestorsField.%s`.' % kwarg)
+        kwargs['default'] = list
+        kwargs.setdefault('editable', False)
+        # Nullable, like the path, so that a raw `INSERT` leaving it out still
+        # goes through (the trigger or a rebuild then fills it in).
+        kwargs['null'] = True
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self) -> tuple[str, str, Sequence[Any], dict[str, Any]]:
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['default']
+        del kwargs['null']
+        return name, path, args, kwargs
+
+    def db_type(self, connection: Any) -> str:
+        if connection.vendor == 'postgresql':
+            return 'bigint[]'
+        if connection.vendor == 'mysql':
+            return 'longtext'
+        if connection.vendor == 'oracle':
+            return 'NCLOB'
+        return 'text'
+
+    def from_db_value(self, value: Any, expression: Any, connection: Any) -> list[int]:
+        return self.to_python(value)
+
+    def to_python(self, value: Any) -> list[int]:
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = json.loads(value)
+        return [int(pk) for pk in value]
+
+    def get_prep_value(self, value: Any) -> list[int]:
+        return self.to_python(value)
+
+    def get_db_prep_value(
+        self, value: Any, connection: Any, prepared: bool = False
+    ) -> 'list[int] | str':
+        if not prepared:
+            value = self.get_prep_value(value)
+        if connection.vendor == 'postgresql':
+            return value
+        # Compact, so that `contains` can match an element by its delimiters.
+        return json.dumps(value, separators=(',', ':'))
+
+    def value_to_string(self, obj: Model) -> str:  # type: ignore[override]
+        return json.dumps(self.value_from_object(obj))
@@ -1,11 +1,12 @@
 from collections.abc import Sequence
 from typing import Any
 
+from django.core.exceptions import EmptyResultSet
 from django.db.backends.base.base import BaseDatabaseWrapper
 from django.db.models import Lookup
 from django.db.models.sql.compiler import SQLCompiler
 
-from .sql.helpers import tree_level, tree_parent_prefix, tree_upper
+from .sql.helpers import tree_level, tree_parent_prefix, tree_prefixes, tree_upper
 
 
 # The descendant/child/sibling lookups are expressed as range comparisons on the
@@ -24,12 +25,14 @@ from .sql.helpers import tree_level, tree_parent_prefix, tree_upper
 # returns NULL for the empty prefix (the virtual root), leaving the range
 # unbounded above.
 #
-# On PostgreSQL the lookups call the PL/pgSQL helpers (`tree_upper`,
-# `tree_level`, `tree_parent_prefix`) -- that SQL is kept verbatim. On every other
-# backend there is no trigger and no such function: when the right-hand operand is
-# a constant path (the case for the whole tree-navigation API) the helper is
-# precomputed in Python and bound as a parameter, which is just as index-friendly
-# and works identically on SQLite and MySQL.
+# When the right-hand operand is a constant path (the case for the whole
+# tree-navigation API) the helpers are precomputed in Python and bound as plain
+# parameters, on every backend: the planner sees the constant bounds (instead of
+# an opaque function call, re-run per execution under a generic prepared plan on
+# PostgreSQL), and it works identically on SQLite, MySQL and Oracle, which have
+# no such functions. Only a column/expression operand (e.g. an `OuterRef`) needs
+# the PL/pgSQL helpers (`tree_upper`, `tree_level`, `tree_parent_prefix`), so that
+# form stays PostgreSQL-only.
 #
 # `child_of` / `sibling_of` additionally need to keep only *direct* children of a
 # prefix Q (depth Q+1), not deeper descendants. On SQLite and MySQL this avoids any
@@ -39,12 +42,14 @@ from .sql.helpers import tree_level, tree_parent_prefix, tree_upper
 # `instr(substr(path, len(Q) + 1), x'00') = length(path) - len(Q)`. `instr`,
 # `substr` and `length` are all byte-correct on SQLite BLOBs and MySQL VARBINARY.
 #
-# Oracle is the exception: `substr`/`length`/`instr` operate on the hex text of a
-# `RAW`, not its bytes (so `instr` would match a `00` straddling two bytes), and
-# `UTL_RAW` has no `instr`. There the depth is taken straight from the installed
-# `tree_level` helper (see `tree.sql.oracle`): `tree_level(path) = tree_level(Q) + 1`,
-# with `tree_level(Q)` precomputed in Python. `UTL_RAW.SUBSTR`/`UTL_RAW.LENGTH` give
-# the byte-correct prefix slice the `ancestor_of` lookup needs.
+# PostgreSQL and Oracle instead take the depth straight from their installed
+# `tree_level` helper: `tree_level(path) = tree_level(Q) + 1`, with `tree_level(Q)`
+# precomputed in Python. On PostgreSQL that is the expression the `(level, path)`
+# index is built on. On Oracle it is a necessity: `substr`/`length`/`instr` operate
+# on the hex text of a `RAW`, not its bytes (so `instr` would match a `00`
+# straddling two bytes), and `UTL_RAW` has no `instr`. `UTL_RAW.SUBSTR`/
+# `UTL_RAW.LENGTH` give the byte-correct prefix slice the `ancestor_of` lookup
+# needs.
 
 
 def _as_bytes(value: Any) -> bytes:
@@ -71,9 +76,9 @@ def _children_of_prefix(
 
     The descendant range of ``prefix``, restricted to rows one level below it (so
     deeper descendants drop out). On SQLite/MySQL this uses byte-correct
-    ``length``/``substr``/``instr``; on Oracle it uses the installed ``tree_level``
-    helper against a Python-precomputed target depth. For the empty prefix (the
-    virtual root) the upper bound is dropped, selecting every root.
+    ``length``/``substr``/``instr``; on PostgreSQL and Oracle it uses the installed
+    ``tree_level`` helper against a Python-precomputed target depth. For the empty
+    prefix (the virtual root) the upper bound is dropped, selecting every root.
     """
     upper = tree_upper(prefix)
     n = len(prefix)
@@ -87,7 +92,7 @@ def _children_of_prefix(
     if upper is not None:
         clauses.append('%s < %%s' % lhs)
         params += [*lhs_params, upper]
-    if connection.vendor == 'oracle':
+    if connection.vendor in ('postgresql', 'oracle'):
         target_level = (tree_level(prefix) or 0) + 1
         clauses.append('tree_level(%s) = %%s' % lhs)
         params += [*lhs_params, target_level]
@@ -97,6 +102,28 @@ def _children_of_prefix(
     return ' AND '.join(clauses), params
 
 
+def _upper_sql(
+    rhs: str, rhs_params: Sequence[Any], connection: BaseDatabaseWrapper
+) -> tuple[str, list[Any]]:
+    """SQL for ``tree_upper(rhs)`` off PostgreSQL (a non-empty path operand)."""
+    if connection.vendor == 'oracle':
+        return (
+            'UTL_RAW.CONCAT(UTL_RAW.SUBSTR(%s, 1, UTL_RAW.LENGTH(%s) - 1), '
+            "HEXTORAW('01'))" % (rhs, rhs),
+            [*rhs_params, *rhs_params],
+        )
+    if connection.vendor == 'mysql':
+        return (
+            "CONCAT(SUBSTRING(%s, 1, LENGTH(%s) - 1), x'01')" % (rhs, rhs),
+            [*rhs_params, *rhs_params],
+        )
+    # SQLite's `||` yields text; cast it back so it compares as a blob.
+    return (
+        "CAST(substr(%s, 1, length(%s) - 1) || x'01' AS BLOB)" % (rhs, rhs),
+        [*rhs_params, *rhs_params],
+    )
+
+
 class AncestorOf(Lookup):
     lookup_name = 'ancestor_of'
 
@@ -104,6 +131,20 @@ class AncestorOf(Lookup):
         self, compiler: SQLCompiler, connection: BaseDatabaseWrapper
     ) -> tuple[str, list[Any]]:
         lhs, lhs_params = self.process_lhs(compiler, connection)
+        if self.rhs_is_direct_value():
+            # The ancestors-or-self of a constant P are exactly its level-aligned
+            # prefixes, so match them by equality: one index probe per level,
+            # instead of slicing P against every row. PostgreSQL gets a single
+            # array parameter, so the statement is the same for every depth.
+            prefixes = tree_prefixes(_as_bytes(self.rhs))
+            if not prefixes:
+                raise EmptyResultSet
+            if connection.vendor == 'postgresql':
+                return '%s = ANY(%%s)' % lhs, [*lhs_params, prefixes]
+            return (
+                '%s IN (%s)' % (lhs, ', '.join(['%s'] * len(prefixes))),
+                [*lhs_params, *prefixes],
+            )
         rhs, rhs_params = self.process_rhs(compiler, connection)
         if connection.vendor == 'oracle':
             # `substr`/`length` slice the hex text of a `RAW`, not its bytes;
@@ -135,16 +176,21 @@ class DescendantOf(Lookup):
     ) -> tuple[str, list[Any]]:
         lhs, lhs_params = self.process_lhs(compiler, connection)
         operator = '>' if self.strict else '>='
-        if connection.vendor == 'postgresql':
+        if not self.rhs_is_direct_value():
             rhs, rhs_params = self.process_rhs(compiler, connection)
+            if connection.vendor == 'postgresql':
+                return (
+                    '%s %s %s AND %s < tree_upper(%s)' % (lhs, operator, rhs, lhs, rhs),
+                    [*lhs_params, *rhs_params, *lhs_params, *rhs_params],
+                )
+            # No `tree_upper` function elsewhere: build the same exclusive upper
+            # bound inline (R minus its trailing `0x00`, plus `0x01`), so the
+            # path index narrows each probe to R's descendant range, e.g. for
+            # the `OuterRef` of `annotate_descendant_count`.
+            upper_sql, upper_params = _upper_sql(rhs, rhs_params, connection)
             return (
-                '%s %s %s AND %s < tree_upper(%s)' % (lhs, operator, rhs, lhs, rhs),
-                [*lhs_params, *rhs_params, *lhs_params, *rhs_params],
-            )
-        if not self.rhs_is_direct_value():
-            raise NotImplementedError(
-                'The `%s` lookup only supports a constant path off PostgreSQL.'
-                % self.lookup_name
+                '%s %s %s AND %s < %s' % (lhs, operator, rhs, lhs, upper_sql),
+                [*lhs_params, *rhs_params, *lhs_params, *upper_params],
             )
         path = _as_bytes(self.rhs)
         upper = tree_upper(path)
@@ -177,7 +223,12 @@ class ChildOf(Lookup):
         self, compiler: SQLCompiler, connection: BaseDatabaseWrapper
     ) -> tuple[str, list[Any]]:
         lhs, lhs_params = self.process_lhs(compiler, connection)
-        if connection.vendor == 'postgresql':
+        if not self.rhs_is_direct_value():
+            if connection.vendor != 'postgresql':
+                raise NotImplementedError(
+                    'The `child_of` lookup only supports a constant path off '
+                    'PostgreSQL.'
+                )
             rhs, rhs_params = self.process_rhs(compiler, connection)
             return (
                 '%s > %s AND %s < tree_upper(%s) '
@@ -192,10 +243,6 @@ class ChildOf(Lookup):
                     *rhs_params,
                 ],
             )
-        if not self.rhs_is_direct_value():
-            raise NotImplementedError(
-                'The `child_of` lookup only supports a constant path off PostgreSQL.'
-            )
         # Direct children of P are the children of the prefix P itself.
         return _children_of_prefix(lhs, lhs_params, _as_bytes(self.rhs), connection)
 
@@ -207,7 +254,12 @@ class SiblingOf(Lookup):
         self, compiler: SQLCompiler, connection: BaseDatabaseWrapper
     ) -> tuple[str, list[Any]]:
         lhs, lhs_params = self.process_lhs(compiler, connection)
-        if connection.vendor == 'postgresql':
+        if not self.rhs_is_direct_value():
+            if connection.vendor != 'postgresql':
+                raise NotImplementedError(
+                    'The `sibling_of` lookup only supports a constant path off '
+                    'PostgreSQL.'
+                )
             rhs, rhs_params = self.process_rhs(compiler, connection)
             # The siblings of P are the children of its parent, i.e. the rows in
             # the parent's descendant range at P's depth. `tree_parent_prefix(P)`
@@ -229,11 +281,50 @@ class SiblingOf(Lookup):
                     *rhs_params,
                 ],
             )
-        if not self.rhs_is_direct_value():
-            raise NotImplementedError(
-                'The `sibling_of` lookup only supports a constant path off PostgreSQL.'
-            )
         # The siblings of P are the children of its parent prefix (P itself
         # included; the navigation API excludes self separately).
         parent_path = tree_parent_prefix(_as_bytes(self.rhs))
         return _children_of_prefix(lhs, lhs_params, parent_path, connection)
+
+
+class AncestorsContains(Lookup):
+    """``ancestors__contains=[pk, ...]``: the rows below every given node.
+
+    PostgreSQL tests the ``bigint[]`` with ``@>``, which the GIN index installed
+    by `CreateTreeTrigger` serves. Elsewhere the column is a compact JSON array,
+    so each pk is matched by the delimiters around it (first, middle, last or
+    only element).
+    """
+
+    lookup_name = 'contains'
+    prepare_rhs = False
+
+    def get_prep_lookup(self) -> Any:
+        if hasattr(self.rhs, 'resolve_expression'):
+            return self.rhs
+        return [int(pk) for pk in self.rhs]
+
+    def as_sql(
+        self, compiler: SQLCompiler, connection: BaseDatabaseWrapper
+    ) -> tuple[str, tuple[Any, ...]]:
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        if connection.vendor == 'postgresql':
+            rhs, rhs_params = self.process_rhs(compiler, connection)
+            return '%s @> %s::bigint[]' % (lhs, rhs), (*lhs_params, *rhs_params)
+        if not self.rhs_is_direct_value():
+            raise NotImplementedError(
+                'The `contains` lookup of an `AncestorsField` only supports a '
+                'constant list off PostgreSQL.'
+            )
+        if not self.rhs:
+            return '1 = 1', ()
+        clauses: list[str] = []
+        params: list[Any] = []
+        for pk in self.rhs:
+            clauses.append(
+                '(%s LIKE %%s OR %s LIKE %%s OR %s LIKE %%s OR %s LIKE %%s)'
+                % (lhs, lhs, lhs, lhs)
+            )
+            for pattern in (f'[{pk}]', f'[{pk},%', f'%,{pk},%', f'%,{pk}]'):
+                params += [*lhs_params, pattern]
+        return ' AND '.join(clauses), tuple(params)
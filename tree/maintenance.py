@@ -14,10 +14,15 @@ trigger, nothing observes it. Call :meth:`TreeModelMixin.rebuild_paths` afterwar
 """
 
 from collections import defaultdict, deque
+from collections.abc import Iterable
+from datetime import datetime
+from functools import partial
 from typing import TYPE_CHECKING, Any, cast
 
-from django.db import DEFAULT_DB_ALIAS, ProgrammingError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, ProgrammingError, transaction
 from django.db.models import F, Field, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from .sql.helpers import (
     DELIMITER,
@@ -25,6 +30,7 @@ from .sql.helpers import (
     tree_int_to_seg,
     tree_mid,
     tree_parent_prefix,
+    tree_prefixes,
 )
 
 if TYPE_CHECKING:
@@ -53,6 +59,79 @@ def is_trigger_disabled(field: 'PathField', db_alias: str) -> bool:
     return _key(field, db_alias) in _disabled
 
 
+def bump_version(model: type['Model'], db_alias: str) -> None:
+    """Bump the `TreeVersion` counter of ``model``'s table after an ORM write,
+    if one of its `PathField`s is ``versioned``.
+
+    The ORM twin of the PostgreSQL ``tree_bump_version`` trigger.
+    """
+    from .fields import PathField
+    from .models import TreeVersion
+
+    if not any(
+        field.versioned
+        for field in model._meta.concrete_fields
+        if isinstance(field, PathField)
+    ):
+        return
+    versions = TreeVersion.objects.using(db_alias).filter(name=model._meta.db_table)
+    if versions.update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic(using=db_alias):
+            versions.create(name=model._meta.db_table, version=1)
+    except IntegrityError:
+        # Another writer created the counter in the meantime.
+        versions.update(version=F('version') + 1)
+
+
+def bump_version_on_commit(model: type['Model'], db_alias: str) -> None:
+    """Bump the `TreeVersion` counter of ``model``'s table once the current
+    transaction commits (right away outside of one), however many of its rows
+    the transaction deletes -- the deletion collector signals each of them.
+    """
+    connection = transaction.get_connection(db_alias)
+    for _, func, *_ in connection.run_on_commit:
+        if (
+            isinstance(func, partial)
+            and func.func is bump_version
+            and func.args == (model, db_alias)
+        ):
+            return
+    transaction.on_commit(partial(bump_version, model, db_alias), using=db_alias)
+
+
+# Bound on the prefixes stamped per `UPDATE`, below every backend's parameter
+# limit (SQLite's is 999 before 3.32).
+STAMP_BATCH_SIZE = 500
+
+
+def stamp_subtrees(
+    field: 'PathField', db_alias: str, paths: Iterable[bytes | None]
+) -> datetime | None:
+    """Stamp the `changed_at_field` of the ancestors-or-self of ``paths`` with
+    the current time after an ORM write, and return that time (``None`` if
+    nothing was stamped).
+
+    The ORM twin of the PostgreSQL ``stamp_<path>_subtrees`` trigger.
+    """
+    changed_at_field = field.changed_at_field
+    if changed_at_field is None:
+        return None
+    prefixes = sorted(
+        {prefix for path in paths if path for prefix in tree_prefixes(path)}
+    )
+    if not prefixes:
+        return None
+    now = timezone.now()
+    base = field.model._base_manager.using(db_alias)
+    for i in range(0, len(prefixes), STAMP_BATCH_SIZE):
+        base.filter(
+            **{f'{field.attname}__in': prefixes[i : i + STAMP_BATCH_SIZE]}
+        ).update(**{changed_at_field.attname: now})
+    return now
+
+
 def _to_bytes(value: Any) -> bytes | None:
     # `values()` runs `PathField.from_db_value`, so a stored path always comes
     # back as a `Path` (whose `.value` is the raw bytes, or `None`).
@@ -90,6 +169,14 @@ class PathMaintainer:
         self.pk_attname = meta.pk.attname
         self.path_attname = field.attname
         self.parent_attname = field.parent_field.attname
+        ancestors_field = field.ancestors_field
+        self.ancestors_attname = (
+            None if ancestors_field is None else ancestors_field.attname
+        )
+        self.rollups = field.rollups
+        self.rollup_attnames = [
+            rollup.get_field(self.model).attname for rollup in self.rollups
+        ]
 
         # Resolve the ordering columns exactly like the PL/pgSQL trigger: each
         # `order_by` entry to its column attname + a descending flag, then append
@@ -122,17 +209,27 @@ class PathMaintainer:
         """Stash the row's pre-save path on the instance.
 
         Reads the current DB row so :meth:`on_save` has the trigger's ``OLD`` path
-        (the old parent and depth are recovered from it). For an insert (no row
-        yet, even when the pk is client-generated) nothing is stashed.
+        (the old parent and depth are recovered from it), and the old rollups and
+        contributions for :meth:`update_rollups`. For an insert (no row yet, even
+        when the pk is client-generated) nothing is stashed.
         """
         if instance.pk is None:
             return
-        row = self._base.filter(pk=instance.pk).values(self.path_attname).first()
+        contributions = self._contributions()
+        row = (
+            self._base.filter(pk=instance.pk)
+            .values(self.path_attname, *self.rollup_attnames, **contributions)
+            .first()
+        )
         if row is None:
             return
-        instance.__dict__.setdefault('_tree_old', {})[self.path_attname] = _to_bytes(
-            row[self.path_attname]
-        )
+        tree_old = instance.__dict__.setdefault('_tree_old', {})
+        tree_old[self.path_attname] = _to_bytes(row[self.path_attname])
+        if self.rollups:
+            tree_old[self._rollups_key] = (
+                [row[attname] or 0 for attname in self.rollup_attnames],
+                [row[alias] for alias in contributions],
+            )
 
     def capture_old_many(self, pks: list[Any]) -> dict[Any, bytes | None]:
         """Pre-write path of a set of rows, in one query.
@@ -148,15 +245,37 @@ class PathMaintainer:
     def _old_path(self, instance: 'Model') -> bytes | None:
         return instance.__dict__.get('_tree_old', {}).get(self.path_attname)
 
-    def _parent_path(self, parent_id: Any) -> bytes:
+    def _parent(self, parent_id: Any) -> tuple[bytes, list[Any]]:
+        # The parent's path, and the ancestor pks of its children (read in the
+        # same query when the field keeps them).
         if parent_id is None:
-            return b''
-        path = (
-            self._base.filter(pk=parent_id)
-            .values_list(self.path_attname, flat=True)
-            .first()
+            return b'', []
+        columns = [self.path_attname]
+        if self.ancestors_attname is not None:
+            columns.append(self.ancestors_attname)
+        row = self._base.filter(pk=parent_id).values_list(*columns).first()
+        if row is None:
+            return b'', []
+        path = _to_bytes(row[0]) or b''
+        if self.ancestors_attname is None:
+            return path, []
+        prefixes = tree_prefixes(path)[:-1]
+        if len(row[1]) != len(prefixes):
+            # The parent's own array is NULL (read as `[]`) or stale, e.g. it
+            # was written with the maintenance disabled: its path prefixes are
+            # the truth, as in the trigger.
+            return path, [*self._pks_at(prefixes), parent_id]
+        return path, [*row[1], parent_id]
+
+    def _pks_at(self, paths: list[bytes]) -> list[Any]:
+        # The pks of the rows at ``paths``, in path order.
+        if not paths:
+            return []
+        return list(
+            self._base.filter(**{f'{self.path_attname}__in': paths})
+            .order_by(self.path_attname)
+            .values_list(self.pk_attname, flat=True)
         )
-        return _to_bytes(path) or b''
 
     def _nearest_sibling_segment(
         self, parent_id: Any, instance: 'Model', parent_len: int, greater: bool
@@ -201,11 +320,13 @@ class PathMaintainer:
             matched_any = True
         return result if matched_any else Q()
 
-    def on_save(self, instance: 'Model', created: bool) -> None:
+    def on_save(self, instance: 'Model', created: bool) -> bytes | None:
+        """Place the saved row like the trigger would, and return its path
+        (``None`` while the maintenance is disabled)."""
         if is_trigger_disabled(self.field, self.db_alias):
-            return
+            return None
         parent_id = getattr(instance, self.parent_attname)
-        new_parent_path = self._parent_path(parent_id)
+        new_parent_path, ancestors = self._parent(parent_id)
         parent_len = len(new_parent_path)
         old_path = None if created else self._old_path(instance)
 
@@ -226,40 +347,221 @@ class PathMaintainer:
             if (prev_seg is None or old_seg > prev_seg) and (
                 next_seg is None or old_seg < next_seg
             ):
-                return
+                self._repair_ancestors(instance, ancestors)
+                return old_path
 
         if old_path and new_parent_path.startswith(old_path):
             # Same error the PL/pgSQL trigger raises, for cross-backend parity.
             raise ProgrammingError('Cannot set itself or a descendant as parent.')
 
         new_path = new_parent_path + tree_mid(prev_seg, next_seg) + DELIMITER
-        self._write(instance.pk, new_path)
-        instance.__dict__[self.path_attname] = new_path
+        values: dict[str, Any] = {self.path_attname: new_path}
+        if self.ancestors_attname is not None:
+            values[self.ancestors_attname] = ancestors
+        self._base.filter(pk=instance.pk).update(**values)
+        instance.__dict__.update(values)
+        instance.__dict__[self.path_attname] = self.field.to_python(new_path)
 
         if old_path is not None and old_path != new_path:
-            self._rewrite_descendants(instance.pk, old_path, new_path)
-
-    def _write(self, pk: Any, path: bytes) -> None:
-        self._base.filter(pk=pk).update(**{self.path_attname: path})
+            self._rewrite_descendants(
+                instance.pk, old_path, new_path, [*ancestors, instance.pk]
+            )
+        return new_path
 
-    def _rewrite_descendants(self, pk: Any, old_path: bytes, new_path: bytes) -> None:
-        rows = (
-            self._base.filter(**{f'{self.path_attname}__descendant_of': old_path})
+    def _repair_ancestors(self, instance: 'Model', ancestors: list[Any]) -> None:
+        # A row that kept its place keeps its ancestors, whatever array the
+        # save wrote.
+        if self.ancestors_attname is None:
+            return
+        saved = instance.__dict__.get(self.ancestors_attname)
+        if saved is None or list(saved) == ancestors:
+            return
+        self._base.filter(pk=instance.pk).update(**{self.ancestors_attname: ancestors})
+        instance.__dict__[self.ancestors_attname] = ancestors
+
+    def _rewrite_descendants(
+        self, pk: Any, old_path: bytes, new_path: bytes, chain: list[Any]
+    ) -> None:
+        # `chain` is the moved row's ancestors-or-self, which leads the
+        # ancestors of every descendant.
+        rows = [
+            (child_pk, _to_bytes(path))
+            for child_pk, path in self._base.filter(
+                **{f'{self.path_attname}__descendant_of': old_path}
+            )
             .exclude(pk=pk)
             .values_list(self.pk_attname, self.path_attname)
-        )
+        ]
+        pks_by_path = {path: child_pk for child_pk, path in rows}
+        level = old_path.count(0)
+        fields = [self.path_attname]
+        if self.ancestors_attname is not None:
+            fields.append(self.ancestors_attname)
         to_update = []
         prefix_len = len(old_path)
         for child_pk, path in rows:
             # `descendant_of` already restricts to rows whose path starts with
             # `old_path`, so the local suffix is everything past it.
-            path = _to_bytes(path)
             assert path is not None
             obj = self.model(**{self.pk_attname: child_pk})
             setattr(obj, self.path_attname, new_path + path[prefix_len:])
+            if self.ancestors_attname is not None:
+                between = tree_prefixes(path)[level:-1]
+                setattr(
+                    obj,
+                    self.ancestors_attname,
+                    [*chain, *(pks_by_path[prefix] for prefix in between)],
+                )
+            to_update.append(obj)
+        if to_update:
+            self._base.bulk_update(to_update, fields)
+
+    @property
+    def _rollups_key(self) -> str:
+        return f'{self.path_attname}:rollups'
+
+    def _contributions(self) -> dict[str, Any]:
+        return {
+            f'tree_rollup_{i}': rollup.contribution(self.model)
+            for i, rollup in enumerate(self.rollups)
+        }
+
+    def _add_to_rollups(self, paths: list[bytes], deltas: list[Any]) -> None:
+        values = {
+            attname: Coalesce(attname, 0) + delta
+            for attname, delta in zip(self.rollup_attnames, deltas)
+            if delta
+        }
+        for i in range(0, len(paths) if values else 0, STAMP_BATCH_SIZE):
+            self._base.filter(
+                **{f'{self.path_attname}__in': paths[i : i + STAMP_BATCH_SIZE]}
+            ).update(**values)
+
+    def update_rollups(self, instance: 'Model', created: bool) -> None:
+        """Apply the difference the save made to the rollups of the row's
+        ancestors, and set its own from the pre-save values.
+
+        The ORM twin of the PostgreSQL ``rollup_<table>_<path>`` trigger.
+        """
+        if not self.rollups or is_trigger_disabled(self.field, self.db_alias):
+            return
+        contributions = self._contributions()
+        row = (
+            self._base.filter(pk=instance.pk)
+            .values(self.path_attname, **contributions)
+            .first()
+        )
+        path = None if row is None else _to_bytes(row[self.path_attname])
+        if not path:
+            return
+        new = [row[alias] for alias in contributions]  # type: ignore[index]
+        old_path = None if created else self._old_path(instance)
+        old_totals, old = instance.__dict__.get('_tree_old', {}).get(
+            self._rollups_key, ([0] * len(new), [0] * len(new))
+        )
+        totals = [total - o + n for total, o, n in zip(old_totals, old, new)]
+        if old_path is not None and old_path != path:
+            self._add_to_rollups(
+                tree_prefixes(old_path)[:-1], [-total for total in old_totals]
+            )
+            self._add_to_rollups(tree_prefixes(path)[:-1], totals)
+        else:
+            self._add_to_rollups(
+                tree_prefixes(path)[:-1], [n - o for n, o in zip(new, old)]
+            )
+        values = dict(zip(self.rollup_attnames, totals))
+        if any(instance.__dict__.get(name) != value for name, value in values.items()):
+            self._base.filter(pk=instance.pk).update(**values)
+        instance.__dict__.update(values)
+
+    def delete_rollups(self, instance: 'Model') -> None:
+        """Subtract the contributions of a row about to be deleted from the
+        rollups of its ancestors."""
+        if not self.rollups or is_trigger_disabled(self.field, self.db_alias):
+            return
+        contributions = self._contributions()
+        row = (
+            self._base.filter(pk=instance.pk)
+            .values(self.path_attname, **contributions)
+            .first()
+        )
+        path = None if row is None else _to_bytes(row[self.path_attname])
+        if path:
+            self._add_to_rollups(
+                tree_prefixes(path)[:-1],
+                [-row[alias] for alias in contributions],  # type: ignore[index]
+            )
+
+    def rollup_contributions(self, pks: list[Any]) -> dict[Any, tuple[Any, ...]]:
+        """The path and rollup contributions of a set of rows, in one query."""
+        contributions = self._contributions()
+        rows = (
+            self._base.filter(pk__in=pks)
+            .annotate(**contributions)
+            .values_list(self.pk_attname, self.path_attname, *contributions)
+        )
+        return {pk: (_to_bytes(path), values) for pk, path, *values in rows}
+
+    def add_rollup_deltas(
+        self, before: dict[Any, tuple[Any, ...]], after: dict[Any, tuple[Any, ...]]
+    ) -> None:
+        """Apply the change of contribution of rows that kept their place
+        (see :meth:`rollup_contributions`) to their ancestors-or-self, with one
+        ``UPDATE`` per distinct difference."""
+        zeros = [0] * len(self.rollups)
+        sums: dict[bytes, list[Any]] = {}
+        for pk, (path, new) in after.items():
+            old = before.get(pk, (None, zeros))[1]
+            deltas = [n - o for n, o in zip(new, old)]
+            if not path or not any(deltas):
+                continue
+            for prefix in tree_prefixes(path):
+                sums[prefix] = [
+                    total + delta
+                    for total, delta in zip(sums.get(prefix, zeros), deltas)
+                ]
+        paths_by_deltas: dict[tuple[Any, ...], list[bytes]] = defaultdict(list)
+        for prefix, deltas in sums.items():
+            paths_by_deltas[tuple(deltas)].append(prefix)
+        for distinct_deltas, paths in paths_by_deltas.items():
+            self._add_to_rollups(sorted(paths), list(distinct_deltas))
+
+    def rebuild_rollups(self) -> None:
+        """Recompute every rollup from the contributions, summed along the
+        path prefixes in a single pass."""
+        if not self.rollups:
+            return
+        contributions = self._contributions()
+        rows = list(
+            self._base.filter(**{f'{self.path_attname}__isnull': False})
+            .annotate(**contributions)
+            .values_list(
+                self.pk_attname,
+                self.path_attname,
+                *self.rollup_attnames,
+                *contributions,
+            )
+        )
+        n = len(self.rollups)
+        totals: dict[bytes, list[Any]] = {}
+        for row in rows:
+            path = _to_bytes(row[1])
+            for prefix in tree_prefixes(path or b''):
+                totals[prefix] = [
+                    total + value
+                    for total, value in zip(totals.get(prefix, [0] * n), row[2 + n :])
+                ]
+        to_update = []
+        for row in rows:
+            path = _to_bytes(row[1])
+            if not path or list(row[2 : 2 + n]) == totals[path]:
+                continue
+            obj = self.model(**{self.pk_attname: row[0]})
+            for attname, total in zip(self.rollup_attnames, totals[path]):
+                setattr(obj, attname, total)
             to_update.append(obj)
         if to_update:
-            self._base.bulk_update(to_update, [self.path_attname])
+            self._base.bulk_update(to_update, self.rollup_attnames)
 
     def rebuild(self) -> None:
         """Recompute every path from the roots down, matching the PL/pgSQL
@@ -282,41 +584,54 @@ class PathMaintainer:
                 else expression.asc(nulls_last=True)
             )
         order_by.append(F('pk').asc())
-        rows = list(
-            self._base.order_by(*order_by).values(
-                self.pk_attname, self.parent_attname, self.path_attname
-            )
-        )
+        columns = [self.pk_attname, self.parent_attname, self.path_attname]
+        if self.ancestors_attname is not None:
+            columns.append(self.ancestors_attname)
+        rows = list(self._base.order_by(*order_by).values(*columns))
 
         children: dict[Any, list[dict[str, Any]]] = defaultdict(list)
         for row in rows:
             children[row[self.parent_attname]].append(row)
 
         paths: dict[Any, bytes] = {}
+        ancestors: dict[Any, list[Any]] = {}
 
-        def assign(group: list[dict[str, Any]], parent_path: bytes) -> None:
+        def assign(group: list[dict[str, Any]], parent_pk: Any) -> None:
+            parent_path = b'' if parent_pk is None else paths[parent_pk]
+            chain = [] if parent_pk is None else [*ancestors[parent_pk], parent_pk]
             width = seg_width(len(group))
             for rank, row in enumerate(group):
                 paths[row[self.pk_attname]] = (
                     parent_path + tree_int_to_seg(rank, width) + DELIMITER
                 )
+                ancestors[row[self.pk_attname]] = chain
 
-        assign(children.get(None, []), b'')
+        assign(children.get(None, []), None)
         queue = deque(row[self.pk_attname] for row in children.get(None, []))
         while queue:
             pk = queue.popleft()
             group = children.get(pk, [])
-            assign(group, paths[pk])
+            assign(group, pk)
             queue.extend(row[self.pk_attname] for row in group)
 
+        fields = [self.path_attname]
+        if self.ancestors_attname is not None:
+            fields.append(self.ancestors_attname)
         to_update = []
         for row in rows:
             pk = row[self.pk_attname]
             path = paths.get(pk)
-            if path is None or _to_bytes(row[self.path_attname]) == path:
+            if path is None:
                 continue
             obj = self.model(**{self.pk_attname: pk})
             setattr(obj, self.path_attname, path)
-            to_update.append(obj)
+            changed = _to_bytes(row[self.path_attname]) != path
+            if self.ancestors_attname is not None:
+                setattr(obj, self.ancestors_attname, ancestors[pk])
+                changed |= row[self.ancestors_attname] != ancestors[pk]
+            if changed:
+                to_update.append(obj)
         if to_update:
-            self._base.bulk_update(to_update, [self.path_attname])
+            self._base.bulk_update(to_update, fields)
+            bump_version(self.model, self.db_alias)
+        self.rebuild_rollups()
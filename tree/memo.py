@@ -0,0 +1,110 @@
+"""Request-scoped memoization of the tree navigation.
+
+Within `memoize_tree()` -- or every request, with `TreeMemoMiddleware` -- the
+navigation methods of a `Path` (`get_children`, `get_ancestors`, ...) return the
+same queryset (or sibling, or ``is_leaf`` answer) for the same node and
+arguments, so the template fragments and middleware of a page asking for the
+same breadcrumbs or menu share one query. Any ORM write to a tree (``save()``,
+``delete()`` and the `TreeQuerySet` bulk methods) drops the memoized results of
+its model.
+
+The memo lives in a context variable, so concurrent requests (threads or
+asyncio tasks) each have their own.
+"""
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.models import Model, QuerySet
+
+if TYPE_CHECKING:
+    from django.http import HttpRequest, HttpResponse
+
+    from .types import Path
+
+_Method = TypeVar('_Method', bound=Callable[..., Any])
+
+# The memoized results by model label, then by `(path attname, path value,
+# method, args, kwargs)`; `None` outside of `memoize_tree()`.
+_memo: ContextVar[dict[str, dict[tuple[Any, ...], Any]] | None] = ContextVar(
+    'tree_memo', default=None
+)
+
+
+@contextmanager
+def memoize_tree() -> Iterator[None]:
+    """Memoizes the tree navigation until the end of the block."""
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+def invalidate_tree_memo(model: type[Model]) -> None:
+    """Drops the navigation memoized for ``model``, after a write to its tree."""
+    memo = _memo.get()
+    if memo:
+        memo.pop(model._meta.label, None)
+
+
+def memoized(method: _Method) -> _Method:
+    # Decorates a `Path` navigation method. Not memoized: a path without value
+    # (nothing to query), one with prefetched rows (served without query
+    # anyway) and a call given a `queryset` (built by the caller, so not a
+    # stable key).
+    @wraps(method)
+    def wrapper(self: 'Path', *args: Any, **kwargs: Any) -> Any:
+        memo = _memo.get()
+        if (
+            memo is None
+            or not self.value
+            or not self.field_bound
+            or self._prefetched_tree is not None
+            or any(isinstance(arg, QuerySet) for arg in (*args, *kwargs.values()))
+        ):
+            return method(self, *args, **kwargs)
+        results = memo.setdefault(self.field.model._meta.label, {})
+        try:
+            key = (
+                self.attname,
+                self.value,
+                method.__name__,
+                args,
+                frozenset(kwargs.items()),
+            )
+            return results[key]
+        except KeyError:
+            result = results[key] = method(self, *args, **kwargs)
+            return result
+        except TypeError:  # An unhashable argument.
+            return method(self, *args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+class TreeMemoMiddleware:
+    """Memoizes the tree navigation for the duration of each request (see
+    `memoize_tree()`), in both sync and async stacks."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[['HttpRequest'], 'HttpResponse']) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: 'HttpRequest') -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with memoize_tree():
+            return self.get_response(request)
+
+    async def __acall__(self, request: 'HttpRequest') -> Any:
+        with memoize_tree():
+            return await self.get_response(request)  # type: ignore[misc]
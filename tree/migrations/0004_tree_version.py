@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+# The per-table change counter behind `tree.cache.TreeCache`. A migration that
+# creates the trigger of a `versioned` `PathField` must depend on this one: on
+# PostgreSQL that trigger bumps the counter on every write.
+class Migration(migrations.Migration):
+    dependencies = [('tree', '0003_tree_functions')]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeVersion',
+            fields=[
+                (
+                    'name',
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={'db_table': 'tree_version'},
+        ),
+    ]
@@ -5,7 +5,7 @@ from collections.abc import Iterator
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import DEFAULT_DB_ALIAS, transaction
-from django.db.models import Model, QuerySet
+from django.db.models import BigIntegerField, CharField, Model, QuerySet
 
 from .fields import PathField
 from .query import _get_path_fields, _get_path_field, TreeManager
@@ -47,6 +47,13 @@ class TreeModelMixin(_ModelBase):
             include_self=include_self
         )
 
+    def get_prefetched_descendants(
+        self, include_self: bool = False, path_field: str | None = None
+    ) -> list[Model]:
+        return self._get_path_value(path_field).get_prefetched_descendants(
+            include_self=include_self
+        )
+
     def get_siblings(
         self,
         include_self: bool = False,
@@ -214,3 +221,17 @@ class TreeModel(TreeModelMixin, Model):
 
     class Meta:
         abstract = True
+
+
+class TreeVersion(Model):
+    """A change counter per tree table, bumped by every write to a table whose
+    `PathField` is ``versioned`` (see `tree.cache.TreeCache`)."""
+
+    name = CharField(max_length=255, primary_key=True)
+    version = BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'tree_version'
+
+    def __str__(self) -> str:
+        return '%s v%d' % (self.name, self.version)
@@ -0,0 +1,177 @@
+"""Cross-process invalidation from the PostgreSQL tree trigger.
+
+``CreateTreeTrigger(..., notify='<channel>')`` makes the trigger ``pg_notify``
+that channel with the (hex-encoded) path of every inserted, moved, reordered,
+updated or deleted node -- both its old and its new path when it moved. A cached
+subtree is stale exactly when its path range intersects the notified node's,
+i.e. when one path is a prefix of the other. The empty prefix (a row without a
+path) stands for the whole tree.
+
+:class:`TreeListener` receives these notifications on a dedicated connection, in
+a background thread, and :class:`SubtreeCache` evicts the intersecting entries::
+
+    cache = SubtreeCache()
+    TreeListener('places', cache.invalidate).start()
+"""
+
+import logging
+from bisect import bisect_left, insort
+from collections.abc import Callable
+from select import select
+from threading import Event, Lock, Thread
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from .sql.helpers import tree_prefixes, tree_upper
+from .types import Path
+
+logger = logging.getLogger(__name__)
+
+
+def _as_key(path: 'Path | bytes | None') -> bytes:
+    return Path._as_bytes(path) or b''
+
+
+class SubtreeCache:
+    """Values cached per subtree, keyed by the path of the subtree root.
+
+    Thread-safe, so that a :class:`TreeListener` thread can evict entries while
+    request threads read them.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[bytes, Any] = {}
+        self._keys: list[bytes] = []  # Sorted, to bisect descendant ranges.
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, path: 'Path | bytes') -> bool:
+        return _as_key(path) in self._data
+
+    def get(self, path: 'Path | bytes', default: Any = None) -> Any:
+        return self._data.get(_as_key(path), default)
+
+    def set(self, path: 'Path | bytes', value: Any) -> None:
+        key = _as_key(path)
+        with self._lock:
+            if key not in self._data:
+                insort(self._keys, key)
+            self._data[key] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._keys.clear()
+
+    def invalidate(self, prefix: 'Path | bytes | None') -> int:
+        """Evicts the entries of every subtree containing or contained in the
+        subtree at ``prefix`` (all of them for the empty prefix), and returns how
+        many were evicted."""
+        prefix = _as_key(prefix)
+        with self._lock:
+            # Its descendants-or-self are a slice of the sorted keys, and its
+            # strict ancestors (the empty prefix, the whole tree, included) sort
+            # before that slice.
+            lo = bisect_left(self._keys, prefix)
+            upper = tree_upper(prefix)
+            hi = len(self._keys) if upper is None else bisect_left(self._keys, upper)
+            ancestors = [
+                key
+                for key in (b'', *tree_prefixes(prefix)[:-1])
+                if key != prefix and key in self._data
+            ]
+            stale = [*ancestors, *self._keys[lo:hi]]
+            for key in stale:
+                del self._data[key]
+            del self._keys[lo:hi]
+            for key in ancestors:
+                del self._keys[bisect_left(self._keys, key)]
+            return len(stale)
+
+
+class TreeListener(Thread):
+    """Calls ``callback(prefix)`` for every path notified on ``channel``.
+
+    Runs as a daemon thread with its own autocommit connection (``LISTEN`` needs
+    one outside any transaction), and wakes up every ``timeout`` seconds to
+    check whether `stop()` was called. An exception raised by ``callback`` is
+    logged and the listener goes on. When the connection is lost, it reconnects
+    every ``timeout`` seconds and, once listening again, calls
+    ``callback(b'')``: the notifications sent meanwhile are lost, so the whole
+    tree may be stale. PostgreSQL only, with psycopg2 or psycopg >= 3.2.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        callback: Callable[[bytes], Any],
+        using: str = DEFAULT_DB_ALIAS,
+        timeout: float = 5.0,
+    ) -> None:
+        if connections[using].vendor != 'postgresql':
+            raise NotImplementedError('`TreeListener` needs PostgreSQL.')
+        super().__init__(name=f'tree-listener-{channel}', daemon=True)
+        self.channel = channel
+        self.callback = callback
+        self.using = using
+        self.timeout = timeout
+        # Set while the `LISTEN` is in place: nothing committed meanwhile is
+        # lost.
+        self.listening = Event()
+        self._stopped = Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        reconnecting = False
+        while not self._stopped.is_set():
+            wrapper = connections.create_connection(self.using)
+            try:
+                with wrapper.wrap_database_errors:
+                    self._listen(wrapper, reconnecting)
+            except OperationalError:
+                logger.exception(
+                    'Lost the connection listening to %r, reconnecting.', self.channel
+                )
+                self.listening.clear()
+                reconnecting = True
+                self._stopped.wait(self.timeout)
+            finally:
+                wrapper.close()
+
+    def _listen(self, wrapper: Any, reconnecting: bool) -> None:
+        with wrapper.cursor() as cursor:
+            cursor.execute('LISTEN %s' % wrapper.ops.quote_name(self.channel))
+        self.listening.set()
+        if reconnecting:
+            self._call(b'')
+        connection = wrapper.connection
+        while not self._stopped.is_set():
+            for payload in self._wait(connection):
+                self._call(bytes.fromhex(payload))
+
+    def _call(self, prefix: bytes) -> None:
+        try:
+            self.callback(prefix)
+        except Exception:
+            logger.exception(
+                'The callback listening to %r failed on %r.', self.channel, prefix
+            )
+
+    def _wait(self, connection: Any) -> list[str]:
+        if callable(connection.notifies):
+            # psycopg 3: a generator that returns once `timeout` has elapsed
+            # (psycopg >= 3.2).
+            return [
+                notify.payload for notify in connection.notifies(timeout=self.timeout)
+            ]
+        # psycopg2: wait for the socket, then read the queued notifications.
+        if select([connection], [], [], self.timeout)[0]:
+            connection.poll()
+        payloads = [notify.payload for notify in connection.notifies]
+        connection.notifies.clear()
+        return payloads
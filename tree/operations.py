@@ -44,14 +44,21 @@ class CreateTreeTrigger(Operation, GetModelMixin, CheckDatabaseMixin):
     reversible = True
     atomic = True
 
-    def __init__(self, model_lookup: str, path_field: str = 'path') -> None:
+    def __init__(
+        self, model_lookup: str, path_field: str = 'path', notify: str | None = None
+    ) -> None:
         self.model_lookup = model_lookup
         self.path_field_lookup = path_field
+        # The `LISTEN` channel the trigger notifies with the written paths (see
+        # `tree.notify`); PostgreSQL only.
+        self.notify = notify
 
     def get_pre_params(self, model: type[Model]) -> dict[str, str]:
         meta = model._meta
         path_field = cast('PathField', meta.get_field(self.path_field_lookup))
         parent_field = path_field.parent_field
+        changed_at_field = path_field.changed_at_field
+        ancestors_field = path_field.ancestors_field
         order_by = path_field.order_by
 
         # TODO: `order_by` resolves local model fields and `pk` only; related
@@ -73,7 +80,7 @@ class CreateTreeTrigger(Operation, GetModelMixin, CheckDatabaseMixin):
             quoted_field_name = quote_ident(field.attname)
             update_columns.append(quoted_field_name)
 
-        return dict(
+        params = dict(
             table=quote_ident(meta.db_table),
             pk=quote_ident(meta.pk.attname),
             parent=parent,
@@ -84,7 +91,56 @@ class CreateTreeTrigger(Operation, GetModelMixin, CheckDatabaseMixin):
                 f'rebuild_{meta.db_table}_{path_field.attname}'
             ),
             constraint=quote_ident(f'{meta.db_table}_{path_field.attname}_unique'),
+            notify_function=quote_ident(
+                f'notify_{meta.db_table}_{path_field.attname}_paths'
+            ),
+            # A string literal: `pg_notify` takes the channel as text.
+            channel="'%s'" % (self.notify or '').replace("'", "''"),
+            changed_at_function=quote_ident(
+                f'stamp_{meta.db_table}_{path_field.attname}_subtrees'
+            ),
+            changed_at=(
+                ''
+                if changed_at_field is None
+                else quote_ident(changed_at_field.attname)
+            ),
+            ancestors_function=quote_ident(
+                f'ancestors_{meta.db_table}_{path_field.attname}'
+            ),
+            ancestors_index=quote_ident(
+                f'{meta.db_table}_{path_field.attname}_ancestors_index'
+            ),
+            ancestors=(
+                '' if ancestors_field is None else quote_ident(ancestors_field.attname)
+            ),
+            rebuild_ancestors='',
+            rollups_function=quote_ident(
+                f'rollup_{meta.db_table}_{path_field.attname}'
+            ),
+            rollups_rebuild_function=quote_ident(
+                f'rebuild_{meta.db_table}_{path_field.attname}_rollups'
+            ),
+            rebuilding_rollups='',
+            rebuild_rollups='',
         )
+        if ancestors_field is not None:
+            # The rebuild function recomputes every ancestor array, once the
+            # paths are rebuilt.
+            params['rebuild_ancestors'] = (
+                postgresql.ANCESTORS_UPDATE % 'd.{path} IS NOT NULL'
+            ).format(**params)
+        if path_field.rollups:
+            # The rollup trigger stands aside for the whole rebuild, whose path
+            # updates would otherwise each apply their difference, only for the
+            # rollups to be recomputed at the end anyway (which resets it).
+            params['rebuilding_rollups'] = (
+                "PERFORM set_config('tree.rebuilding_rollups', '%s', true);"
+                % meta.db_table.replace("'", "''")
+            )
+            params['rebuild_rollups'] = 'PERFORM {}();'.format(
+                params['rollups_rebuild_function']
+            )
+        return params
 
     def state_forwards(self, app_label: str, state: ProjectState) -> None:
         pass
@@ -111,7 +167,25 @@ class CreateTreeTrigger(Operation, GetModelMixin, CheckDatabaseMixin):
             ),
             params=None,
         )
-        for sql_query in postgresql.CREATE_TRIGGER_QUERIES:
+        sql_queries: tuple[str, ...] = postgresql.CREATE_TRIGGER_QUERIES
+        path_field = cast('PathField', model._meta.get_field(self.path_field_lookup))
+        if path_field.versioned:
+            sql_queries += postgresql.VERSION_TRIGGER_QUERIES
+        if self.notify:
+            sql_queries += postgresql.NOTIFY_TRIGGER_QUERIES
+        if path_field.changed_at_field is not None:
+            sql_queries += postgresql.CHANGED_AT_TRIGGER_QUERIES
+        if path_field.ancestors_field is not None:
+            sql_queries += postgresql.ANCESTORS_TRIGGER_QUERIES
+        if path_field.rollups:
+            schema_editor.execute(
+                postgresql.get_rollups_function_creation(
+                    model, self.path_field_lookup, schema_editor.connection
+                ),
+                params=None,
+            )
+            sql_queries += postgresql.ROLLUP_TRIGGER_QUERIES
+        for sql_query in sql_queries:
             schema_editor.execute(
                 sql_query.format(**self.get_pre_params(model=model)), params=None
             )
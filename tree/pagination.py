@@ -0,0 +1,83 @@
+from base64 import b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections.abc import Sequence
+from typing import Any, overload
+
+from django.core.paginator import InvalidPage
+from django.db.models import Model, QuerySet
+
+from .query import _get_path_field
+from .sql.helpers import DELIMITER
+
+
+def encode_cursor(path: bytes) -> str:
+    """Opaque, URL-safe cursor pointing right after ``path``."""
+    return urlsafe_b64encode(path).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> bytes:
+    try:
+        path = b64decode(
+            cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True
+        )
+    except (BinasciiError, ValueError) as e:
+        raise InvalidPage('Invalid cursor.') from e
+    # A cursor always holds a stored path.
+    if not path.endswith(DELIMITER):
+        raise InvalidPage('Invalid cursor.')
+    return path
+
+
+class CursorPage(Sequence):
+    def __init__(self, object_list: list[Model], next_cursor: str | None) -> None:
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __repr__(self) -> str:
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    @overload
+    def __getitem__(self, index: int) -> Model: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Model]: ...
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+class PathCursorPaginator:
+    """Paginates a queryset in tree (path) order with opaque path cursors.
+
+    Each page is ``path > <cursor>`` ordered by path, limited to ``per_page``:
+    an index range scan, so page N costs the same as page 1 (unlike ``OFFSET``,
+    which reads and discards every previous row). The path is unique, so no row
+    is skipped or repeated between pages. Rows without a path (e.g. while the
+    trigger is disabled) can't be pointed at by a cursor, so they are left out.
+    """
+
+    def __init__(
+        self, queryset: QuerySet, per_page: int, path_field: str | None = None
+    ) -> None:
+        self.attname = _get_path_field(queryset.model, path_field).attname
+        self.queryset = queryset.filter(**{f'{self.attname}__isnull': False}).order_by(
+            self.attname
+        )
+        self.per_page = per_page
+
+    def page(self, cursor: str | None = None) -> CursorPage:
+        qs = self.queryset
+        if cursor:
+            qs = qs.filter(**{f'{self.attname}__gt': decode_cursor(cursor)})
+        # One extra row tells whether there is a next page.
+        rows = list(qs[: self.per_page + 1])
+        if len(rows) <= self.per_page:
+            return CursorPage(rows, None)
+        rows = rows[: self.per_page]
+        return CursorPage(rows, encode_cursor(getattr(rows[-1], self.attname).value))
@@ -0,0 +1,78 @@
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any
+
+from django.apps import apps
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.sql import Query
+
+
+def _process_range(
+    func: Callable[[QuerySet], Any],
+    model_label: str,
+    query: Query,
+    using: str,
+    lo: bytes | None,
+    hi: bytes | None,
+    path_field: str | None,
+) -> Any:
+    # The task only carries picklable parts (pickling a `QuerySet` would
+    # evaluate it in the parent), so a process pool can run it too; the range's
+    # queryset is rebuilt here, in the worker.
+    model = apps.get_model(model_label)
+    queryset = model._default_manager.db_manager(using).all()
+    queryset.query = query
+    queryset = queryset.filter_range(lo, hi, path_field=path_field)  # type: ignore[attr-defined]
+    # Django opens one connection per thread (or process); close the ones the
+    # worker opened so a pool does not leak one per worker. An executor running
+    # the task inline, on the caller's thread, leaves the caller's connections
+    # (maybe mid-transaction) open.
+    already_open = {
+        conn.alias
+        for conn in connections.all(initialized_only=True)
+        if conn.connection is not None
+    }
+    try:
+        return func(queryset)
+    finally:
+        for conn in connections.all(initialized_only=True):
+            if conn.alias not in already_open and not conn.in_atomic_block:
+                conn.close()
+
+
+def process_ranges(
+    queryset: QuerySet,
+    func: Callable[[QuerySet], Any],
+    n: int,
+    executor: Executor | None = None,
+    path_field: str | None = None,
+) -> list[Any]:
+    """Calls ``func`` concurrently on ``n`` balanced, disjoint path ranges of
+    ``queryset`` (see ``QuerySet.split_ranges()``), each worker on its own
+    database connection, and returns the results in path order.
+
+    Defaults to a pool of ``n`` threads, which suits I/O-bound work (the
+    database does the scanning). For CPU-bound work, pass a
+    ``ProcessPoolExecutor``: each task only carries the range bounds, the
+    model label and the unevaluated query, but ``func`` must be picklable (a
+    module-level function), and the parent's connections must be closed before
+    the workers fork, as they cannot be shared with a child process.
+    """
+    ranges = queryset.split_ranges(n, path_field=path_field)  # type: ignore[attr-defined]
+    tasks = [
+        (
+            func,
+            queryset.model._meta.label,
+            queryset.query,
+            queryset.db,
+            lo,
+            hi,
+            path_field,
+        )
+        for lo, hi in ranges
+    ]
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+            return list(pool.map(_process_range, *zip(*tasks)))
+    return list(executor.map(_process_range, *zip(*tasks)))
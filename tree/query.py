@@ -1,11 +1,28 @@
+from collections.abc import Iterator
 from typing import TYPE_CHECKING, Any, cast
 
-from django.core.exceptions import FieldDoesNotExist
-from django.db.models import Exists, Field, Model, OuterRef, QuerySet
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db import connections
+from django.db.models import (
+    Exists,
+    F,
+    Field,
+    Func,
+    IntegerField,
+    Model,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+)
 from django.db.models.manager import Manager
+from django.db.models.query import ModelIterable
 
 from .fields import PathField
+from .memo import invalidate_tree_memo
 from .sql import is_trigger_backend
+from .sql.helpers import tree_level, tree_prefixes
+from .types import Path, TreeNode
 
 if TYPE_CHECKING:
     # `TreeQuerySetMixin` is only ever combined with `QuerySet` (see
@@ -15,6 +32,12 @@ if TYPE_CHECKING:
 else:
     _QuerySetBase = object
 
+# Above this many paths to bind, the `QuerySet` tree methods (e.g.
+# `get_descendants()`, one range per member) correlate the members in an
+# `EXISTS` instead: Oracle caps `IN` lists at a thousand elements, and SQLite and
+# others cap the parameters of a statement.
+MAX_BOUND_PATHS = 300
+
 
 def _get_path_fields(model: type[Model], name: str | None = None) -> list[PathField]:
     if name is None:
@@ -52,8 +75,45 @@ def _get_path_field(model: type[Model], name: str | None) -> PathField:
     )
 
 
+def _topmost_paths(paths: list[bytes]) -> list[bytes]:
+    # Sorted, a path nested under another one follows it (or one of its
+    # descendants), so a single pass against the last kept path drops every
+    # nested path: O(n) after the O(n log n) sort.
+    topmost: list[bytes] = []
+    for path in paths:
+        if not topmost or not path.startswith(topmost[-1]):
+            topmost.append(path)
+    return topmost
+
+
+def _attach_prefetched(path: Path, prefetched: dict[str, list[Model]]) -> None:
+    path._prefetched_tree = {**(path._prefetched_tree or {}), **prefetched}
+
+
 # TODO: Implement a faster `QuerySet.delete` and add it to the benchmark.
 class TreeQuerySetMixin(_QuerySetBase):
+    # The arguments of the `_prefetch_<kind>` methods to run once this queryset
+    # is fetched, by `<kind>[:<name>]` (set by `prefetch_tree()`,
+    # `with_ancestors()`, ...); replaced (never mutated) by each call.
+    _tree_prefetch: dict[str, tuple[Any, ...]] | None = None
+
+    def _clone(self) -> Any:
+        clone = super()._clone()  # type: ignore[misc]
+        clone._tree_prefetch = self._tree_prefetch
+        return clone
+
+    def _fetch_all(self) -> None:
+        fetched = self._result_cache is not None
+        super()._fetch_all()  # type: ignore[misc]
+        if (
+            not fetched
+            and self._tree_prefetch
+            and issubclass(self._iterable_class, ModelIterable)
+        ):
+            for key, args in self._tree_prefetch.items():
+                kind = key.partition(':')[0]
+                getattr(self, f'_prefetch_{kind}')(*args)
+
     def _get_path_field_attname(self, name: str | None) -> str:
         return _get_path_field(self.model, name).attname
 
@@ -76,7 +136,88 @@ class TreeQuerySetMixin(_QuerySetBase):
             if force_all or (changed_names and changed_names & _watched_names(field)):
                 field.rebuild(db_alias=self.db)
 
+    def _invalidate_tree_memo(self) -> None:
+        # Before any ORM write: the navigation memoized in this request (see
+        # `tree.memo`) may no longer hold.
+        for field in _get_path_fields(self.model):
+            invalidate_tree_memo(field.model)
+
+    def _bump_tree_version(self) -> None:
+        # After an ORM write off PostgreSQL, where no trigger bumps the
+        # `TreeVersion` of a `versioned` `PathField`.
+        if is_trigger_backend(self.db):
+            return
+        from .maintenance import bump_version
+
+        bump_version(self.model, self.db)
+
+    def _stamped_paths(self, pks: list[Any] | None) -> dict[str, list[bytes]]:
+        # The current paths of the rows ``pks`` (of every row for ``None``), for
+        # each `PathField` with a `changed_at_field`, in one query. Empty on
+        # PostgreSQL, where the trigger stamps the subtrees.
+        fields = [
+            field
+            for field in _get_path_fields(self.model)
+            if field.changed_at_field_name is not None
+        ]
+        if not fields or is_trigger_backend(self.db):
+            return {}
+        attnames = [field.attname for field in fields]
+        rows = self.model._base_manager.using(self.db)
+        if pks is not None:
+            rows = rows.filter(pk__in=pks)
+        paths: dict[str, list[bytes]] = {attname: [] for attname in attnames}
+        for row in rows.values_list(*attnames):
+            for attname, path in zip(attnames, row):
+                if path := Path._as_bytes(path):
+                    paths[attname].append(path)
+        return paths
+
+    def _stamp_subtrees(
+        self, pks: list[Any] | None, old_paths: dict[str, list[bytes]]
+    ) -> None:
+        # After an ORM write off PostgreSQL: stamps the subtrees containing the
+        # written rows, before (``old_paths``) and after the write.
+        from .maintenance import stamp_subtrees
+
+        for attname, paths in self._stamped_paths(pks).items():
+            field = cast(PathField, self.model._meta.get_field(attname))
+            stamp_subtrees(field, self.db, [*old_paths.get(attname, ()), *paths])
+
+    def _rollup_states(self, pks: list[Any]) -> dict[str, dict[Any, Any]]:
+        # The paths and rollup contributions of the rows ``pks``, for each
+        # `PathField` with rollups. Empty on PostgreSQL, where the trigger
+        # maintains the rollups.
+        if is_trigger_backend(self.db):
+            return {}
+        from .maintenance import PathMaintainer, is_trigger_disabled
+
+        return {
+            field.attname: PathMaintainer(field, self.db).rollup_contributions(pks)
+            for field in _get_path_fields(self.model)
+            if field.rollups and not is_trigger_disabled(field, self.db)
+        }
+
+    def _update_rollups(
+        self, pks: list[Any], before: dict[str, dict[Any, Any]], moved: set[str]
+    ) -> None:
+        # After an ORM write off PostgreSQL: applies the change of contribution
+        # of the written rows to their ancestors, or recomputes the rollups of
+        # a field whose rows may have moved.
+        from .maintenance import PathMaintainer
+
+        for attname, states in before.items():
+            field = cast(PathField, self.model._meta.get_field(attname))
+            maintainer = PathMaintainer(field, self.db)
+            if attname in moved:
+                maintainer.rebuild_rollups()
+            else:
+                maintainer.add_rollup_deltas(
+                    states, maintainer.rollup_contributions(pks)
+                )
+
     def update(self, **kwargs: Any) -> int:
+        self._invalidate_tree_memo()
         if is_trigger_backend(self.db):
             return super().update(**kwargs)
         from .maintenance import PathMaintainer, is_trigger_disabled
@@ -88,37 +229,66 @@ class TreeQuerySetMixin(_QuerySetBase):
             if not is_trigger_disabled(field, self.db)
             and changed & _watched_names(field)
         ]
-        if not maintainers:
-            return super().update(**kwargs)
+        derived = any(
+            field.changed_at_field_name or field.rollups
+            for field in _get_path_fields(self.model)
+        )
+        if not maintainers and not derived:
+            result = super().update(**kwargs)
+            self._bump_tree_version()
+            return result
 
         # Replay the path computation per affected row, like the PostgreSQL
         # trigger, so a re-parent/reorder leaves every other path untouched (a
         # full rebuild would renumber the whole tree). The OLD values are read
         # before the update so descendants move with their subtree.
         pks = list(self.values_list('pk', flat=True))
+        old_paths = self._stamped_paths(pks)
         old_states = [(m, m.capture_old_many(pks)) for m in maintainers]
+        rollup_states = self._rollup_states(pks)
         result = super().update(**kwargs)
-        base = self.model._base_manager.using(self.db)
-        for instance in base.filter(pk__in=pks):
-            tree_old = instance.__dict__.setdefault('_tree_old', {})
-            for maintainer, olds in old_states:
-                tree_old[maintainer.path_attname] = olds.get(instance.pk)
-                maintainer.on_save(instance, created=False)
+        if maintainers:
+            base = self.model._base_manager.using(self.db)
+            for instance in base.filter(pk__in=pks):
+                tree_old = instance.__dict__.setdefault('_tree_old', {})
+                for maintainer, olds in old_states:
+                    tree_old[maintainer.path_attname] = olds.get(instance.pk)
+                    maintainer.on_save(instance, created=False)
+        self._stamp_subtrees(pks, old_paths)
+        self._update_rollups(pks, rollup_states, {m.path_attname for m in maintainers})
+        self._bump_tree_version()
         return result
 
     def bulk_create(self, objs: Any, *args: Any, **kwargs: Any) -> list:
+        self._invalidate_tree_memo()
         objs = list(objs)
         result = super().bulk_create(objs, *args, **kwargs)
         if objs:
             self._reconcile_tree(None, force_all=True)
+            # Without the pks of the new rows (e.g. on MySQL), every subtree
+            # may have changed.
+            pks = [obj.pk for obj in objs]
+            self._stamp_subtrees(None if None in pks else pks, {})
+            self._bump_tree_version()
         return result
 
     def bulk_update(self, objs: Any, fields: Any, *args: Any, **kwargs: Any) -> int:
+        self._invalidate_tree_memo()
+        objs = list(objs)
+        pks = [obj.pk for obj in objs]
+        old_paths = self._stamped_paths(pks)
+        # Each batch goes through `update()`, which maintains the rollups.
         result = super().bulk_update(objs, fields, *args, **kwargs)
         self._reconcile_tree(set(fields))
+        if result:
+            self._stamp_subtrees(pks, old_paths)
+            self._bump_tree_version()
         return result
 
     def delete(self) -> Any:
+        self._invalidate_tree_memo()
+        # Off PostgreSQL the `post_delete` receiver of a `versioned` field bumps
+        # its `TreeVersion`, whether the rows go through here or `Model.delete()`.
         result = super().delete()
         if is_trigger_backend(self.db):
             return result
@@ -153,16 +323,452 @@ class TreeQuerySetMixin(_QuerySetBase):
         self, include_self: bool = False, path_field: str | None = None
     ) -> QuerySet:
         attname = self._get_path_field_attname(path_field)
-        # A row is a descendant of this queryset when one of its members is an
-        # ancestor (or itself). We express that as a single correlated `EXISTS`
-        # against the members, instead of fetching every member path and OR-ing
-        # one range clause per member (which also needed an extra query).
-        members = self.filter(**{f'{attname}__ancestor_of': OuterRef(attname)})
-        result = self.model._default_manager.filter(Exists(members))
+        # Fetch the member paths once, then select one `[P, tree_upper(P))` range
+        # per topmost member: each is an index range scan, where a correlated
+        # `EXISTS` with `ancestor_of` had to slice every row of the table against
+        # every member. The ranges of nested members are already covered.
+        paths = self._member_paths(attname, limit=MAX_BOUND_PATHS + 1)
+        result = self.model._default_manager.db_manager(self.db).all()
+        if len(paths) > MAX_BOUND_PATHS:
+            # Too many members to bind their paths: keep the `EXISTS` against
+            # the (still lazy) members.
+            members = self.filter(**{f'{attname}__ancestor_of': OuterRef(attname)})
+            result = result.filter(Exists(members))
+            if not include_self:
+                result = result.exclude(pk__in=self.values('pk'))
+            return result
+        cover = _topmost_paths(paths)
+        if not cover:
+            return result.none()
+        lookup = f'{attname}__descendant_of'
+        condition = Q()
+        for path in cover:
+            condition |= Q(**{lookup: path})
+        result = result.filter(condition)
         if not include_self:
-            result = result.exclude(pk__in=self.values('pk'))
+            result = result.exclude(**{f'{attname}__in': paths})
         return result
 
+    def get_ancestors(
+        self, include_self: bool = False, path_field: str | None = None
+    ) -> QuerySet:
+        attname = self._get_path_field_attname(path_field)
+        # The ancestors of a path are its level-aligned prefixes, so the union of
+        # every member's ancestors is computed in Python and selected with one
+        # indexed `IN` -- e.g. the breadcrumbs of a whole result page at once.
+        # A member that is the ancestor of another member is kept either way.
+        paths = self._member_paths(attname, limit=MAX_BOUND_PATHS + 1)
+        ancestors: set[bytes] = set()
+        for path in paths:
+            prefixes = tree_prefixes(path)
+            ancestors.update(prefixes if include_self else prefixes[:-1])
+        result = self.model._default_manager.db_manager(self.db).all()
+        if len(paths) > MAX_BOUND_PATHS or len(ancestors) > MAX_BOUND_PATHS:
+            # Too many paths to bind: select the rows above a member instead.
+            lookup = 'descendant_of' if include_self else 'strict_descendant_of'
+            members = self.filter(**{f'{attname}__{lookup}': OuterRef(attname)})
+            return result.filter(Exists(members)).order_by(attname)
+        if not ancestors:
+            return result.none()
+        return result.filter(**{f'{attname}__in': sorted(ancestors)}).order_by(attname)
+
+    def topmost(self, path_field: str | None = None) -> QuerySet:
+        # The members that have no ancestor among the other members, e.g. the
+        # roots of a set of selected sections.
+        attname = self._get_path_field_attname(path_field)
+        paths = self._member_paths(attname, limit=MAX_BOUND_PATHS + 1)
+        if len(paths) > MAX_BOUND_PATHS:
+            return self._without_nested_members(attname, 'ancestor_of')
+        return self.filter(**{f'{attname}__in': _topmost_paths(paths)})
+
+    def bottommost(self, path_field: str | None = None) -> QuerySet:
+        # The members that have no descendant among the other members.
+        attname = self._get_path_field_attname(path_field)
+        paths = self._member_paths(attname, limit=MAX_BOUND_PATHS + 1)
+        if len(paths) > MAX_BOUND_PATHS:
+            return self._without_nested_members(attname, 'descendant_of')
+        # Sorted, a member's descendants directly follow it, so it is bottommost
+        # iff the next path does not start with it.
+        paths = [
+            path
+            for path, following in zip(paths, [*paths[1:], b''])
+            if not following.startswith(path)
+        ]
+        return self.filter(**{f'{attname}__in': paths})
+
+    def _without_nested_members(self, attname: str, lookup: str) -> QuerySet:
+        # Too many members to bind their paths: exclude, in SQL, those with
+        # another member at ``lookup`` (e.g. `ancestor_of`) from them.
+        others = self.filter(**{f'{attname}__{lookup}': OuterRef(attname)}).exclude(
+            pk=OuterRef('pk')
+        )
+        return self.filter(**{f'{attname}__isnull': False}).exclude(Exists(others))
+
+    def prefetch_tree(
+        self,
+        children: bool = True,
+        descendants: bool = False,
+        max_depth: int | None = None,
+        path_field: str | None = None,
+    ) -> QuerySet:
+        # Like `prefetch_related`, but for the tree lookups (which have no
+        # relation for Django to prefetch): once this queryset is evaluated, a
+        # single query fetches the children (or the descendants, down to
+        # `max_depth` levels) of every member, and their `get_children()` /
+        # `get_descendants()` are then served from that cache. A depth-limited
+        # subtree is only served by `get_prefetched_descendants()`: the queryset
+        # of `get_descendants()` still means the whole subtree.
+        clone = self._chain()  # type: ignore[attr-defined]
+        clone._tree_prefetch = {
+            **(self._tree_prefetch or {}),
+            'tree': (children, descendants, max_depth, path_field),
+        }
+        return clone
+
+    def with_ancestors(self, path_field: str | None = None) -> QuerySet:
+        # Once this queryset is evaluated, a single query loads every distinct
+        # ancestor of its members, and each member's `get_ancestors()` (root to
+        # parent) is then served from that shared map -- e.g. the breadcrumbs or
+        # inherited settings of a whole page for one round trip.
+        clone = self._chain()  # type: ignore[attr-defined]
+        clone._tree_prefetch = {
+            **(self._tree_prefetch or {}),
+            'ancestors': (path_field,),
+        }
+        return clone
+
+    def annotate_descendant_count(
+        self,
+        name: str = 'descendant_count',
+        filter: Q | None = None,
+        path_field: str | None = None,
+    ) -> QuerySet:
+        # The number of (strict) descendants of every member matching `filter`,
+        # for one query instead of a `get_descendants().count()` per member. On
+        # PostgreSQL each correlated count is an index range scan (`tree_upper`
+        # is IMMUTABLE); elsewhere it compares path prefixes, without index.
+        attname = self._get_path_field_attname(path_field)
+        descendants = self.model._default_manager.filter(
+            **{f'{attname}__strict_descendant_of': OuterRef(attname)}
+        )
+        if filter is not None:
+            descendants = descendants.filter(filter)
+        count = (
+            descendants.order_by()
+            .annotate(_count=Func(F('pk'), function='COUNT'))
+            .values('_count')
+        )
+        return self.annotate(**{name: Subquery(count, output_field=IntegerField())})
+
+    def annotate_tree_info(self, path_field: str | None = None) -> QuerySet:
+        # Adds `<path>_children_count`, `<path>_is_leaf` and `<path>_level` to
+        # the SELECT, so a tree widget rendering every node costs one query
+        # instead of one `is_leaf()` query per node. Prefixed with the path
+        # attname, they neither shadow `TreeModelMixin.is_leaf()` nor clash with
+        # the model's own fields. On model instances, `Path.is_leaf()` /
+        # `get_level()` (and the `TreeModelMixin` shortcuts) then read them.
+        field = _get_path_field(self.model, path_field)
+        attname = field.attname
+        trigger_backend = is_trigger_backend(self.db)
+        if trigger_backend:
+            # The `(level, path)` index serves the `child_of` range.
+            children = self.model._default_manager.filter(
+                **{f'{attname}__child_of': OuterRef(attname)}
+            )
+        else:
+            # `child_of` needs a constant path off PostgreSQL; the parent FK
+            # (indexed) selects the same rows.
+            children = self.model._default_manager.filter(
+                **{field.parent_field.name: OuterRef('pk')}
+            )
+        count = (
+            children.order_by()
+            .annotate(_count=Func(F('pk'), function='COUNT'))
+            .values('_count')
+        )
+        qs = self.annotate(
+            **{
+                f'{attname}_children_count': Subquery(
+                    count, output_field=IntegerField()
+                ),
+                f'{attname}_is_leaf': ~Exists(children),
+            }
+        )
+        if trigger_backend:
+            qs = qs.annotate(**{f'{attname}_level': F(f'{attname}__level')})
+        qs._tree_prefetch = {
+            **(qs._tree_prefetch or {}),
+            f'tree_info:{attname}': (path_field,),
+        }
+        return qs
+
+    def _prefetch_tree_info(self, path_field: str | None) -> None:
+        attname = self._get_path_field_attname(path_field)
+        for instance in cast(list, self._result_cache):
+            path = getattr(instance, attname)
+            path._tree_info = {
+                'children_count': getattr(instance, f'{attname}_children_count'),
+                'is_leaf': getattr(instance, f'{attname}_is_leaf'),
+                # `__level` has no SQL form off PostgreSQL, but the path has it.
+                'level': instance.__dict__.get(f'{attname}_level') or path.get_level(),
+            }
+
+    def iter_subtree(
+        self,
+        chunk_size: int = 2000,
+        after: Path | bytes | None = None,
+        path_field: str | None = None,
+    ) -> Iterator[Model]:
+        # Iterates over this queryset in path order, `chunk_size` rows per query.
+        # The path is unique and totally ordered, so each chunk resumes with
+        # `path > <last path seen>` (keyset pagination): an index range scan as
+        # fast for the last chunk as for the first, unlike `OFFSET`, and without
+        # the long-running server-side cursor of `.iterator()`. Rows without a
+        # path (e.g. while the trigger is disabled) have no place in that order,
+        # so they are skipped; resuming after one would restart from the top.
+        attname = self._get_path_field_attname(path_field)
+        qs = self.filter(**{f'{attname}__isnull': False}).order_by(attname)
+        last = after.value if isinstance(after, Path) else after
+        while True:
+            chunk = qs if last is None else qs.filter(**{f'{attname}__gt': last})
+            rows = list(chunk[:chunk_size])
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            last = getattr(rows[-1], attname).value
+
+    def split_ranges(
+        self, n: int, sample_size: int = 10000, path_field: str | None = None
+    ) -> list[tuple[bytes | None, bytes | None]]:
+        # Splits this queryset into (at most) `n` disjoint `[lo, hi)` path ranges
+        # holding about as many rows each, e.g. to scan a huge subtree in
+        # parallel (see `tree.parallel`). The bounds are quantiles of a sample of
+        # about `sample_size` paths on PostgreSQL, or probed one by one from the
+        # path index (see `_probe_quantiles()`); `None` leaves a range open on
+        # that side (the queryset's own filters still bound it). The first range
+        # also holds the rows without a path (see `filter_range()`), so together
+        # they cover every row exactly once.
+        attname = self._get_path_field_attname(path_field)
+        sample = self._sample_paths(attname, sample_size)
+        if sample is None:
+            quantiles = self._probe_quantiles(attname, n)
+        else:
+            quantiles = [sample[i * len(sample) // n] for i in range(1, n) if sample]
+        bounds: list[bytes | None] = [None]
+        for bound in quantiles:
+            if bounds[-1] is None or bound > bounds[-1]:
+                bounds.append(bound)
+        bounds.append(None)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _sample_paths(self, attname: str, sample_size: int) -> list[bytes] | None:
+        # The sorted paths of about `sample_size` members, without sorting the
+        # whole queryset randomly (`ORDER BY random()` reads and sorts every
+        # row). PostgreSQL reads a random subset of the table's pages with
+        # `TABLESAMPLE SYSTEM`, sized from the planner's row estimate. `None`
+        # when there is no such sample: with too few members among those pages
+        # (a small subtree of a big table), or on the other backends.
+        if not is_trigger_backend(self.db):
+            return None
+        qs = (
+            self.filter(**{f'{attname}__isnull': False})
+            .order_by()
+            .values_list(attname, flat=True)
+        )
+        try:
+            sql, params = qs.query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            return []
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table]
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else 0
+            from_table = f'FROM {table}'
+            if estimate > 0 and from_table in sql:
+                # The base table comes first; later ones are in subqueries.
+                percent = min(100.0, 200.0 * sample_size / estimate)
+                sql = sql.replace(
+                    from_table, f'{from_table} TABLESAMPLE SYSTEM ({percent:f})', 1
+                )
+                cursor.execute(sql, params)
+                sample = sorted(
+                    path
+                    for path in map(Path._as_bytes, (row[0] for row in cursor))
+                    if path
+                )
+                if percent == 100.0 or len(sample) >= sample_size // 10:
+                    return sample
+        return None
+
+    def _probe_quantiles(self, attname: str, n: int) -> list[bytes]:
+        # The `n - 1` inner quantiles of the members' paths, each read with an
+        # `OFFSET k LIMIT 1` probe of the ordered path index: `n` small queries
+        # instead of streaming every path.
+        qs = (
+            self.filter(**{f'{attname}__isnull': False})
+            .order_by(attname)
+            .values_list(attname, flat=True)
+        )
+        count = qs.count()
+        quantiles = []
+        for i in range(1, n):
+            k = i * count // n
+            quantiles += [path for path in map(Path._as_bytes, qs[k : k + 1]) if path]
+        return quantiles
+
+    def filter_range(
+        self,
+        lo: bytes | None,
+        hi: bytes | None,
+        path_field: str | None = None,
+    ) -> QuerySet:
+        # The rows of one `split_ranges()` range; the first one (`lo=None`) also
+        # holds the rows without a path, which sort outside every range.
+        attname = self._get_path_field_attname(path_field)
+        qs = self.all()
+        if lo is not None:
+            qs = qs.filter(**{f'{attname}__gte': lo})
+        if hi is not None:
+            condition = Q(**{f'{attname}__lt': hi})
+            if lo is None:
+                condition |= Q(**{f'{attname}__isnull': True})
+            qs = qs.filter(condition)
+        return qs
+
+    def as_tree(self, *fields: str, path_field: str | None = None) -> list[TreeNode]:
+        # Paths sort depth-first, so a single `ORDER BY path` scan builds the
+        # nested structure with a stack of the current ancestors: O(n), one
+        # query, instead of recursive `get_children()` calls. With `fields`, the
+        # items are `values(*fields)` dicts instead of model instances. A node
+        # whose parent is not in the queryset hangs from its closest ancestor
+        # that is (or is returned as a top-level node).
+        attname = self._get_path_field_attname(path_field)
+        qs = self.order_by(attname)
+        if fields:
+            qs = qs.values(*dict.fromkeys([*fields, attname]))
+        roots: list[TreeNode] = []
+        stack: list[TreeNode] = []
+        for item in qs:
+            if fields:
+                path = item[attname] if attname in fields else item.pop(attname)
+            else:
+                path = getattr(item, attname)
+            value = Path._as_bytes(path)
+            if value is None:
+                continue
+            node = TreeNode(item, value)
+            while stack and not node.path.startswith(stack[-1].path):
+                stack.pop()
+            (stack[-1].children if stack else roots).append(node)
+            stack.append(node)
+        return roots
+
+    def _fetched_paths(self, attname: str) -> dict[bytes, list[tuple[Model, Path]]]:
+        # The fetched members and their `Path`, by path value (several instances
+        # of the same row each get their own `Path`).
+        members: dict[bytes, list[tuple[Model, Path]]] = {}
+        for instance in cast(list, self._result_cache):
+            path = getattr(instance, attname)
+            if path.value:
+                members.setdefault(path.value, []).append((instance, path))
+        return members
+
+    def _prefetch_ancestors(self, path_field: str | None) -> None:
+        attname = self._get_path_field_attname(path_field)
+        members = self._fetched_paths(attname)
+        ancestor_paths: set[bytes] = set()
+        for value in members:
+            ancestor_paths.update(tree_prefixes(value)[:-1])
+        by_path: dict[bytes, Model] = {}
+        if ancestor_paths:
+            rows = self.model._default_manager.db_manager(self.db).filter(
+                **{f'{attname}__in': sorted(ancestor_paths)}
+            )
+            by_path = {getattr(row, attname).value: row for row in rows}
+        for value, member_paths in members.items():
+            ancestors = [
+                by_path[prefix]
+                for prefix in tree_prefixes(value)[:-1]
+                if prefix in by_path
+            ]
+            for instance, path in member_paths:
+                _attach_prefetched(path, {'ancestors': [*ancestors, instance]})
+
+    def _prefetch_tree(
+        self,
+        children: bool,
+        descendants: bool,
+        max_depth: int | None,
+        path_field: str | None,
+    ) -> None:
+        if not (children or descendants):
+            return
+        attname = self._get_path_field_attname(path_field)
+        members = self._fetched_paths(attname)
+        if not members:
+            return
+        paths = sorted(members)
+        # One query over the union of the member ranges (descendants-or-self of
+        # the topmost members, so each member's own row comes back in place),
+        # or only the direct children of every member.
+        condition = Q()
+        if descendants:
+            for path in _topmost_paths(paths):
+                condition |= Q(**{f'{attname}__descendant_of': path})
+        else:
+            for path in paths:
+                condition |= Q(**{f'{attname}__child_of': path})
+        rows = self.model._default_manager.db_manager(self.db).filter(condition)
+        if descendants and max_depth is not None and is_trigger_backend(self.db):
+            deepest = max(cast(int, tree_level(path)) for path in paths)
+            rows = rows.filter(**{f'{attname}__level__lte': deepest + max_depth})
+
+        found: dict[bytes, dict[str, list[Model]]] = {
+            path: {'children': [], 'descendants': []} for path in paths
+        }
+        for row in rows:
+            row_path = getattr(row, attname).value
+            depth = cast(int, tree_level(row_path))
+            # A row belongs to every member among its ancestors-or-self.
+            for prefix in tree_prefixes(row_path):
+                lists = found.get(prefix)
+                if lists is None:
+                    continue
+                relative = depth - cast(int, tree_level(prefix))
+                if relative == 1:
+                    lists['children'].append(row)
+                if max_depth is None or relative <= max_depth:
+                    lists['descendants'].append(row)
+        # `max_depth=0` fetches no children, so they cannot be served.
+        children = children and (not descendants or max_depth != 0)
+        for value, member_paths in members.items():
+            prefetched: dict[str, list[Model]] = {}
+            if children:
+                prefetched['children'] = found[value]['children']
+            if descendants:
+                prefetched['prefetched_descendants'] = found[value]['descendants']
+                if max_depth is None:
+                    prefetched['descendants'] = found[value]['descendants']
+            for _, member_path in member_paths:
+                _attach_prefetched(member_path, prefetched)
+
+    def _member_paths(self, attname: str, limit: int | None = None) -> list[bytes]:
+        # The distinct, sorted paths of this queryset's members (those without a
+        # path yet have no descendants), as raw bytes whether or not the
+        # `PathField` is lazy; only the first ``limit`` ones if given.
+        values = self.filter(**{f'{attname}__isnull': False}).values_list(
+            attname, flat=True
+        )
+        if limit is None:
+            values = values.order_by().distinct()
+        else:
+            values = values.order_by(attname).distinct()[:limit]
+        return sorted({path for path in map(Path._as_bytes, values) if path})
+
 
 class TreeQuerySet(TreeQuerySetMixin, QuerySet):
     pass
@@ -0,0 +1,73 @@
+"""Subtree aggregates maintained on every write (see `TreeRollup`)."""
+
+from typing import Any
+
+from django.db.models import Case, F, Field, Model, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.deconstruct import deconstructible
+
+AGGREGATES = frozenset({'count', 'sum'})
+
+
+@deconstructible(path='tree.rollups.TreeRollup')
+class TreeRollup:
+    """An aggregate over each node's subtree, the node itself included, stored
+    in the ``field_name`` column of every node.
+
+    ``aggregate`` is ``'count'`` (the rows of the subtree) or ``'sum'`` (of the
+    ``source`` column), optionally restricted to the rows matching ``filter``,
+    a `Q` on the model's own columns. Listed in ``PathField(rollups=[...])``,
+    it is kept up to date by applying the difference each write makes to the
+    ancestors of the written row (from the trigger on PostgreSQL, from the ORM
+    elsewhere), so reading it is a single-row lookup.
+    """
+
+    def __init__(
+        self,
+        field_name: str,
+        aggregate: str = 'count',
+        source: str | None = None,
+        filter: Q | None = None,
+    ) -> None:
+        if aggregate not in AGGREGATES:
+            raise ValueError('Unknown `TreeRollup` aggregate %r.' % aggregate)
+        if (aggregate == 'sum') != (source is not None):
+            raise ValueError('A `TreeRollup` sums a `source` column (only).')
+        self.field_name = field_name
+        self.aggregate = aggregate
+        self.source = source
+        self.filter = filter
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TreeRollup):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def _key(self) -> tuple[Any, ...]:
+        return (self.field_name, self.aggregate, self.source, self.filter)
+
+    def __repr__(self) -> str:
+        return '<%s: %s %s>' % (
+            self.__class__.__name__,
+            self.field_name,
+            self.aggregate if self.source is None else f'sum({self.source})',
+        )
+
+    def get_field(self, model: type[Model]) -> Field:
+        return model._meta.get_field(self.field_name)  # type: ignore[return-value]
+
+    def contribution(self, model: type[Model]) -> Any:
+        """What a row adds to the rollup of its ancestors-or-self, as an ORM
+        expression."""
+        output_field = self.get_field(model)
+        zero = Value(0, output_field=output_field)
+        if self.source is None:
+            value: Any = Value(1, output_field=output_field)
+        else:
+            value = Coalesce(F(self.source), zero, output_field=output_field)
+        if self.filter is None:
+            return value
+        return Case(When(self.filter, then=value), default=zero)
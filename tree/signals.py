@@ -1,23 +1,44 @@
-from functools import lru_cache
+from collections.abc import Callable
 from typing import Any
+from weakref import WeakKeyDictionary
 
+from django.apps import apps
 from django.db import connections
 from django.db.backends.base.base import BaseDatabaseWrapper
 from django.db.backends.signals import connection_created
 from django.db.models import Model
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import (
+    class_prepared,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_migrate,
+    pre_save,
+)
 from django.dispatch import receiver
 
 from tree.fields import PathField
+from tree.memo import invalidate_tree_memo
+
+# Weakly keyed, so that caching a model class never keeps it alive.
+_path_fields_cache: 'WeakKeyDictionary[type[Model], tuple[PathField, ...]]' = (
+    WeakKeyDictionary()
+)
 
 
-@lru_cache(maxsize=None)
 def _path_fields(sender: type[Model]) -> tuple[PathField, ...]:
-    # The save signals run on *every* model, so resolve (and cache) the
-    # `PathField`s once per model class instead of scanning on every save.
-    return tuple(
-        field for field in sender._meta.concrete_fields if isinstance(field, PathField)
-    )
+    # Resolved (and cached) once per model class instead of scanning on every
+    # save.
+    try:
+        return _path_fields_cache[sender]
+    except KeyError:
+        fields = _path_fields_cache[sender] = tuple(
+            field
+            for field in sender._meta.concrete_fields
+            if isinstance(field, PathField)
+        )
+        return fields
 
 
 def _maintains_in_python(using: str) -> bool:
@@ -26,15 +47,12 @@ def _maintains_in_python(using: str) -> bool:
     return connections[using].vendor != 'postgresql'
 
 
-@receiver(pre_save)
 def capture_old_tree_state(
     sender: type[Model], instance: Model, using: str, **kwargs: Any
 ) -> None:
     if not _maintains_in_python(using):
         return
     fields = _path_fields(sender)
-    if not fields:
-        return
     from tree.maintenance import PathMaintainer, is_trigger_disabled
 
     for field in fields:
@@ -43,7 +61,6 @@ def capture_old_tree_state(
         PathMaintainer(field, using).capture_old(instance)
 
 
-@receiver(post_save)
 def maintain_paths(
     sender: type[Model],
     instance: Model,
@@ -52,23 +69,184 @@ def maintain_paths(
     **kwargs: Any,
 ) -> None:
     fields = _path_fields(sender)
-    if not fields:
-        return
+    for field in fields:
+        invalidate_tree_memo(field.model)
+    instance_dict = instance.__dict__
     if _maintains_in_python(using):
-        from tree.maintenance import PathMaintainer
+        from tree.maintenance import PathMaintainer, bump_version, stamp_subtrees
 
+        # The maintenance leaves the path it wrote on the instance, so there is
+        # nothing to re-read.
+        old_paths = instance_dict.get('_tree_old', {})
         for field in fields:
-            PathMaintainer(field, using).on_save(instance, created)
-        instance.__dict__.pop('_tree_old', None)
+            maintainer = PathMaintainer(field, using)
+            path = maintainer.on_save(instance, created)
+            maintainer.update_rollups(instance, created)
+            paths = [old_paths.get(field.attname), path]
+            changed_at_field = field.changed_at_field
+            if changed_at_field is not None:
+                changed_at = stamp_subtrees(field, using, paths)
+                if changed_at is not None:
+                    instance_dict[changed_at_field.attname] = changed_at
+        instance_dict.pop('_tree_old', None)
+        bump_version(sender, using)
+        return
 
-    # Drop the cached path so the next access re-reads the canonical value (the
-    # trigger-computed one on PostgreSQL, the just-written one elsewhere). Django
-    # only exposes `RETURNING pk`, so we cannot get the path back from the write.
-    instance_dict = instance.__dict__
+    # The triggers stamped the row, set its ancestors and its rollups after
+    # writing it: re-read them on access.
+    for field in fields:
+        written_fields = [
+            field.changed_at_field,
+            field.ancestors_field,
+            *(rollup.get_field(sender) for rollup in field.rollups),
+        ]
+        for written_field in written_fields:
+            if written_field is not None:
+                instance_dict.pop(written_field.attname, None)
+    # On PostgreSQL an insert gets the trigger-computed path back through
+    # `RETURNING` (`PathField.db_returning`). An update has no such clause, and
+    # the trigger may have moved the row, so drop the cached path: the next
+    # access re-reads the canonical value.
+    if created and all(field.db_returning for field in fields):
+        return
     for field in fields:
         instance_dict.pop(field.attname, None)
 
 
+def stamp_deleted_subtrees(
+    sender: type[Model], instance: Model, using: str, **kwargs: Any
+) -> None:
+    if not _maintains_in_python(using):
+        return
+    from tree.maintenance import stamp_subtrees
+    from tree.types import Path
+
+    # The row is gone, so only the path already on the instance is known (the
+    # deletion collector fetches whole rows).
+    for field in _path_fields(sender):
+        path = Path._as_bytes(instance.__dict__.get(field.attname))
+        stamp_subtrees(field, using, [path])
+
+
+def subtract_deleted_rollups(
+    sender: type[Model], instance: Model, using: str, **kwargs: Any
+) -> None:
+    if not _maintains_in_python(using):
+        return
+    from tree.maintenance import PathMaintainer
+
+    # Before the delete, while the row (and so its contributions) can be read.
+    for field in _path_fields(sender):
+        PathMaintainer(field, using).delete_rollups(instance)
+
+
+def tree_rows_deleted(
+    sender: type[Model], instance: Model, using: str, **kwargs: Any
+) -> None:
+    # Whether through `Model.delete()` or a queryset.
+    fields = _path_fields(sender)
+    for field in fields:
+        invalidate_tree_memo(field.model)
+    if not _maintains_in_python(using):
+        return
+    from tree.maintenance import bump_version_on_commit
+
+    # One bump per transaction.
+    if any(field.versioned for field in fields):
+        bump_version_on_commit(sender, using)
+
+
+def connect_tree_signals(sender: type[Model]) -> None:
+    """Connect the save receivers to ``sender`` if it declares a `PathField`.
+
+    Scoped by ``sender`` so that saving any other model dispatches nothing.
+    """
+    if not _path_fields(sender):
+        return
+    pre_save.connect(
+        capture_old_tree_state,
+        sender=sender,
+        dispatch_uid='tree_capture_old_tree_state',
+    )
+    post_save.connect(maintain_paths, sender=sender, dispatch_uid='tree_maintain_paths')
+    # The memo of every tree must drop what a deleted node invalidates, so the
+    # deletion collector fetches the deleted rows instead of fast-deleting them.
+    post_delete.connect(
+        tree_rows_deleted,
+        sender=sender,
+        dispatch_uid='tree_rows_deleted',
+    )
+    if any(field.changed_at_field_name for field in _path_fields(sender)):
+        post_delete.connect(
+            stamp_deleted_subtrees,
+            sender=sender,
+            dispatch_uid='tree_stamp_deleted_subtrees',
+        )
+    if any(field.rollups for field in _path_fields(sender)):
+        pre_delete.connect(
+            subtract_deleted_rollups,
+            sender=sender,
+            dispatch_uid='tree_subtract_deleted_rollups',
+        )
+
+
+@receiver(class_prepared)
+def connect_prepared_model(sender: type[Model], **kwargs: Any) -> None:
+    # Models created after the app registry is ready. Not those of another
+    # registry, like the historical models rendered for each migration state:
+    # the receivers would be kept for every one of them (by id) long after the
+    # class is gone. Those are maintained while migrations run instead (see
+    # `connect_historical_receivers()`).
+    if sender._meta.apps is not apps:
+        return
+    connect_tree_signals(sender)
+
+
+def _for_historical_models(
+    tree_receiver: Callable[..., None],
+) -> Callable[..., None]:
+    def historical_receiver(sender: type[Model], **kwargs: Any) -> None:
+        if sender._meta.apps is not apps and _path_fields(sender):
+            tree_receiver(sender=sender, **kwargs)
+
+    return historical_receiver
+
+
+# Unscoped, so that they reach the historical models of a `RunPython` data
+# migration without keeping any of them alive.
+_HISTORICAL_RECEIVERS = [
+    (signal, _for_historical_models(tree_receiver), f'tree_historical_{name}')
+    for signal, tree_receiver, name in (
+        (pre_save, capture_old_tree_state, 'capture_old_tree_state'),
+        (post_save, maintain_paths, 'maintain_paths'),
+        (post_delete, stamp_deleted_subtrees, 'stamp_deleted_subtrees'),
+        (pre_delete, subtract_deleted_rollups, 'subtract_deleted_rollups'),
+        (post_delete, tree_rows_deleted, 'tree_rows_deleted'),
+    )
+]
+
+
+@receiver(pre_migrate)
+def connect_historical_receivers(**kwargs: Any) -> None:
+    # Only for the duration of `migrate`: the only time historical models are
+    # written to, and the other saves and deletes of the project dispatch
+    # nothing more to django-tree.
+    for signal, historical_receiver, dispatch_uid in _HISTORICAL_RECEIVERS:
+        signal.connect(historical_receiver, dispatch_uid=dispatch_uid)
+
+
+@receiver(post_migrate)
+def disconnect_historical_receivers(**kwargs: Any) -> None:
+    for signal, _, dispatch_uid in _HISTORICAL_RECEIVERS:
+        signal.disconnect(dispatch_uid=dispatch_uid)
+
+
+# The installed models were all prepared before this module got loaded (from
+# `TreeAppConfig.ready()`), so connect them here.
+for _model in apps.get_models():
+    connect_tree_signals(_model)
+
+
 def _register_tree_path_dumper(connection: BaseDatabaseWrapper) -> None:
     """
     Make django-tree's ``Path`` type adaptable on a single DB connection.
@@ -84,6 +262,7 @@ def _register_tree_path_dumper(connection: BaseDatabaseWrapper) -> None:
     if connection.vendor != 'postgresql' or connection.connection is None:
         return
     from psycopg import pq
+
     from tree.types import Path
 
     adapters = connection.connection.adapters
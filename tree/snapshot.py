@@ -0,0 +1,284 @@
+"""A tree structure shared between processes through a memory-mapped file.
+
+`export_tree_snapshot` writes every ``(pk, path)`` of a tree, sorted by path,
+into a compact binary file; `TreeSnapshot` maps it read-only and answers the
+navigation queries by bisecting the mapped buffers, without building a Python
+object per node. Every process mapping the same file shares its physical pages,
+so a prefork pool holds the tree once instead of once per worker.
+
+The file is laid out as::
+
+    header   magic, format, node count n, tree version, blob size
+    offsets  n + 1 uint64: path i is blob[offsets[i]:offsets[i + 1]]
+    pks      n int64, in path order
+    by_pk    n uint64: the path-order positions, sorted by pk
+    blob     the concatenated paths
+
+Every section is 8-byte aligned, so the arrays are cast in place.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Iterator
+from tempfile import NamedTemporaryFile
+from types import TracebackType
+from typing import TYPE_CHECKING, Literal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router
+from django.db.models import Model
+
+from .cache import get_tree_version
+from .query import _get_path_field
+from .sql.helpers import tree_parent_prefix, tree_prefixes, tree_upper
+from .types import Path
+
+if TYPE_CHECKING:
+    # `typing.Self` is Python 3.11+.
+    from typing_extensions import Self
+
+
+MAGIC = b'TREESNAP'
+FORMAT = 1
+_HEADER = struct.Struct('<8sIxxxxQqQ')
+
+
+def export_tree_snapshot(
+    model: type[Model],
+    filename: str,
+    path_field: str | None = None,
+    using: str | None = None,
+) -> int:
+    """Writes the snapshot of ``model``'s tree to ``filename`` and returns the
+    tree version it was taken at.
+
+    The file is written next to ``filename`` and then renamed over it, so a
+    reader never maps a partial file. Integer primary keys only.
+    """
+    field = _get_path_field(model, path_field)
+    using = using or router.db_for_read(model)
+    # Read before the rows: a write in between leaves the snapshot at the older
+    # version, so the next `refresh_tree_snapshot()` rewrites it.
+    version = get_tree_version(model, using) if field.versioned else 0
+    rows = (
+        model._base_manager.using(using)
+        .filter(**{f'{field.attname}__isnull': False})
+        .order_by(field.attname)
+        .values_list('pk', field.attname)
+        .iterator()
+    )
+    offsets = array('Q', [0])
+    pks = array('q')
+    blob = bytearray()
+    for pk, path in rows:
+        if not isinstance(pk, int):
+            raise TypeError('Tree snapshots only support integer primary keys.')
+        blob += Path._as_bytes(path) or b''
+        offsets.append(len(blob))
+        pks.append(pk)
+    by_pk = array('Q', sorted(range(len(pks)), key=pks.__getitem__))
+    blob += b'\0' * (-len(blob) % 8)
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    with NamedTemporaryFile(dir=directory, delete=False) as f:
+        try:
+            f.write(_HEADER.pack(MAGIC, FORMAT, len(pks), version, len(blob)))
+            for section in (offsets, pks, by_pk):
+                f.write(section.tobytes())
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, filename)
+    return version
+
+
+def refresh_tree_snapshot(
+    model: type[Model],
+    filename: str,
+    path_field: str | None = None,
+    using: str | None = None,
+) -> bool:
+    """Rewrites ``filename`` if the tree changed since it was exported (one
+    primary-key lookup otherwise), and returns whether it did."""
+    if not _get_path_field(model, path_field).versioned:
+        raise ImproperlyConfigured(
+            'Refreshing a tree snapshot needs a `PathField(versioned=True)`.'
+        )
+    version = get_tree_version(model, using or router.db_for_read(model))
+    try:
+        with open(filename, 'rb') as f:
+            header = _HEADER.unpack(f.read(_HEADER.size))
+    except (FileNotFoundError, struct.error):
+        pass
+    else:
+        if header[:2] == (MAGIC, FORMAT) and header[3] == version:
+            return False
+    export_tree_snapshot(model, filename, path_field=path_field, using=using)
+    return True
+
+
+class TreeSnapshot:
+    """A read-only, memory-mapped tree snapshot (see `export_tree_snapshot`).
+
+    Nodes are designated by their pk, and the navigation methods return lists
+    of pks, in path order. `reopen()` maps the file again once it has been
+    replaced by a newer export.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._mmap: mmap.mmap | None = None
+        self._inode: tuple[int, int] | None = None
+        self.reopen()
+
+    def reopen(self) -> bool:
+        """Maps the file if it was replaced since it was mapped (or never
+        mapped), and returns whether it did."""
+        with open(self.filename, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if self._mmap is not None and self._inode == (stat.st_dev, stat.st_ino):
+                return False
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, n, version, blob_size = _HEADER.unpack_from(mapped)
+        if (magic, fmt) != (MAGIC, FORMAT):
+            mapped.close()
+            raise ValueError('%r is not a tree snapshot.' % self.filename)
+        self.close()
+        buffer = memoryview(mapped)
+        start = _HEADER.size
+        sections = []
+        formats: tuple[tuple[int, Literal['Q', 'q']], ...] = (
+            (n + 1, 'Q'),
+            (n, 'q'),
+            (n, 'Q'),
+        )
+        for size, fmt_char in formats:
+            sections.append(buffer[start : start + 8 * size].cast(fmt_char))
+            start += 8 * size
+        self._offsets, self._pks, self._by_pk = sections
+        self._blob = buffer[start : start + blob_size]
+        self._buffer = buffer
+        self._mmap = mapped
+        self._inode = (stat.st_dev, stat.st_ino)
+        self.version: int = version
+        return True
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        # The mapping can only be closed once no view exports it any more.
+        for view in (self._offsets, self._pks, self._by_pk, self._blob, self._buffer):
+            view.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self) -> 'Self':
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._pks)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._pks)
+
+    def __contains__(self, pk: int) -> bool:
+        return self._find_pk(pk) is not None
+
+    def _path(self, i: int) -> bytes:
+        return bytes(self._blob[self._offsets[i] : self._offsets[i + 1]])
+
+    def _bisect(self, path: bytes, lo: int = 0, hi: int | None = None) -> int:
+        # `bisect_left` over the mapped paths (it can't take a key that slices
+        # the blob without copying every path).
+        if hi is None:
+            hi = len(self._pks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._path(mid) < path:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find_pk(self, pk: int) -> int | None:
+        by_pk, pks = self._by_pk, self._pks
+        lo, hi = 0, len(by_pk)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if pks[by_pk[mid]] < pk:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(by_pk) and pks[by_pk[lo]] == pk:
+            return by_pk[lo]
+        return None
+
+    def _position(self, pk: int) -> int:
+        i = self._find_pk(pk)
+        if i is None:
+            raise KeyError(pk)
+        return i
+
+    def _children(self, prefix: bytes) -> list[int]:
+        # Jumps past each child's subtree to the next child, as in `TreeCache`.
+        n = len(self._pks)
+        lo = self._bisect(prefix)
+        if lo < n and self._path(lo) == prefix:
+            lo += 1
+        upper = tree_upper(prefix)
+        hi = n if upper is None else self._bisect(upper, lo)
+        children = []
+        while lo < hi:
+            children.append(self._pks[lo])
+            lo = self._bisect(tree_upper(self._path(lo)), lo + 1, hi)  # type: ignore[arg-type]
+        return children
+
+    def get_path(self, pk: int) -> bytes:
+        return self._path(self._position(pk))
+
+    def get_level(self, pk: int) -> int:
+        return self.get_path(pk).count(0)
+
+    def get_roots(self) -> list[int]:
+        return self._children(b'')
+
+    def get_children(self, pk: int) -> list[int]:
+        return self._children(self.get_path(pk))
+
+    def get_siblings(self, pk: int, include_self: bool = False) -> list[int]:
+        siblings = self._children(tree_parent_prefix(self.get_path(pk)))
+        if include_self:
+            return siblings
+        return [sibling for sibling in siblings if sibling != pk]
+
+    def get_descendants(self, pk: int, include_self: bool = False) -> list[int]:
+        i = self._position(pk)
+        end = self._bisect(tree_upper(self._path(i)), i)  # type: ignore[arg-type]
+        return self._pks[i if include_self else i + 1 : end].tolist()
+
+    def get_ancestors(self, pk: int, include_self: bool = False) -> list[int]:
+        """Root first, like `Path.get_ancestors()`."""
+        i = self._position(pk)
+        prefixes = tree_prefixes(self._path(i))
+        if not include_self:
+            prefixes.pop()
+        ancestors = []
+        for prefix in prefixes:
+            j = self._bisect(prefix, 0, i + 1)
+            if j <= i and self._path(j) == prefix:
+                ancestors.append(self._pks[j])
+        return ancestors
@@ -91,3 +91,16 @@ def seg_width(child_count: int) -> int:
     if child_count <= 16387064:
         return 3
     return 4
+
+
+def tree_prefixes(p: bytes | None) -> list[bytes]:
+    """Every level-aligned prefix of ``p``, root first and ``p`` itself last:
+    the paths of its ancestors-or-self (``[]`` for the empty path)."""
+    if not p:
+        return []
+    prefixes: list[bytes] = []
+    end = p.find(DELIMITER)
+    while end != -1:
+        prefixes.append(p[: end + 1])
+        end = p.find(DELIMITER, end + 1)
+    return prefixes
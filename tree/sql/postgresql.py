@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, Any, cast
 
 from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.models import Field, Model
@@ -13,6 +13,7 @@ from .base import (
 
 if TYPE_CHECKING:
     from ..fields import PathField
+    from ..rollups import TreeRollup
 
 
 # Table-independent helper functions backing the `bytea` path encoding. A path is
@@ -364,6 +365,7 @@ CREATE_TRIGGER_QUERIES = (
     """
     CREATE OR REPLACE FUNCTION {rebuild_function}() RETURNS void AS $$
     BEGIN
+        {rebuilding_rollups}
         UPDATE {table} SET {path} = NULL FROM (
             SELECT * FROM {table}
             WHERE {parent} IS NULL
@@ -371,6 +373,8 @@ CREATE_TRIGGER_QUERIES = (
             FOR UPDATE
         ) AS t
         WHERE {table}.{pk} = t.{pk};
+        {rebuild_ancestors}
+        {rebuild_rollups}
     END;
     $$ LANGUAGE plpgsql;
     """,
@@ -389,11 +393,376 @@ CREATE_TRIGGER_QUERIES = (
     """,
 )
 
+# Only for a `versioned` `PathField`: bumps the table's `tree_version` counter
+# (see `tree.models.TreeVersion`) once per writing statement, in the writing
+# transaction, whatever column it touched (a `TreeCache` mirrors other columns
+# too). `pg_trigger_depth() = 0` skips the statements the path trigger itself
+# runs on descendants, and thus also the writes of any other trigger or
+# database-level FK action (see "Writes made by other triggers" in the README).
+# The function is table-independent (it keys the counter by `TG_TABLE_NAME`),
+# so, like the path helpers, it is never dropped.
+VERSION_TRIGGER_QUERIES = (
+    """
+    CREATE OR REPLACE FUNCTION tree_bump_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO tree_version (name, version) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (name) DO UPDATE SET version = tree_version.version + 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER "bump_{path}_version"
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+    ON {table}
+    FOR EACH STATEMENT
+    WHEN (pg_trigger_depth() = 0)
+    EXECUTE FUNCTION tree_bump_version();
+    """,
+)
+
+# Only with `CreateTreeTrigger(..., notify='<channel>')`: notifies the channel
+# with the hex-encoded old and new path of every written row (see `tree.notify`).
+# A cached subtree is stale when its range intersects the written node's, so
+# the node's own path is the whole message; the empty prefix (a NULL path) means
+# the whole tree. `pg_trigger_depth() = 0` skips the descendants the path
+# trigger moves along, as the moved node's old and new paths cover them, and
+# thus also the writes of any other trigger or database-level FK action.
+# PostgreSQL delivers the notifications on commit, once per distinct payload.
+NOTIFY_TRIGGER_QUERIES = (
+    """
+    CREATE OR REPLACE FUNCTION {notify_function}() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM pg_notify({channel}, encode(coalesce(OLD.{path}, ''), 'hex'));
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM pg_notify({channel}, encode(coalesce(NEW.{path}, ''), 'hex'));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER "notify_{path}_after"
+    AFTER INSERT OR UPDATE OR DELETE
+    ON {table}
+    FOR EACH ROW
+    WHEN (pg_trigger_depth() = 0)
+    EXECUTE FUNCTION {notify_function}();
+    """,
+)
+
+# Shared by the subtree stamps and the ancestor arrays. Table-independent and,
+# like the path helpers, never dropped.
+TREE_PREFIXES_FUNCTION = """
+CREATE OR REPLACE FUNCTION tree_prefixes(p bytea) RETURNS bytea[] AS $$
+DECLARE
+    prefixes bytea[] := ARRAY[]::bytea[];
+    i integer;
+BEGIN
+    -- The level-aligned prefixes of p, root first and p included: the
+    -- paths of its ancestors-or-self.
+    IF p IS NULL THEN
+        RETURN prefixes;
+    END IF;
+    FOR i IN 0 .. octet_length(p) - 1 LOOP
+        IF get_byte(p, i) = 0 THEN
+            prefixes := prefixes || substr(p, 1, i + 1);
+        END IF;
+    END LOOP;
+    RETURN prefixes;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+# Only for a `PathField(changed_at_field_name=...)`: stamps that column, on the
+# ancestors-or-self of the old and new path of every written row, with the time
+# of the write -- a cached subtree is stale exactly when its root's stamp moved.
+# A stamp (rather than a counter) stays fresh even after a stale instance saves
+# an older value back, as that very save stamps the row again.
+# `pg_trigger_depth() = 0` skips the descendants the path trigger moves along
+# (the moved node's old and new ancestors cover them) and this trigger's own
+# `UPDATE`, which touches no watched column -- and thus also the writes of any
+# other trigger or database-level FK action.
+CHANGED_AT_TRIGGER_QUERIES = (
+    TREE_PREFIXES_FUNCTION,
+    """
+    CREATE OR REPLACE FUNCTION {changed_at_function}() RETURNS trigger AS $$
+    DECLARE
+        prefixes bytea[] := ARRAY[]::bytea[];
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            prefixes := tree_prefixes(OLD.{path});
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            prefixes := prefixes || tree_prefixes(NEW.{path});
+        END IF;
+        UPDATE {table} SET {changed_at} = clock_timestamp()
+        WHERE {path} = ANY(prefixes);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER "stamp_{path}_subtrees"
+    AFTER INSERT OR UPDATE OR DELETE
+    ON {table}
+    FOR EACH ROW
+    WHEN (pg_trigger_depth() = 0)
+    EXECUTE FUNCTION {changed_at_function}();
+    """,
+)
+
+# Recomputes the `AncestorsField` of the rows matching `%s` (aliased `d`) from
+# their path prefixes, writing only the arrays that changed.
+ANCESTORS_UPDATE = """
+    UPDATE {table} AS t SET {ancestors} = computed.ancestors
+    FROM (
+        SELECT d.{pk}, ARRAY(
+            SELECT a.{pk}::bigint FROM {table} AS a
+            WHERE a.{path} = ANY(tree_prefixes(d.{path})) AND a.{path} <> d.{path}
+            ORDER BY a.{path}
+        ) AS ancestors
+        FROM {table} AS d
+        WHERE %s
+    ) AS computed
+    WHERE t.{pk} = computed.{pk}
+        AND t.{ancestors} IS DISTINCT FROM computed.ancestors;
+"""
+
+# Only for a `PathField(ancestors_field_name=...)`: keeps that array of ancestor
+# pks in sync. A write that moves a row (or gives it a path) recomputes the
+# arrays of its new subtree; the path trigger moves the descendants along at a
+# deeper `pg_trigger_depth()`, which this trigger skips (as it skips the writes
+# of any other trigger or database-level FK action). Watching the array
+# itself also undoes a direct write to it. The rebuild function recomputes the
+# whole table (see `CreateTreeTrigger.get_pre_params`), which also fills the
+# column in when it is added to an existing tree. The GIN index serves the
+# `contains` lookup.
+ANCESTORS_TRIGGER_QUERIES = (
+    TREE_PREFIXES_FUNCTION,
+    """
+    CREATE OR REPLACE FUNCTION {ancestors_function}() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE'
+            AND NEW.{path} IS NOT DISTINCT FROM OLD.{path}
+            AND NEW.{ancestors} IS NOT DISTINCT FROM OLD.{ancestors}
+        THEN
+            RETURN NULL;
+        END IF;
+        """
+    + ANCESTORS_UPDATE % 'd.{path} >= NEW.{path} AND d.{path} < tree_upper(NEW.{path})'
+    + """
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER "ancestors_{path}_after"
+    AFTER INSERT OR UPDATE OF {path}, {parent}, {ancestors}
+    ON {table}
+    FOR EACH ROW
+    WHEN (pg_trigger_depth() = 0)
+    EXECUTE FUNCTION {ancestors_function}();
+    """,
+    'CREATE INDEX {ancestors_index} ON {table} USING gin ({ancestors});',
+)
+
+
+def _rollup_contribution(
+    rollup: 'TreeRollup', model: type[Model], row: str, connection: Any
+) -> str:
+    # The SQL twin of `TreeRollup.contribution()` for ``row``: `NEW`/`OLD` in
+    # the trigger, the (unaliased) table itself in the rebuild. The filter is
+    # compiled by the ORM, with its parameters inlined since the function body
+    # is static, and evaluated against the row as if it were the table.
+    table = quote_ident(model._meta.db_table)
+    if rollup.source is None:
+        value = '1'
+    else:
+        source = cast(Field, model._meta.get_field(rollup.source))
+        value = 'coalesce(%s.%s, 0)' % (row, quote_ident(source.attname))
+    if rollup.filter is None:
+        return value
+    query = model._base_manager.filter(rollup.filter).query
+    where, params = query.get_compiler(connection=connection).compile(query.where)
+    if len(query.alias_map) > 1:
+        raise ValueError(
+            'A `TreeRollup` filter can only reference the columns of its model.'
+        )
+    where = connection.ops.compose_sql(where, params)
+    if row != table:
+        where = 'EXISTS (SELECT FROM (SELECT %s.*) AS %s WHERE %s)' % (
+            row,
+            table,
+            where,
+        )
+    return 'CASE WHEN %s THEN %s ELSE 0 END' % (where, value)
+
+
+def get_rollups_function_creation(
+    model: type[Model], path_field_lookup: str, connection: Any
+) -> str:
+    """The trigger function maintaining the `TreeRollup`s of a `PathField`, and
+    the function recomputing them all.
+
+    A write adds the difference it makes to every rollup along the ancestor
+    prefixes of the written row: its contribution on insert, minus it on
+    delete, the change of contribution on update and, on a move, its whole
+    subtree total (its own rollup) off the old ancestors and onto the new ones.
+    The row's own rollup is set from its ``OLD`` value, so a stale instance
+    saving an outdated total doesn't stick. Deletes are counted at any
+    `pg_trigger_depth()`, so the rows an ``ON DELETE CASCADE`` removes are
+    subtracted too.
+    """
+    meta = model._meta
+    path_field = cast('PathField', meta.get_field(path_field_lookup))
+    rollups = path_field.rollups
+    table = quote_ident(meta.db_table)
+    pk = quote_ident(cast(Field, meta.pk).attname)
+    path = quote_ident(path_field.attname)
+    function = quote_ident(f'rollup_{meta.db_table}_{path_field.attname}')
+    rebuild_function = quote_ident(
+        f'rebuild_{meta.db_table}_{path_field.attname}_rollups'
+    )
+    # Set while the rollups are recomputed, so that the trigger lets the new
+    # totals through.
+    rebuilding = "'tree.rebuilding_rollups'"
+    table_name = "'%s'" % meta.db_table.replace("'", "''")
+
+    columns = [quote_ident(rollup.get_field(model).attname) for rollup in rollups]
+    declarations = []
+    old_values = []
+    new_values = []
+    totals = []
+    for i, (rollup, column) in enumerate(zip(rollups, columns)):
+        db_type = rollup.get_field(model).db_type(connection)
+        declarations.append(
+            f'old_{i} {db_type} := 0; new_{i} {db_type} := 0; total_{i} {db_type};'
+        )
+        old = _rollup_contribution(rollup, model, 'OLD', connection)
+        new = _rollup_contribution(rollup, model, 'NEW', connection)
+        old_values.append(f'old_{i} := {old};')
+        new_values.append(f'new_{i} := {new};')
+        totals.append(
+            f"total_{i} := CASE WHEN TG_OP = 'INSERT' THEN new_{i} "
+            f'ELSE coalesce(OLD.{column}, 0) - old_{i} + new_{i} END;'
+        )
+
+    def assign(template: str) -> str:
+        return ', '.join(
+            template.format(column=column, i=i) for i, column in enumerate(columns)
+        )
+
+    # The written row takes its total, its ancestors the difference.
+    self_or = (
+        f'{{column}} = CASE WHEN {pk} = NEW.{pk} THEN total_{{i}} '
+        'ELSE coalesce({column}, 0) + '
+    )
+    changed = ' OR '.join(
+        f'new_{i} <> old_{i} OR NEW.{column} IS DISTINCT FROM total_{i}'
+        for i, column in enumerate(columns)
+    )
+    sums = ', '.join(
+        f'sum({_rollup_contribution(rollup, model, table, connection)}) AS {column}'
+        for rollup, column in zip(rollups, columns)
+    )
+    differ = ' OR '.join(
+        f't.{column} IS DISTINCT FROM computed.{column}' for column in columns
+    )
+    indent = '\n            '
+    return f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        DECLARE
+            {indent.join(declarations)}
+        BEGIN
+            IF current_setting({rebuilding}, true) = {table_name} THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP <> 'INSERT' THEN
+                {indent.join(old_values)}
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                UPDATE {table} SET {
+        assign('{column} = coalesce({column}, 0) - old_{i}')
+    }
+                WHERE {path} = ANY(tree_prefixes(OLD.{path})) AND {pk} <> OLD.{pk};
+                RETURN NULL;
+            END IF;
+            {indent.join(new_values)}
+            {indent.join(totals)}
+            IF TG_OP = 'UPDATE' AND NEW.{path} IS DISTINCT FROM OLD.{path} THEN
+                UPDATE {table}
+                SET {
+        assign('{column} = coalesce({column}, 0) - coalesce(OLD.{column}, 0)')
+    }
+                WHERE {path} = ANY(tree_prefixes(OLD.{path})) AND {pk} <> NEW.{pk};
+                UPDATE {table} SET {assign(self_or + 'total_{i} END')}
+                WHERE {path} = ANY(tree_prefixes(NEW.{path}));
+            ELSIF {changed} THEN
+                UPDATE {table} SET {assign(self_or + 'new_{i} - old_{i} END')}
+                WHERE {path} = ANY(tree_prefixes(NEW.{path}));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION {rebuild_function}() RETURNS void AS $$
+        BEGIN
+            PERFORM set_config({rebuilding}, {table_name}, true);
+            UPDATE {table} AS t SET {assign('{column} = computed.{column}')}
+            FROM (
+                SELECT prefix, {sums}
+                FROM {table}, unnest(tree_prefixes({table}.{path})) AS prefix
+                GROUP BY prefix
+            ) AS computed
+            WHERE t.{path} = computed.prefix AND ({differ});
+            PERFORM set_config({rebuilding}, '', true);
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+
+
+# Only for a `PathField(rollups=[...])`, after the functions created by
+# `get_rollups_function_creation`. Path moves only fire the trigger at depth 0:
+# the descendants the path trigger moves along keep their rollups.
+ROLLUP_TRIGGER_QUERIES = (
+    TREE_PREFIXES_FUNCTION,
+    """
+    CREATE TRIGGER "rollup_{path}_after"
+    AFTER INSERT OR DELETE
+    ON {table}
+    FOR EACH ROW
+    EXECUTE FUNCTION {rollups_function}();
+    """,
+    """
+    CREATE TRIGGER "rollup_{path}_update"
+    AFTER UPDATE
+    ON {table}
+    FOR EACH ROW
+    WHEN (pg_trigger_depth() = 0)
+    EXECUTE FUNCTION {rollups_function}();
+    """,
+)
+
 DROP_TRIGGER_QUERIES = (
     # Dropped here for symmetry with its creation above (see the deferred-constraint
     # rationale in `CREATE_TRIGGER_QUERIES`).
     'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint};'
     'DROP TRIGGER IF EXISTS "update_{path}_before" ON {table};',
+    'DROP TRIGGER IF EXISTS "bump_{path}_version" ON {table};',
+    'DROP TRIGGER IF EXISTS "notify_{path}_after" ON {table};',
+    'DROP FUNCTION IF EXISTS {notify_function}();',
+    'DROP TRIGGER IF EXISTS "stamp_{path}_subtrees" ON {table};',
+    'DROP FUNCTION IF EXISTS {changed_at_function}();',
+    'DROP TRIGGER IF EXISTS "ancestors_{path}_after" ON {table};',
+    'DROP FUNCTION IF EXISTS {ancestors_function}();',
+    'DROP INDEX IF EXISTS {ancestors_index};',
+    'DROP TRIGGER IF EXISTS "rollup_{path}_after" ON {table};',
+    'DROP TRIGGER IF EXISTS "rollup_{path}_update" ON {table};',
+    'DROP FUNCTION IF EXISTS {rollups_function}();',
+    'DROP FUNCTION IF EXISTS {rollups_rebuild_function}();',
     'DROP FUNCTION IF EXISTS {function}();',
 )
 
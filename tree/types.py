@@ -1,14 +1,15 @@
 from importlib.util import find_spec
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 from collections.abc import Iterator
 
 from django.db.models import Model, QuerySet
-from django.utils.functional import cached_property
+
+from .memo import memoized
 
 # The level delimiter separating path segments (see `tree.sql.postgresql`). Kept
 # in `tree.sql.helpers` so the pure-Python path helpers and this wrapper agree.
-from .sql.helpers import DELIMITER
+from .sql.helpers import DELIMITER, tree_prefixes
 
 if TYPE_CHECKING:
     from psycopg import pq
@@ -17,36 +18,51 @@ if TYPE_CHECKING:
 
 
 class Path:
+    # `from_db_value` builds a `Path` for every fetched row, so it is kept small:
+    # slots instead of a per-instance `__dict__`, and whatever derives from the
+    # field (`attname`, `field_bound`, `qs`) is read from it on demand instead of
+    # being cached on each instance. Only the split segments, which the level
+    # checks reuse, are cached in a slot on first use.
+    __slots__ = ('_prefetched_tree', '_split_segments', '_tree_info', 'field', 'value')
+
     def __init__(self, field: 'PathField', value: bytes | None) -> None:
-        # Kept minimal: `from_db_value` builds a `Path` for every fetched row, so
-        # anything derivable from the field (`attname`, `field_bound`, `qs`) is
-        # computed lazily below instead of on this per-row hot path.
         self.field = field
         self.value = value
-
-    @cached_property
+        # The rows `QuerySet.prefetch_tree()` / `with_ancestors()` fetched for
+        # this path, by navigation method (`children`, `descendants`,
+        # `ancestors`); `None` when not prefetched.
+        self._prefetched_tree: dict[str, list[Model]] | None = None
+        # `children_count`, `is_leaf` and `level`, read from the annotations of
+        # `QuerySet.annotate_tree_info()` when the row comes from it; `None`
+        # otherwise.
+        self._tree_info: dict[str, Any] | None = None
+        self._split_segments: list[bytes] | None = None
+
+    @property
     def attname(self) -> str | None:
         return getattr(self.field, 'attname', None)
 
-    @cached_property
+    @property
     def field_bound(self) -> bool:
         return self.attname is not None
 
-    @cached_property
+    @property
     def qs(self) -> QuerySet:
-        # Cloning a queryset here would otherwise cost one clone per loaded row,
-        # even when the path is only read (never used to navigate the tree).
+        # Only built when navigating the tree (which queries anyway), never on
+        # the per-row hot path.
         if self.field_bound:
             return self.field.model._default_manager.all()
         return QuerySet()
 
-    @cached_property
+    @property
     def _segments(self) -> list[bytes]:
         # The per-level segments, without their `0x00` terminators. A stored path
         # always ends with a delimiter, so the trailing empty split is dropped.
-        if not self.value:
-            return []
-        return self.value.split(DELIMITER)[:-1]
+        if self._split_segments is None:
+            self._split_segments = (
+                self.value.split(DELIMITER)[:-1] if self.value else []
+            )
+        return self._split_segments
 
     def __repr__(self) -> str:
         if self.field_bound:
@@ -109,31 +125,33 @@ class Path:
     def __iter__(self) -> Iterator[bytes]:
         return iter(self._segments)
 
+    @memoized
     def get_children(self) -> QuerySet:
         if not self.value:
             return self.qs.none()
-        return self.qs.filter(
+        qs = self.qs.filter(
             **{
                 f'{self.attname}__child_of': self.value,
             }
         )
+        return self._serve_prefetched(qs, 'children')
 
+    @memoized
     def get_ancestors(self, include_self: bool = False) -> QuerySet:
         if not self.value or (self.is_root() and not include_self):
             return self.qs.none()
         # A path with a value always comes from a field-bound `Path`.
         assert self.attname is not None
-        segments = self._segments
+        # The ancestors’ paths are the prefixes of ours ending on a `0x00`
+        # delimiter, matched by equality (the same thing `ancestor_of` does
+        # with a constant path).
+        paths = tree_prefixes(self.value)
         if not include_self:
-            segments = segments[:-1]
-        # Using the lookup `ancestor_of` here is slower, so we explicitly specify
-        # the ancestors’ paths (each prefix ending on a `0x00` delimiter).
-        paths = [
-            DELIMITER.join(segments[:i]) + DELIMITER
-            for i in range(1, len(segments) + 1)
-        ]
-        return self.qs.filter(**{self.attname + '__in': paths})
+            paths = paths[:-1]
+        qs = self.qs.filter(**{self.attname + '__in': paths})
+        return self._serve_prefetched(qs, 'ancestors', include_self=include_self)
 
+    @memoized
     def get_descendants(self, include_self: bool = False) -> QuerySet:
         if not self.value:
             return self.qs.none()
@@ -141,8 +159,45 @@ class Path:
         # btree index backing the path instead of a dedicated slice index. The
         # strict variant excludes self via `> P` alone.
         lookup = 'descendant_of' if include_self else 'strict_descendant_of'
-        return self.qs.filter(**{f'{self.attname}__{lookup}': self.value})
+        qs = self.qs.filter(**{f'{self.attname}__{lookup}': self.value})
+        return self._serve_prefetched(qs, 'descendants', include_self=include_self)
+
+    def _serve_prefetched(
+        self, qs: QuerySet, key: str, include_self: bool = True
+    ) -> QuerySet:
+        # Hands the prefetched rows over as the queryset's result cache, as
+        # Django's `prefetch_related` does: iterating it costs no query, while
+        # chaining (`filter`, `order_by`, ...) still queries the database.
+        prefetched = self._prefetched_tree
+        if prefetched is None or key not in prefetched:
+            return qs
+        qs._result_cache = self._prefetched_rows(key, include_self)
+        qs._prefetch_done = True  # type: ignore[attr-defined]
+        return qs
+
+    def _prefetched_rows(self, key: str, include_self: bool) -> list[Model]:
+        assert self._prefetched_tree is not None and self.attname is not None
+        rows = self._prefetched_tree[key]
+        if include_self:
+            return rows
+        return [row for row in rows if getattr(row, self.attname) != self]
 
+    def get_prefetched_descendants(self, include_self: bool = False) -> list[Model]:
+        # The descendants loaded by `prefetch_tree(descendants=True)`, down to
+        # its `max_depth`. Unlike `get_descendants()`, whose queryset always
+        # means the whole subtree, a depth-limited prefetch is only served here.
+        if not self.value:
+            return []
+        if not self._prefetched_tree or (
+            'prefetched_descendants' not in self._prefetched_tree
+        ):
+            raise ValueError(
+                'No descendants were prefetched, use '
+                '`QuerySet.prefetch_tree(descendants=True)`.'
+            )
+        return self._prefetched_rows('prefetched_descendants', include_self)
+
+    @memoized
     def get_siblings(
         self, include_self: bool = False, queryset: QuerySet | None = None
     ) -> QuerySet:
@@ -160,6 +215,7 @@ class Path:
             return qs
         return qs.exclude(**{self.attname: self.value})
 
+    @memoized
     def get_prev_siblings(
         self, include_self: bool = False, queryset: QuerySet | None = None
     ) -> QuerySet:
@@ -172,6 +228,7 @@ class Path:
             '-' + self.attname
         )
 
+    @memoized
     def get_next_siblings(
         self, include_self: bool = False, queryset: QuerySet | None = None
     ) -> QuerySet:
@@ -184,6 +241,7 @@ class Path:
             self.attname
         )
 
+    @memoized
     def get_prev_sibling(self, queryset: QuerySet | None = None) -> Model | None:
         if not self.value:
             return None
@@ -203,6 +261,7 @@ class Path:
             .first()
         )
 
+    @memoized
     def get_next_sibling(self, queryset: QuerySet | None = None) -> Model | None:
         if not self.value:
             return None
@@ -221,6 +280,8 @@ class Path:
 
     def get_level(self) -> int | None:
         if self.value:
+            if self._tree_info is not None:
+                return self._tree_info['level']
             return len(self._segments)
         return None
 
@@ -229,8 +290,11 @@ class Path:
             return len(self._segments) == 1
         return None
 
+    @memoized
     def is_leaf(self) -> bool | None:
         if self.value:
+            if self._tree_info is not None:
+                return self._tree_info['is_leaf']
             return not self.get_children().exists()
         return None
 
@@ -335,3 +399,21 @@ class Path:
         import sqlite3
 
         sqlite3.register_adapter(Path, lambda path: path.value)
+
+
+class TreeNode:
+    """A node of the nested structure built by ``QuerySet.as_tree()``.
+
+    ``item`` is the model instance (or the ``values()`` dict), ``path`` its raw
+    path and ``children`` its child nodes, in path order.
+    """
+
+    __slots__ = ('children', 'item', 'path')
+
+    def __init__(self, item: 'Model | dict', path: bytes) -> None:
+        self.item = item
+        self.path = path
+        self.children: list[TreeNode] = []
+
+    def __repr__(self) -> str:
+        return f'<TreeNode {self.item!r} ({len(self.children)} children)>'